@@ -0,0 +1,68 @@
+'''
+    Compare the pandas and polars engines of Dataset on the same cut-heavy workload.
+
+    Usage:
+        python benchmarks/bench_engines.py [n_entries]
+'''
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from torchic import Dataset, AxisSpec
+
+CUTS = [
+    'fPt > 0.5 and abs(fEta) < 0.8',
+    'abs(fNSigmaTPC) < 3',
+    'fItsClusterSize > 2 and fItsClusterSize < 12',
+]
+SUBSETS = {
+    'positive': 'fCharge > 0',
+    'negative': 'fCharge < 0',
+    'central': 'abs(fEta) < 0.5',
+}
+
+def make_data(n_entries: int) -> pd.DataFrame:
+    rng = np.random.default_rng(1234)
+    return pd.DataFrame({
+        'fPt': rng.exponential(1.5, n_entries).astype(np.float32),
+        'fEta': rng.uniform(-1., 1., n_entries).astype(np.float32),
+        'fNSigmaTPC': rng.normal(0., 2., n_entries).astype(np.float32),
+        'fItsClusterSize': rng.integers(0, 15, n_entries).astype(np.uint8),
+        'fCharge': rng.choice([-1, 1], n_entries).astype(np.int8),
+    })
+
+def workload(dataset: Dataset) -> list:
+    for cut in CUTS:
+        dataset.query(cut, inplace=True)
+    dataset['fP'] = dataset.eval('fPt * cosh(fEta)')
+    hists = []
+    for name, condition in SUBSETS.items():
+        dataset.add_subset(name, dataset.eval(condition))
+        hists.append(dataset.build_boost2d('fP', 'fNSigmaTPC', AxisSpec(100, 0, 10, f'h_{name}', ''),
+                                           AxisSpec(100, -5, 5, f'h_{name}', ''), subset=name))
+    return hists
+
+def main():
+    n_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    data = make_data(n_entries)
+    print(f'Workload: {len(CUTS)} cuts, 1 derived column, {len(SUBSETS)} subsets + 2D histograms on {n_entries} entries')
+
+    results = {}
+    for engine in ['pandas', 'polars']:
+        timings = []
+        for _ in range(3):
+            dataset = Dataset(data.copy(), engine=engine)
+            start = time.perf_counter()
+            hists = workload(dataset)
+            timings.append(time.perf_counter() - start)
+        results[engine] = hists
+        print(f'{engine:>8}: best {min(timings):.3f} s, mean {np.mean(timings):.3f} s')
+
+    for hist_pandas, hist_polars in zip(results['pandas'], results['polars']):
+        assert np.array_equal(hist_pandas.view(flow=True), hist_polars.view(flow=True)), 'Engines disagree!'
+    print('Histograms identical for both engines.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''
+    Compare the column-only subset access of Dataset with selecting the full subset frame first.
+
+    Usage:
+        python benchmarks/bench_subsets.py [n_entries] [n_columns]
+'''
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from torchic import Dataset, AxisSpec
+
+def make_data(n_entries: int, n_columns: int) -> pd.DataFrame:
+    rng = np.random.default_rng(1234)
+    data = pd.DataFrame(rng.random((n_entries, n_columns), dtype=np.float32),
+                        columns=[f'fVar{icolumn}' for icolumn in range(n_columns)])
+    data['fPt'] = rng.exponential(1.5, n_entries).astype(np.float32)
+    data['fEta'] = rng.uniform(-1., 1., n_entries).astype(np.float32)
+    return data
+
+def best_of(func, n_repeat: int = 5) -> float:
+    timings = []
+    for _ in range(n_repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    n_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_columns = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+    dataset = Dataset(make_data(n_entries, n_columns))
+    dataset.add_subset('central', 'abs(fEta) < 0.5')
+    mask = dataset.subsets.mask('central')
+    print(f'Subset access on {n_entries} entries, {n_columns + 2} columns ({mask.sum()} selected)')
+
+    full_frame = best_of(lambda: dataset.data.loc[mask]['fPt'])
+    column_only = best_of(lambda: dataset['central:fPt'])
+    print(f'  subset:column, full frame  : {full_frame*1e3:8.2f} ms')
+    print(f'  subset:column, column only : {column_only*1e3:8.2f} ms  (x{full_frame/column_only:.1f})')
+
+    axis_spec_x = AxisSpec(100, 0, 10, 'hPt', '')
+    axis_spec_y = AxisSpec(100, -1, 1, 'hEta', '')
+    full_frame = best_of(lambda: dataset.data.loc[mask][['fPt', 'fEta']])
+    column_only = best_of(lambda: dataset.build_boost2d('fPt', 'fEta', axis_spec_x, axis_spec_y, subset='central'))
+    print(f'  2D subset, full frame copy : {full_frame*1e3:8.2f} ms (selection only)')
+    print(f'  build_boost2d on subset    : {column_only*1e3:8.2f} ms (selection and fill)')
+
+if __name__ == '__main__':
+    main()
@@ -30,6 +30,7 @@ setup(
         # List your package dependencies here
         'numpy<2.0',
         'pandas',
+        'scipy',
         'scikit-learn',
         'pyYAML',
         'uproot',
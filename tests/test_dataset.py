@@ -1,7 +1,17 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
+import numpy as np
+import boost_histogram as bh
 import pandas as pd
-from torchic.core.histogram import AxisSpec
-from torchic.core.dataset import Dataset
+import uproot
+from torchic.core import histogram
+from torchic.core.histogram import AxisSpec, HistSpec, as_array
+from torchic.core.dataset import Dataset, _compile_expression, _eval_frame
+from torchic.core.cache import DataFrameCache
+from torchic.core.subset_mask import SubsetMask
+from torchic.core.cut_flow import CutFlow
 
 class TestDataset(unittest.TestCase):
 
@@ -19,6 +29,74 @@ class TestDataset(unittest.TestCase):
         self.dataset.add_subset('subset', self.data['column_x'] > 2)
         self.assertEqual(len(self.dataset.subsets['subset']), 3)
 
+    def test_subset_masks(self):
+        self.dataset.add_subset('subset', self.data['column_x'] > 2)
+        self.dataset.add_subset('expr', 'column_y > 1')
+        self.assertEqual(self.dataset['subset:column_y'].tolist(), [3, 2, 1])
+        self.assertIs(self.dataset.subsets.bits('subset'), self.dataset.subsets.bits('subset'))
+        self.assertEqual(list(self.dataset.subsets.get('expr', ['column_x']).columns), ['column_x'])
+
+        self.dataset.query('column_x < 5', inplace=True)
+        self.assertEqual(self.dataset['subset:column_x'].tolist(), [3, 4])
+        self.assertEqual(self.dataset['expr:column_x'].tolist(), [1, 2, 3, 4])
+        self.dataset['column_y'] = self.dataset['column_y'] + 10
+        self.assertEqual(self.dataset['subset:column_y'].tolist(), [13, 12])
+
+    def test_subset_packed_storage(self):
+        condition = np.array([True, False, True, True, False])
+        self.dataset.add_subset('array', condition)
+        self.dataset.add_subset('series', self.data['column_y'] < 4)
+        self.dataset.add_subset('expr', 'column_y > 1')
+        # array conditions are kept packed only, string conditions as the expression
+        self.assertIsInstance(self.dataset.subsets._subsets['array'], SubsetMask)
+        self.assertIsInstance(self.dataset.subsets._subsets['series'], SubsetMask)
+        self.assertEqual(self.dataset.subsets._subsets['expr'], 'column_y > 1')
+        condition[:] = False
+        self.assertEqual(self.dataset['array:column_x'].tolist(), [1, 3, 4])
+
+        self.dataset.query('column_x > 1')
+        self.assertEqual(self.dataset['array:column_x'].tolist(), [3, 4])
+        self.dataset.drop(index=[3])
+        self.assertEqual(self.dataset['array:column_x'].tolist(), [3])
+        self.assertEqual(self.dataset['series:column_x'].tolist(), [3, 5])
+        self.assertEqual(self.dataset['expr:column_x'].tolist(), [2, 3])
+
+    def test_subset_combine(self):
+        self.dataset.add_subset('high_x', 'column_x > 2')
+        self.dataset.add_subset('high_y', self.data['column_y'] > 1)
+        self.dataset.subsets.combine('only_x', 'high_x & ~high_y')
+        self.dataset.subsets.combine('any', 'high_x | high_y')
+        self.assertEqual(self.dataset['only_x:column_x'].tolist(), [5])
+        self.assertEqual(self.dataset.subsets.counts().to_dict(), {'high_x': 3, 'high_y': 4, 'only_x': 1, 'any': 5})
+        self.assertEqual(self.dataset.subsets.bits('high_x').nbytes, 1)
+
+        mask = np.random.default_rng(3).random(1001) > 0.5
+        bits = SubsetMask.from_bool(mask)
+        self.assertEqual(bits.count(), mask.sum())
+        self.assertTrue(np.array_equal((~bits).to_bool(), ~mask))
+        self.assertEqual((~bits).count(), len(mask) - mask.sum())
+
+    def test_subset_column_access(self):
+        self.dataset.add_subset('subset', self.data['column_x'] > 2)
+        self.assertIsInstance(self.dataset['subset:column_x'], pd.Series)
+        self.assertEqual(list(self.dataset['subset:'].columns), ['column_x', 'column_y'])
+        hist = self.dataset.build_boost2d('column_x', 'column_y', AxisSpec(5, 0.5, 5.5, 'x', ''), AxisSpec(5, 0.5, 5.5, 'y', ''), subset='subset')
+        self.assertEqual(hist.sum(), 3)
+
+    def test_cut_flow(self):
+        self.dataset.add_subset('subset', 'column_y > 1')
+        cut_flow = self.dataset.cut_flow({'x': 'column_x > 1', 'y': 'column_y > 2', 'xy': 'column_x + column_y > 5'})
+        self.assertEqual(cut_flow.counts, [5, 4, 2, 2])
+        self.assertEqual(self.dataset['subset:column_x'].tolist(), [2, 3])
+        table = cut_flow.table()
+        self.assertEqual(table.loc['y', 'absolute_efficiency'], 0.4)
+        self.assertEqual(table.loc['y', 'relative_efficiency'], 0.5)
+        hist = cut_flow.to_th1('cut_flow')
+        self.assertEqual([hist.GetBinContent(ibin) for ibin in range(1, 5)], [5, 4, 2, 2])
+
+        selected = CutFlow(['column_x > 1', 'column_y > 2']).apply(Dataset(self.data), inplace=False)
+        self.assertEqual(selected.data['column_x'].tolist(), [2, 3])
+
     def test_build_hist(self):
         axis_spec_x = AxisSpec(1, 5, 5, 'column_x', ';column_x;')
         hist = self.dataset.build_hist('column_x', axis_spec_x)
@@ -36,9 +114,464 @@ class TestDataset(unittest.TestCase):
         hist = self.dataset.build_hist('column_x', axis_spec_x, subset='subset')
         self.assertEqual(hist.GetEntries(), 3)
     
+    def test_dtype_policy(self):
+        data = pd.DataFrame({
+            'fPartID': np.array([0, 1, 2, 255], dtype=np.int64),
+            'fFlags': np.array([-1, 0, 1, 2], dtype=np.int64),
+            'fNSigmaTPC': np.array([0.5, -1.25, 3., np.nan], dtype=np.float64),
+            'fPt': np.array([0.1, 0.2, 0.3, 0.4], dtype=np.float64),
+        })
+        dataset = Dataset(data.copy(), dtypes='auto')
+        self.assertEqual(dataset['fPartID'].dtype, np.uint8)
+        self.assertEqual(dataset['fFlags'].dtype, np.int8)
+        self.assertEqual(dataset['fNSigmaTPC'].dtype, np.float32)
+        self.assertEqual(dataset['fPt'].dtype, np.float64)
+        self.assertTrue(np.array_equal(dataset['fNSigmaTPC'].to_numpy(np.float64), data['fNSigmaTPC'].to_numpy(), equal_nan=True))
+        report = dataset.dtype_report
+        self.assertEqual(report.loc['fPartID', 'bytes_before'], 32)
+        self.assertEqual(report.loc['fPartID', 'bytes_after'], 4)
+
+        dataset = Dataset(data.copy(), dtypes={'fPt': 'float32'})
+        self.assertEqual(dataset['fPt'].dtype, np.float32)
+        self.assertEqual(dataset['fPartID'].dtype, np.int64)
+
+    def test_storage(self):
+        data = pd.DataFrame({'fPt': np.linspace(0., 1., 10), 'fNCls': np.arange(10, dtype=np.uint8),
+                             'fName': list('abcdefghij')}, index=np.arange(10, 20))
+        dataset = Dataset(data, storage='arrow')
+        self.assertTrue(all(isinstance(dtype, pd.ArrowDtype) for dtype in dataset.data.dtypes))
+        self.assertEqual(dataset.data.index.tolist(), data.index.tolist())
+        # numeric columns are wrapped, not copied
+        self.assertTrue(np.shares_memory(as_array(dataset['fPt']), data['fPt'].to_numpy()))
+
+        converted = Dataset(dataset.data, storage='numpy')
+        self.assertEqual(converted['fNCls'].dtype, np.uint8)
+        self.assertEqual(converted['fName'].tolist(), data['fName'].tolist())
+        self.assertTrue(np.shares_memory(converted['fPt'].to_numpy(), data['fPt'].to_numpy()))
+        self.assertIs(Dataset(data, storage='numpy').data, data)
+
     def test_query(self):
         self.dataset.query('column_x > 2')
         self.assertEqual(len(self.dataset.data), 3)
 
+class TestExpressionCompiler(unittest.TestCase):
+
+    EXPRESSIONS = [
+        'fPt > 0.5 and abs(fEta) < 0.8',
+        '0.2 < fPt < 3 or not fCharge > 0',
+        'sqrt(fPt**2 + `f Mass`**2) / fPt',
+        'fPt * cosh(fEta) > 1.5',
+        'fNCls + 2 * fCharge',
+        'log(fPt) < 0',
+    ]
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.data = pd.DataFrame({
+            'fPt': rng.exponential(1., 1000).astype(np.float32),
+            'fEta': rng.uniform(-1., 1., 1000),
+            'fCharge': rng.choice([-1, 1], 1000).astype(np.int8),
+            'fNCls': rng.integers(0, 8, 1000).astype(np.uint8),
+            'f Mass': rng.uniform(0., 1., 1000),
+        })
+
+    def test_matches_pandas(self):
+        for expr in self.EXPRESSIONS:
+            compiled = _compile_expression(expr)
+            self.assertIsNotNone(compiled, expr)
+            expected = self.data.eval(expr)
+            np.testing.assert_allclose(compiled.evaluate(self.data), expected.to_numpy(), rtol=1e-6, err_msg=expr)
+            kernel_result = compiled._evaluate_numexpr([as_array(self.data[column]) for column in compiled.columns])
+            np.testing.assert_allclose(kernel_result, expected.to_numpy(), rtol=1e-6, err_msg=expr)
+        self.assertIs(_compile_expression(self.EXPRESSIONS[0]), _compile_expression(self.EXPRESSIONS[0]))
+
+        dataset = Dataset(self.data.copy())
+        dataset.query('fPt > 0.5 and abs(fEta) < 0.8')
+        self.assertTrue(dataset.data.equals(self.data.query('fPt > 0.5 and abs(fEta) < 0.8')))
+        self.assertEqual(dataset.eval('fPt * 2').dtype, np.float32)
+
+    def test_bitwise_precedence(self):
+        # & and | bind looser than the comparisons, as in pandas
+        for expr in ['fPt > 0.5 & fEta > 0.2', 'fPt < 0.5 | fEta > 0.2 & fNCls > 3', 'fNCls > 1 & fCharge > 0']:
+            expected = self.data.eval(expr).to_numpy()
+            np.testing.assert_array_equal(_compile_expression(expr).evaluate(self.data), expected, err_msg=expr)
+            dataset = Dataset(self.data.copy())
+            dataset.query(expr)
+            self.assertTrue(dataset.data.equals(self.data.query(expr)), expr)
+        dataset = Dataset(self.data.copy())
+        dataset.add_subset('selected', 'fPt > 0.5 & fEta > 0.2')
+        self.assertEqual(len(dataset.subsets['selected']), len(self.data.query('fPt > 0.5 & fEta > 0.2')))
+        cut_flow = CutFlow(['fPt > 0.5 & fEta > 0.2'])
+        self.assertEqual(cut_flow.evaluate(dataset).sum(), len(self.data.query('fPt > 0.5 & fEta > 0.2')))
+
+    def test_narrow_integers(self):
+        # pandas evaluates the narrow integer columns with numexpr, which does not wrap around
+        data = pd.DataFrame({
+            'n': np.array([0, 3, 200], dtype=np.uint8),
+            'i': np.array([-3, 5, -128], dtype=np.int8),
+            'c': np.array([100, -300, 32000], dtype=np.int16),
+            'f': np.array([1.5, 2., 3.], dtype=np.float32),
+        })
+        for expr in ['n * 100', 'n + 100 > 250', '-n', 'abs(i)', 'c * 1000', 'i * i', 'n + n', 'f * n', 'c % 7',
+                     'sqrt(n) > 2', 'i > 0 & n < 100']:
+            expected = data.eval(expr)
+            result = _eval_frame(data, expr)
+            np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy(), err_msg=expr)
+            self.assertEqual(result.dtype.kind, expected.dtype.kind, expr)
+            if expected.dtype == bool:
+                self.assertTrue(Dataset(data.copy()).query(expr, inplace=False).data.equals(data.query(expr)), expr)
+        self.assertEqual(_eval_frame(data, 'n * 100').dtype, np.int64)
+        self.assertEqual(_eval_frame(data, 'c * 1000').dtype, np.int64)
+        self.assertEqual(_eval_frame(data, 'abs(i)').dtype, np.float64)
+
+        # operators rejected by pandas are not compiled
+        self.assertIsNone(_compile_expression('n // 2'))
+        self.assertRaises(TypeError, _eval_frame, data, 'n // 2')
+
+        with mock.patch('torchic.core.dataset.ne', None):
+            np.testing.assert_array_equal(_eval_frame(data, 'n * 100').to_numpy(), data.eval('n * 100').to_numpy())
+
+        cluster_size = pd.DataFrame({'fItsClusterSize': [100, 160, 200, 50]})
+        dataset = Dataset(cluster_size.copy(), dtypes='auto')
+        self.assertEqual(dataset.data['fItsClusterSize'].dtype, np.uint8)
+        dataset.query('fItsClusterSize * 2 > 300')
+        self.assertEqual(len(dataset.data), len(cluster_size.query('fItsClusterSize * 2 > 300')))
+        self.assertEqual(len(dataset.data), 2)
+
+    def test_fallback(self):
+        threshold = 0.5
+        self.assertIsNone(_compile_expression('fPt > @threshold'))
+        self.assertIsNone(_compile_expression('fCharge in [1, 2]'))
+        dataset = Dataset(self.data.copy())
+        self.assertEqual(len(dataset.query('fCharge in [1]', inplace=False).data), (self.data['fCharge'] == 1).sum())
+        self.assertEqual(len(dataset.query('fPt > @threshold', inplace=False, local_dict={'threshold': threshold}).data),
+                         (self.data['fPt'] > threshold).sum())
+
+class TestLazyDataset(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.data = pd.DataFrame({
+            'fPt': rng.exponential(2., 5_000),
+            'fEta': rng.uniform(-1., 1., 5_000),
+        })
+        self.axis_spec_p = AxisSpec(40, 0, 10, 'hP', ';#it{p};')
+        self.axis_spec_eta = AxisSpec(20, -1, 1, 'hEta', ';#eta;')
+
+    def test_lazy_matches_eager(self):
+        lazy = Dataset(self.data.copy()).lazy(chunk_size=1_000)
+        lazy['fP'] = 'fPt * cosh(fEta)'
+        selected = lazy.query('fPt > 1')
+        selected.add_subset('central', 'abs(fEta) < 0.5')
+        hist_p = selected.build_th1('fP', self.axis_spec_p, subset='central')
+        hist_boost = selected.build_boost2d('fP', 'fEta', self.axis_spec_p, self.axis_spec_eta, name='hPEta')
+        self.assertEqual(hist_p.GetEntries(), 0)
+        self.assertIn('Subset central: abs(fEta) < 0.5', lazy.plan())
+        lazy.run()
+
+        eager = Dataset(self.data.copy())
+        eager['fP'] = eager.eval('fPt * cosh(fEta)')
+        eager.query('fPt > 1')
+        eager.add_subset('central', eager.eval('abs(fEta) < 0.5'))
+        hist_p_ref = eager.build_th1('fP', self.axis_spec_p, subset='central', name='hP_ref')
+        hist_boost_ref = eager.build_boost2d('fP', 'fEta', self.axis_spec_p, self.axis_spec_eta)
+        self.assertEqual(hist_p.GetEntries(), hist_p_ref.GetEntries())
+        for ibin in range(0, self.axis_spec_p.nbins + 2):
+            self.assertEqual(hist_p.GetBinContent(ibin), hist_p_ref.GetBinContent(ibin))
+        self.assertTrue(np.array_equal(hist_boost.view(flow=True), hist_boost_ref.view(flow=True)))
+
+    def test_subset_from_filtered_view(self):
+        lazy = Dataset(self.data.copy()).lazy(chunk_size=1_000)
+        lazy.add_subset('central', 'abs(fEta) < 0.5')
+        hist = lazy.query('fPt > 1').build_boost1d('fPt', self.axis_spec_p, subset='central')
+        lazy.run()
+        selected = self.data[(self.data['fPt'] > 1) & (self.data['fEta'].abs() < 0.5)]
+        reference = Dataset(selected).build_boost1d('fPt', self.axis_spec_p)
+        self.assertEqual(hist.sum(flow=True), len(selected))
+        self.assertTrue(np.array_equal(hist.view(flow=True), reference.view(flow=True)))
+
+class TestBuildMany(unittest.TestCase):
+
+    def test_build_many_matches_single(self):
+        rng = np.random.default_rng(11)
+        data = pd.DataFrame({
+            'fPt': rng.exponential(2., 3_000).astype(np.float32),
+            'fEta': rng.uniform(-1., 1., 3_000),
+            'fWeight': rng.uniform(0.5, 1.5, 3_000),
+        })
+        dataset = Dataset(data)
+        dataset.add_subset('central', 'abs(fEta) < 0.5')
+        axis_spec_pt = AxisSpec(40, 0, 10, 'hPt', ';#it{p}_{T};')
+        axis_spec_eta = AxisSpec(20, -1, 1, 'hEta', ';#eta;')
+        specs = [
+            HistSpec('fPt', axis_spec_pt),
+            HistSpec('fPt', axis_spec_pt, subset='central', name='hPtCentral'),
+            HistSpec('fPt', axis_spec_pt, cut='fPt > 1', subset='central', name='hPtCut', weights='fWeight'),
+            HistSpec('fPt', axis_spec_pt, 'fEta', axis_spec_eta, backend='boost'),
+        ]
+        histograms = dataset.build_many(specs)
+
+        references = {
+            'hPt': dataset.build_th1('fPt', axis_spec_pt),
+            'hPtCentral': dataset.build_th1('fPt', axis_spec_pt, subset='central', name='hPtCentral_ref'),
+        }
+        for name, reference in references.items():
+            self.assertEqual(histograms[name].GetEntries(), reference.GetEntries())
+            for ibin in range(axis_spec_pt.nbins + 2):
+                self.assertEqual(histograms[name].GetBinContent(ibin), reference.GetBinContent(ibin))
+        selected = data[(data['fPt'] > 1) & (data['fPt'] < 10) & (data['fEta'].abs() < 0.5)]
+        np.testing.assert_allclose(histograms['hPtCut'].GetSumOfWeights(), selected['fWeight'].sum(), rtol=1e-5)
+        weighted = dataset.build_th1('fPt', axis_spec_pt, subset='central', weights='fWeight', name='hPtWeighted')
+        weighted_boost = dataset.build_boost1d('fPt', axis_spec_pt, subset='central', weights=data['fWeight'].to_numpy())
+        np.testing.assert_allclose(weighted.GetSumOfWeights(), weighted_boost.sum().value, rtol=1e-5)
+        reference = dataset.build_boost2d('fPt', 'fEta', axis_spec_pt, axis_spec_eta)
+        self.assertTrue(np.array_equal(histograms['hPt_hEta'].view(flow=True), reference.view(flow=True)))
+
+    def test_build_many_polars(self):
+        rng = np.random.default_rng(17)
+        data = pd.DataFrame({'fPt': rng.exponential(2., 2_000).astype(np.float32), 'fEta': rng.uniform(-1., 1., 2_000)})
+        axis_spec_pt = AxisSpec(40, 0, 10, 'hPt', ';#it{p}_{T};')
+        specs = [HistSpec('fPt', axis_spec_pt, cut='fPt > 1 and abs(fEta) < 0.8', backend='boost'),
+                 HistSpec('fPt', axis_spec_pt, cut='fEta > 0', subset='central', backend='boost', name='hPtCentral')]
+        histograms = []
+        for engine in ['pandas', 'polars']:
+            dataset = Dataset(data.copy(), engine=engine)
+            dataset.add_subset('central', 'abs(fEta) < 0.5')
+            histograms.append(dataset.build_many(specs))
+        for name in ['hPt', 'hPtCentral']:
+            self.assertTrue(np.array_equal(histograms[0][name].view(flow=True), histograms[1][name].view(flow=True)), name)
+        self.assertEqual(histograms[1]['hPtCentral'].sum(flow=True), ((data['fEta'] > 0) & (data['fEta'] < 0.5)).sum())
+
+    def test_build_many_shared_blocks(self):
+        rng = np.random.default_rng(13)
+        data = pd.DataFrame({'fPt': rng.uniform(0.3, 0.45, 4_000).astype(np.float32), 'fWeight': np.full(4_000, 0.1)})
+        dataset = Dataset(data)
+        axis_spec_pt = AxisSpec(40, 0, 10, 'hPt', ';#it{p}_{T};')
+        specs = [HistSpec('fPt', axis_spec_pt, weights='fWeight'), HistSpec('fPt', axis_spec_pt, name='hPtCounts'),
+                 HistSpec('fPt', axis_spec_pt, backend='boost', name='hPtBoost')]
+        with mock.patch('torchic.core.dataset.FILL_BLOCK_SIZE', 64), \
+             mock.patch.object(histogram, '_bin_index', wraps=histogram._bin_index) as bin_index:
+            histograms = dataset.build_many(specs)
+        # the column is binned once per block and shared by the two ROOT histograms
+        self.assertEqual(bin_index.call_count, len(range(0, len(data), 64)))
+        # the contents are summed in double precision over the blocks and rounded once
+        self.assertEqual(histograms['hPt'].GetBinContent(2), np.float32(data['fWeight'].sum()))
+        self.assertEqual(histograms['hPtCounts'].GetEntries(), len(data))
+        self.assertEqual(histograms['hPtBoost'].sum(), len(data))
+
+    def test_build_thn(self):
+        rng = np.random.default_rng(17)
+        data = pd.DataFrame({
+            'fPt': rng.exponential(2., 4_000).astype(np.float32),
+            'fEta': rng.uniform(-1., 1., 4_000),
+            'fCentrality': rng.uniform(0., 100., 4_000),
+            'fWeight': rng.uniform(0.5, 1.5, 4_000),
+        })
+        data.loc[::97, 'fEta'] = np.nan
+        dataset = Dataset(data)
+        dataset.add_subset('central', 'abs(fEta) < 0.5')
+        columns = ['fPt', 'fEta', 'fCentrality']
+        axis_specs = [AxisSpec.log(20, 0.1, 10., 'pt', ''), AxisSpec(10, -1, 1, 'eta', ''),
+                      AxisSpec.from_edges([0., 10., 30., 50., 100.], 'cent', '')]
+        selected = data[data['fEta'].abs() < 0.5]
+        reference = bh.Histogram(bh.axis.Variable(axis_specs[0].edges), bh.axis.Regular(10, -1, 1),
+                                 bh.axis.Variable(axis_specs[2].edges), storage=bh.storage.Weight())
+        reference.fill(*[selected[column].to_numpy() for column in columns], weight=selected['fWeight'].to_numpy())
+
+        for dense_max_cells in [histogram.THN_DENSE_MAX_CELLS, 0]:
+            with mock.patch.object(histogram, 'THN_DENSE_MAX_CELLS', dense_max_cells):
+                hist = dataset.build_thn(columns, axis_specs, subset='central', weights='fWeight')
+            np.testing.assert_allclose(hist.view(flow=True).value, reference.view(flow=True).value)
+            np.testing.assert_allclose(hist.view(flow=True).variance, reference.view(flow=True).variance)
+
+        counts = dataset.build_thn(columns, axis_specs)
+        self.assertEqual(counts.sum(flow=True), len(data))
+        projection = dataset.build_boost2d('fPt', 'fEta', axis_specs[0], axis_specs[1])
+        self.assertTrue(np.array_equal(counts.view(flow=True).sum(axis=2), projection.view(flow=True)))
+
+    def test_slice_stats(self):
+        rng = np.random.default_rng(19)
+        data = pd.DataFrame({'fBetaGamma': rng.uniform(0.5, 4., 3_000), 'fClusterSize': rng.normal(5., 1., 3_000)})
+        dataset = Dataset(data)
+        dataset.add_subset('high', 'fBetaGamma > 2')
+        axis_spec = AxisSpec(7, 0.5, 4., 'bg', '')
+        df = dataset.slice_stats('fBetaGamma', 'fClusterSize', axis_spec, subset='high')
+        self.assertEqual(df['entries'].sum(), (data['fBetaGamma'] > 2).sum())
+        selected = data[(data['fBetaGamma'] > 2) & (data['fBetaGamma'] < 2.5)]
+        self.assertAlmostEqual(df['mean'][0], selected['fClusterSize'].mean())
+
+class TestPolarsEngine(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.data = pd.DataFrame({
+            'fPt': rng.exponential(2., 2_000).astype(np.float32),
+            'fEta': rng.uniform(-1., 1., 2_000).astype(np.float32),
+        })
+
+    def test_engines_agree(self):
+        axis_spec_pt = AxisSpec(40, 0, 10, 'hPt', ';#it{p}_{T};')
+        hists = []
+        for engine in ['pandas', 'polars']:
+            dataset = Dataset(self.data.copy(), engine=engine)
+            dataset.query('fPt > 1 and not abs(fEta) > 0.8')
+            dataset.add_subset('central', dataset.eval('abs(fEta) < 0.5'))
+            hists.append(dataset.build_boost1d('fPt', axis_spec_pt, subset='central'))
+        self.assertEqual(type(Dataset(self.data, engine='polars')).__name__, 'PlDataset')
+        self.assertTrue(np.array_equal(hists[0].view(flow=True), hists[1].view(flow=True)))
+
+    def test_expressions(self):
+        data = self.data.assign(fCharge=np.resize([-1, 0, 1, 2], len(self.data)).astype(np.int8))
+        dataset = Dataset(data, engine='polars')
+        for expr in ['fPt > 1 & fEta > 0.2', 'fCharge > 0 & fCharge < 2 | fPt > 5', 'fCharge in [0, 2]',
+                     'fCharge not in [0, 2] and fPt > 1']:
+            selected = dataset.query(expr, inplace=False)
+            self.assertEqual(len(selected), len(data.query(expr)), expr)
+
+    def test_cut_flow(self):
+        cuts = {'pt': 'fPt > 1', 'eta': 'abs(fEta) < 0.8', 'ptEta': 'fPt * fEta > 0.5'}
+        reference = Dataset(self.data.copy()).cut_flow(cuts)
+        dataset = Dataset(self.data.copy(), engine='polars')
+        dataset.add_subset('central', 'abs(fEta) < 0.5')
+        cut_flow = dataset.cut_flow(cuts)
+        self.assertEqual(cut_flow.counts, reference.counts)
+        self.assertEqual(len(dataset), reference.counts[-1])
+        self.assertEqual(len(dataset['central:fPt']), len(self.data.query('fPt > 1 and abs(fEta) < 0.5 and fPt * fEta > 0.5')))
+
+        selected = CutFlow(list(cuts.values())).apply(Dataset(self.data, engine='polars'), inplace=False)
+        self.assertEqual(type(selected).__name__, 'PlDataset')
+        self.assertEqual(len(selected), reference.counts[-1])
+
+    def test_lazy(self):
+        axis_spec_pt = AxisSpec(40, 0, 10, 'hPt', ';#it{p}_{T};')
+        lazy = Dataset(self.data, engine='polars').lazy(chunk_size=500)
+        hist = lazy.query('fPt > 1').build_boost1d('fPt', axis_spec_pt)
+        lazy.run()
+        reference = Dataset(self.data.query('fPt > 1')).build_boost1d('fPt', axis_spec_pt)
+        self.assertTrue(np.array_equal(hist.view(flow=True), reference.view(flow=True)))
+
+class TestDatasetFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = pd.DataFrame({
+            'column_x': np.arange(100, dtype=np.float64),
+            'column_y': np.arange(100, dtype=np.int64)[::-1],
+        })
+        self.parquet_files, self.csv_files = [], []
+        for ifile in range(10):
+            chunk = self.data.iloc[ifile*10:(ifile+1)*10]
+            self.parquet_files.append(os.path.join(self.tmpdir.name, f'shard_{ifile}.parquet'))
+            self.csv_files.append(os.path.join(self.tmpdir.name, f'shard_{ifile}.csv'))
+            chunk.to_parquet(self.parquet_files[-1], index=False)
+            chunk.to_csv(self.csv_files[-1], index=False)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_open_files(self):
+        self.assertTrue(Dataset(self.parquet_files).data.equals(self.data))
+        self.assertTrue(Dataset(self.csv_files).data.equals(self.data))
+        self.assertTrue(Dataset(self.parquet_files, n_workers=4).data.equals(self.data))
+
+    def test_open_parquet_pyarrow(self):
+        dataset = Dataset(self.parquet_files, parquet_backend='pyarrow', columns=['column_x'], memory_map=True)
+        self.assertEqual(list(dataset.columns), ['column_x'])
+        self.assertTrue(np.array_equal(dataset['column_x'].to_numpy(), self.data['column_x'].to_numpy()))
+
+    def test_open_with_cut(self):
+        expected = self.data.query('column_x > 42 and column_y % 2 == 0')[['column_x']].reset_index(drop=True)
+        dataset = Dataset(self.parquet_files, columns=['column_x'], cut='column_x > 42 and column_y % 2 == 0')
+        self.assertTrue(dataset.data.equals(expected))
+        dataset = Dataset(self.csv_files, usecols=['column_x'], cut='column_x > 42 and column_y % 2 == 0')
+        self.assertTrue(dataset.data.equals(expected))
+        dataset = Dataset(self.parquet_files, parquet_backend='pyarrow', columns=['column_x'], cut='column_x > 42 and column_y % 2 == 0')
+        self.assertTrue(dataset.data.equals(expected))
+
+class TestDatasetRoot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmpdir.name, 'test_stream.root')
+        rng = np.random.default_rng(42)
+        self.data = pd.DataFrame({
+            'fPt': rng.exponential(2., 10_000).astype(np.float32),
+            'fEta': rng.uniform(-1., 1., 10_000).astype(np.float32),
+        })
+        with uproot.recreate(self.file_path) as outfile:
+            outfile['DF_1/O2track'] = {col: self.data[col].to_numpy()[:6_000] for col in self.data.columns}
+            outfile['DF_2/O2track'] = {col: self.data[col].to_numpy()[6_000:] for col in self.data.columns}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_stream_matches_in_memory(self):
+        axis_spec_pt = AxisSpec(50, 0, 10, 'hPt', ';#it{p}_{T};')
+        axis_spec_eta = AxisSpec(20, -1, 1, 'hEta', ';#eta;')
+
+        stream = Dataset.stream_root(self.file_path, 'O2track', 'DF_*', step_size=1_000)
+        stream.add_subset('central', 'abs(fEta) < 0.5')
+        stream.book_th1('fPt', axis_spec_pt, subset='central')
+        stream.book_th2('fPt', 'fEta', axis_spec_pt, axis_spec_eta, cut='fPt > 1')
+        histograms = stream.run()
+
+        dataset = Dataset.from_root(self.file_path, 'O2track', 'DF_*')
+        dataset.add_subset('central', dataset.eval('abs(fEta) < 0.5'))
+        hist_pt = dataset.build_th1('fPt', axis_spec_pt, subset='central', name='hPt_ref')
+        hist_pt_eta = dataset.query('fPt > 1', inplace=False).build_th2('fPt', 'fEta', axis_spec_pt, axis_spec_eta, name='hPtEta_ref')
+
+        self.assertEqual(histograms['hPt'].GetEntries(), hist_pt.GetEntries())
+        for ibin in range(0, axis_spec_pt.nbins + 2):
+            self.assertEqual(histograms['hPt'].GetBinContent(ibin), hist_pt.GetBinContent(ibin))
+        self.assertEqual(histograms['hPt_hEta'].GetEntries(), hist_pt_eta.GetEntries())
+        for ibin in range(0, (axis_spec_pt.nbins + 2) * (axis_spec_eta.nbins + 2)):
+            self.assertEqual(histograms['hPt_hEta'].GetBinContent(ibin), hist_pt_eta.GetBinContent(ibin))
+
+    def test_stream_chunks(self):
+        stream = Dataset.stream_root(self.file_path, 'O2track', 'DF_*', step_size=1_000)
+        lengths = [len(chunk) for chunk in stream]
+        self.assertEqual(sum(lengths), len(self.data))
+        self.assertTrue(all(length <= 1_000 for length in lengths))
+
+    def test_from_root_parallel(self):
+        serial = Dataset.from_root(self.file_path, 'O2track', 'DF_*')
+        parallel = Dataset.from_root(self.file_path, 'O2track', 'DF_*', n_workers=2)
+        self.assertTrue(parallel.data.equals(serial.data))
+        self.assertTrue(np.array_equal(serial['fPt'].to_numpy(), self.data['fPt'].to_numpy()))
+
+    def test_from_root_cut(self):
+        cut = 'fPt > 1 and abs(fEta) < 0.8'
+        expected = self.data.query(cut)[['fPt']].reset_index(drop=True)
+        dataset = Dataset.from_root(self.file_path, 'O2track', 'DF_*', columns=['fPt'], cut=cut, step_size=1_000)
+        self.assertEqual(list(dataset.columns), ['fPt'])
+        self.assertTrue(dataset.data.equals(expected))
+        dataset = Dataset.from_root(self.file_path, 'DF_1/O2track', columns=['fPt'], cut=cut)
+        self.assertTrue(dataset.data.equals(expected.iloc[:len(dataset)]))
+
+    def test_from_root_cache(self):
+        cache = DataFrameCache(os.path.join(self.tmpdir.name, 'cache'), max_size='1 GB')
+        first = Dataset.from_root(self.file_path, 'O2track', 'DF_*', columns=['fPt'], cache=cache)
+        self.assertEqual(len(cache.info()), 1)
+        second = Dataset.from_root(self.file_path, 'O2track', 'DF_*', columns=['fPt'], cache=cache)
+        self.assertTrue(second.data.equals(first.data))
+        Dataset.from_root(self.file_path, 'O2track', 'DF_*', columns=['fEta'], cache=cache)
+        self.assertEqual(len(cache.info()), 2)
+
+        small_cache = DataFrameCache(cache.cache_dir, max_size=cache.size - 1)
+        small_cache.store('extra', first.data)
+        self.assertLessEqual(small_cache.size, small_cache.max_size)
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+
+    def test_arrow_storage(self):
+        dataset = Dataset.from_root(self.file_path, 'O2track', 'DF_*', storage='arrow')
+        self.assertIsInstance(dataset['fPt'].dtype, pd.ArrowDtype)
+        self.assertEqual(dataset['fPt'].dtype.numpy_dtype, np.float32)
+        axis_spec_pt = AxisSpec(50, 0, 10, 'hPt', ';#it{p}_{T};')
+        hist = dataset.build_th1('fPt', axis_spec_pt)
+        hist_ref = Dataset(self.data).build_th1('fPt', axis_spec_pt, name='hPt_ref')
+        for ibin in range(0, axis_spec_pt.nbins + 2):
+            self.assertEqual(hist.GetBinContent(ibin), hist_ref.GetBinContent(ibin))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
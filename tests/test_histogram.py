@@ -1,7 +1,17 @@
 import unittest
+from unittest import mock
 import random
+import numpy as np
 import pandas as pd
-from torchic.core.histogram import AxisSpec, build_TH1, build_TH2, fill_TH1, fill_TH2, build_efficiency, normalize_hist
+import pyarrow as pa
+from scipy.stats import beta
+from torchic.core import histogram
+from torchic.core.histogram import AxisSpec, as_array, build_TH1, build_TH2, build_THn, build_boost1, build_boost2, fill_TH1, fill_TH2, build_efficiency, normalize_hist, \
+    hist_to_numpy, numpy_to_hist, hist_values, get_mean, get_rms, hist_to_graph, scale_hist_axis, \
+    axis_edges, hist_variances, transform_arrays, transform_hist, \
+    project_hist, project_slices
+from torchic.core.efficiency import efficiency_interval
+from torchic.core.slice_stats import slice_stats_from_columns, slice_stats_from_hist
 from ROOT import TH1F, TH2F, TFile
 
 class TestBuildHist(unittest.TestCase):
@@ -44,6 +54,314 @@ class TestBuildHist(unittest.TestCase):
         fill_TH2(self.data_2d['column_x'], self.data_2d['column_y'], hist)
         self.assertEqual(hist.GetEntries(), 5)
 
+    def test_as_array_zero_copy(self):
+        values = np.arange(10, dtype=np.float32)
+        series = pd.Series(values)
+        self.assertTrue(np.shares_memory(as_array(series), values))
+        arrow_array = pa.array(values)
+        arrow_series = pd.Series(pd.arrays.ArrowExtensionArray(arrow_array))
+        self.assertEqual(as_array(arrow_series).dtype, np.float32)
+        self.assertEqual(as_array(arrow_series).ctypes.data, arrow_array.buffers()[1].address)
+
+    def test_as_array_masked(self):
+        np.testing.assert_array_equal(as_array(pd.Series([1, 2, 3], dtype='Int64')), [1, 2, 3])
+        np.testing.assert_array_equal(as_array(pd.Series([1., None, 3.], dtype='Float32')), [1., np.nan, 3.])
+        self.assertEqual(as_array(pd.Series([True, False], dtype='boolean')).dtype, bool)
+        hist = build_boost1(pd.Series([1, 2, 2, 7], dtype='Int64'), AxisSpec(10, 0, 10, 'h', ''))
+        self.assertEqual(hist.sum(), 4)
+
+    def test_partitioned_fill(self):
+        rng = np.random.default_rng(42)
+        data_x = np.concatenate([rng.uniform(-1, 6, 2000), [np.nan, 1., 5.]]).astype(np.float32)
+        data_y = rng.normal(3, 2, len(data_x))
+        hist_serial = TH2F('serial', 'serial', 7, 0, 5, 9, 0, 6)
+        hist_serial.Sumw2()
+        fill_TH2(data_x, data_y, hist_serial)
+        hist_parallel = TH2F('parallel', 'parallel', 7, 0, 5, 9, 0, 6)
+        hist_parallel.Sumw2()
+        fill_TH2(data_x, data_y, hist_parallel, n_workers=3)
+        self.assertEqual(hist_parallel.GetEntries(), hist_serial.GetEntries())
+        for ibin in range(hist_serial.GetNcells()):
+            self.assertEqual(hist_parallel.GetBinContent(ibin), hist_serial.GetBinContent(ibin))
+            self.assertEqual(hist_parallel.GetBinError(ibin), hist_serial.GetBinError(ibin))
+        stats_serial, stats_parallel = np.zeros(13), np.zeros(13)
+        hist_serial.GetStats(stats_serial)
+        hist_parallel.GetStats(stats_parallel)
+        np.testing.assert_allclose(stats_parallel, stats_serial)
+
+        hist = build_TH1(pd.Series(data_x), AxisSpec(7, 0, 5, 'partitioned', ''), n_workers=4)
+        hist_serial = build_TH1(pd.Series(data_x), AxisSpec(7, 0, 5, 'serial', ''))
+        self.assertEqual([hist.GetBinContent(ibin) for ibin in range(9)], [hist_serial.GetBinContent(ibin) for ibin in range(9)])
+
+    def test_numpy_fill(self):
+        rng = np.random.default_rng(19)
+        data_x = np.concatenate([rng.uniform(-1, 6, 3000), [np.nan, 0., 5.]]).astype(np.float32)
+        data_y = rng.normal(3, 2, len(data_x))
+        hist_fill_n = TH2F('fill_n', 'fill_n', 7, 0, 5, 9, 0, 6)
+        hist_fill_n.Sumw2()
+        hist_fill_n.FillN(len(data_x), data_x.astype(np.float64), data_y, np.ones(len(data_x)))
+        hist = TH2F('numpy_fill', 'numpy_fill', 7, 0, 5, 9, 0, 6)
+        hist.Sumw2()
+        # the kernel works block by block, without building a weight array for FillN
+        with mock.patch.object(histogram, 'FILL_BLOCK_SIZE', 256), \
+             mock.patch.object(histogram, '_fill_blocks', wraps=histogram._fill_blocks) as fill_blocks:
+            fill_TH2(data_x, data_y, hist)
+        fill_blocks.assert_not_called()
+        self.assertEqual(hist.GetEntries(), hist_fill_n.GetEntries())
+        for ibin in range(hist.GetNcells()):
+            self.assertEqual(hist.GetBinContent(ibin), hist_fill_n.GetBinContent(ibin))
+            self.assertEqual(hist.GetBinError(ibin), hist_fill_n.GetBinError(ibin))
+        stats, stats_fill_n = np.zeros(13), np.zeros(13)
+        hist.GetStats(stats)
+        hist_fill_n.GetStats(stats_fill_n)
+        np.testing.assert_allclose(stats, stats_fill_n)
+
+        # automatic limits are left to FillN
+        with mock.patch.object(histogram, '_fill_blocks', wraps=histogram._fill_blocks) as fill_blocks:
+            hist = build_TH1(pd.Series(data_x), AxisSpec(10, 0, 0, 'auto', ''))
+        fill_blocks.assert_called_once()
+        self.assertEqual(hist.GetEntries(), len(data_x))
+
+    def test_weighted_fill(self):
+        rng = np.random.default_rng(5)
+        data_x = np.concatenate([rng.uniform(-1, 6, 3000), [np.nan]]).astype(np.float32)
+        data_y = rng.normal(3, 2, len(data_x))
+        weights = rng.uniform(0.2, 2., len(data_x))
+        hist_fill_n = TH2F('fill_n', 'fill_n', 7, 0, 5, 9, 0, 6)
+        arr_x, arr_y = data_x.astype(np.float64), data_y.astype(np.float64)
+        hist_fill_n.FillN(len(arr_x), arr_x, arr_y, weights)
+        hist = build_TH2(pd.Series(data_x), pd.Series(data_y), AxisSpec(7, 0, 5, 'x', ''), AxisSpec(9, 0, 6, 'y', ''), weights=weights, n_workers=2)
+        self.assertEqual(hist.GetEntries(), hist_fill_n.GetEntries())
+        self.assertGreater(hist.GetSumw2N(), 0)
+        for ibin in range(hist.GetNcells()):
+            self.assertAlmostEqual(hist.GetBinContent(ibin), hist_fill_n.GetBinContent(ibin), places=4)
+            self.assertAlmostEqual(hist.GetBinError(ibin), hist_fill_n.GetBinError(ibin), places=10)
+        stats, stats_fill_n = np.zeros(13), np.zeros(13)
+        hist.GetStats(stats)
+        hist_fill_n.GetStats(stats_fill_n)
+        np.testing.assert_allclose(stats, stats_fill_n)
+
+        hist_boost = build_boost1(pd.Series(data_x), AxisSpec(7, 0, 5, 'x', ''), weights=weights)
+        hist_x = build_TH1(pd.Series(data_x), AxisSpec(7, 0, 5, 'x', ''), weights=weights)
+        np.testing.assert_allclose(hist_boost.view(flow=True).value, [hist_x.GetBinContent(ibin) for ibin in range(9)], rtol=1e-6)
+        np.testing.assert_allclose(hist_boost.view(flow=True).variance, [hist_x.GetBinError(ibin)**2 for ibin in range(9)])
+
+    def test_stat_overflows(self):
+        data = np.array([-1., 0.5, 1.5, 2.5, 7.])
+        TH1F.StatOverflows(True)
+        try:
+            hist = build_TH1(data, AxisSpec(3, 0, 3, 'x', ''))
+            hist_fill_n = TH1F('fill_n_overflows', '', 3, 0, 3)
+            hist_fill_n.FillN(len(data), data, np.ones(len(data)))
+        finally:
+            TH1F.StatOverflows(False)
+        self.assertAlmostEqual(hist.GetMean(), data.mean())
+        self.assertAlmostEqual(hist.GetMean(), hist_fill_n.GetMean())
+        self.assertAlmostEqual(build_TH1(data, AxisSpec(3, 0, 3, 'x', '')).GetMean(), 1.5)
+
+    def test_variable_axis_fill(self):
+        rng = np.random.default_rng(11)
+        edges = [0., 0.5, 1., 2., 3.5, 5.]
+        data_x = np.concatenate([rng.uniform(-1, 6, 2000), edges, [np.nan, -np.inf, np.inf]]).astype(np.float32)
+        data_y = rng.exponential(3, len(data_x))
+        axis_x, axis_y = AxisSpec.from_edges(edges, 'x', ''), AxisSpec.log(6, 0.1, 10., 'y', '')
+        self.assertEqual((axis_x.nbins, axis_x.xmin, axis_x.xmax), (5, 0., 5.))
+        self.assertEqual(AxisSpec.from_dict({'edges': edges, 'name': 'x', 'title': ''}), axis_x)
+        self.assertEqual(hash(AxisSpec.from_edges(np.array(edges), 'x', '')), hash(axis_x))
+        self.assertEqual(len({axis_x, AxisSpec.from_edges(edges, 'x', ''), AxisSpec(5, 0., 5., 'x', '')}), 2)
+
+        hist = build_TH2(pd.Series(data_x), pd.Series(data_y), axis_x, axis_y, n_workers=2)
+        hist_fill_n = TH2F('fill_n', 'fill_n', 5, np.array(edges), 6, axis_y.bin_edges)
+        hist_fill_n.Sumw2()
+        hist_fill_n.FillN(len(data_x), data_x.astype(np.float64), data_y.astype(np.float64), np.ones(len(data_x)))
+        self.assertEqual(hist.GetEntries(), hist_fill_n.GetEntries())
+        np.testing.assert_array_equal(axis_edges(hist.GetXaxis()), edges)
+        np.testing.assert_allclose(axis_edges(hist.GetYaxis()), axis_y.bin_edges)
+        for ibin in range(hist.GetNcells()):
+            self.assertEqual(hist.GetBinContent(ibin), hist_fill_n.GetBinContent(ibin))
+        stats, stats_fill_n = np.zeros(13), np.zeros(13)
+        hist.GetStats(stats)
+        hist_fill_n.GetStats(stats_fill_n)
+        np.testing.assert_allclose(stats, stats_fill_n)
+
+        hist_x = build_TH1(pd.Series(data_x), axis_x)
+        hist_boost = build_boost1(pd.Series(data_x), axis_x)
+        np.testing.assert_array_equal(hist_boost.axes[0].edges, edges)
+        np.testing.assert_array_equal(hist_boost.view(flow=True), [hist_x.GetBinContent(ibin) for ibin in range(7)])
+
+    def test_build_thn_sparse(self):
+        rng = np.random.default_rng(23)
+        data = [rng.normal(0, 1, 1000), rng.integers(0, 5, 1000), rng.uniform(0, 3, 1000)]
+        axis_specs = [AxisSpec(10, -3, 3, 'x', ''), AxisSpec(5, -0.5, 4.5, 'n', ''), AxisSpec.from_edges([0., 1., 3.], 'z', '')]
+        hist_boost = build_THn(data, axis_specs)
+        hist = build_THn(data, axis_specs, backend='root', name='hSparse')
+        self.assertEqual(hist.GetEntries(), 1000)
+        values = hist_boost.view(flow=True)
+        self.assertEqual(hist.GetNbins(), np.count_nonzero(values))
+        for coordinate in zip(*np.nonzero(values)):
+            self.assertEqual(hist.GetBinContent(np.array(coordinate, dtype=np.int32)), values[coordinate])
+
+        hist_sel = build_THn([column[:500] for column in data], axis_specs, backend='root', name='hSparseSel')
+        hist_eff = build_efficiency(hist, hist_sel)
+        values_sel = build_THn([column[:500] for column in data], axis_specs).view(flow=True)
+        self.assertEqual(hist_eff.GetNbins(), np.count_nonzero(values))
+        for coordinate in zip(*np.nonzero(values)):
+            self.assertAlmostEqual(hist_eff.GetBinContent(np.array(coordinate, dtype=np.int32)), values_sel[coordinate] / values[coordinate])
+        dense = mock.Mock(**{'InheritsFrom.side_effect': lambda name: name == 'THnBase'})
+        self.assertRaises(ValueError, build_efficiency, dense, dense)
+
+    def test_numpy_views(self):
+        rng = np.random.default_rng(29)
+        data = pd.Series(rng.normal(2, 1, 500))
+        hist = build_TH1(data, AxisSpec(12, -0.5, 4.5, 'hist', ';column;'))
+        values, variances, (edges,) = hist_to_numpy(hist, flow=True)
+        self.assertEqual([hist.GetBinContent(ibin) for ibin in range(14)], list(values))
+        np.testing.assert_array_equal(edges, [hist.GetXaxis().GetBinLowEdge(ibin) for ibin in range(1, 14)])
+        values[3] = 7.
+        self.assertEqual(hist.GetBinContent(3), 7.)
+        numpy_to_hist(hist, hist_values(hist), np.full(12, 4.))
+        self.assertEqual(hist.GetBinError(5), 2.)
+
+        hist_2d = build_TH2(data, data * 2, AxisSpec(5, 0, 5, 'x', ''), AxisSpec(4, 0, 8, 'y', ''))
+        values_2d = hist_values(hist_2d, flow=True)
+        self.assertEqual(values_2d.shape, (7, 6))
+        self.assertEqual(values_2d[2, 3], hist_2d.GetBinContent(2, 3))
+
+        mean, rms, content = 0., 0., 0.
+        for ibin in range(hist.FindBin(0.), hist.FindBin(4.)):
+            content += hist.GetBinContent(ibin)
+            mean += hist.GetBinContent(ibin) * hist.GetBinCenter(ibin)
+            rms += hist.GetBinContent(ibin) * hist.GetBinCenter(ibin) ** 2
+        self.assertAlmostEqual(get_mean(hist, 0., 4.), mean / content, places=12)
+        self.assertAlmostEqual(get_rms(hist, 0., 4.), np.sqrt(rms / content - (mean / content) ** 2), places=12)
+
+        graph = hist_to_graph(hist)
+        for ibin in range(1, 13):
+            self.assertAlmostEqual(graph.x[ibin - 1], hist.GetBinCenter(ibin), places=12)
+            self.assertEqual((graph.y[ibin - 1], graph.ey[ibin - 1]), (hist.GetBinContent(ibin), hist.GetBinError(ibin)))
+
+        hist_sel = build_TH1(data[:200], AxisSpec(12, -0.5, 4.5, 'hist_sel', ';column;'))
+        hist_eff = build_efficiency(hist, hist_sel)
+        for ibin in range(1, 13):
+            if hist.GetBinContent(ibin) > 0:
+                eff = hist_sel.GetBinContent(ibin) / hist.GetBinContent(ibin)
+                self.assertAlmostEqual(hist_eff.GetBinContent(ibin), eff, places=6)
+                self.assertAlmostEqual(hist_eff.GetBinError(ibin), np.sqrt(eff * (1 - eff) / hist.GetBinContent(ibin)) if eff <= 1 else 0.)
+
+
+    def test_transform_hist(self):
+        rng = np.random.default_rng(37)
+        axis_spec = AxisSpec(12, -0.5, 4.5, 'hist', ';column;')
+        hists = [build_TH1(pd.Series(rng.normal(2, 1, 500)), axis_spec, name=f'hist{ihist}') for ihist in range(3)]
+        merged = transform_hist(hists, AxisSpec(6, -0.5, 4.5))
+        for hist, hist_merged in zip(hists, merged):
+            values, variances = hist_values(hist, flow=True), hist_variances(hist, flow=True)
+            np.testing.assert_allclose(hist_values(hist_merged), values[1:-1].reshape(6, 2).sum(axis=1))
+            np.testing.assert_allclose(hist_variances(hist_merged), variances[1:-1].reshape(6, 2).sum(axis=1))
+            self.assertEqual(hist_merged.GetEntries(), hist.GetEntries())
+
+        # a source bin split in two halves keeps a quarter of its variance in each
+        values, variances = transform_arrays([0., 4., 0.], [0., 4., 0.], [0., 1.], [0., 0.5, 1.])
+        np.testing.assert_allclose(values, [0., 2., 2., 0.])
+        np.testing.assert_allclose(variances, [0., 1., 1., 0.])
+        values, _ = transform_arrays([1., 2., 3., 4.], [1., 2., 3., 4.], [1., 2., 3.], [-1., 0.], lambda x: -np.log(x))
+        np.testing.assert_allclose(values, [4. + 3. * (np.log(3.) - 1.) / np.log(1.5), 2. + 3. * (1. - np.log(2.)) / np.log(1.5), 1.])
+
+        hist = hists[0]
+        hist_scaled = scale_hist_axis(hist, 2., nbins=6, xmin=-0.5, xmax=4.5)
+        self.assertAlmostEqual(hist_values(hist_scaled, flow=True).sum(), hist_values(hist, flow=True).sum(), places=3)
+        self.assertAlmostEqual(hist_scaled.GetBinContent(1), hist.GetBinContent(1) + hist.GetBinContent(2) + 0.8 * hist.GetBinContent(3), places=4)
+
+        # in place, the statistics follow the new axis
+        hist = build_TH1(np.random.default_rng(3).normal(4., 1., 2000), AxisSpec(40, 0, 8, 'h_inplace', ''))
+        mean, entries = hist.GetMean(), hist.GetEntries()
+        scale_hist_axis(hist, 2., inplace=True)
+        self.assertAlmostEqual(hist.GetMean(), mean / 2., delta=0.05)
+        self.assertAlmostEqual(hist.GetMean(), get_mean(hist))
+        self.assertEqual(hist.GetEntries(), entries)
+
+    def test_project_slices(self):
+        rng = np.random.default_rng(41)
+        pt = rng.uniform(0, 5, 4000)
+        nsigma = rng.normal(0.1 * pt, 1, 4000)
+        hist = build_TH2(pt, nsigma, AxisSpec(10, 0, 5, 'pt', ''), AxisSpec(20, -4, 4, 'nsigma', ''), name='h2')
+        projections = project_slices(hist)
+        self.assertEqual(projections.values.shape, (10, 22))
+        for islice in [0, 4, 9]:
+            projection = hist.ProjectionY(f'ref_{islice}', islice + 1, islice + 1, 'e')
+            np.testing.assert_allclose(projections.values[islice], hist_values(projection, flow=True))
+            np.testing.assert_allclose(projections.errors[islice], np.sqrt(hist_variances(projection, flow=True)))
+            self.assertAlmostEqual(projections.mean()[islice], get_mean(projection), places=10)
+            self.assertAlmostEqual(projections.rms()[islice], get_rms(projection), places=10)
+            self.assertAlmostEqual(projections.integral()[islice], projection.Integral())
+
+        merged = project_slices(hist, [(0., 1.9), (2., 4.9)], name='merged')
+        reference = project_hist(hist, 2., 4.9)
+        np.testing.assert_allclose(merged.values[1], hist_values(reference, flow=True))
+        np.testing.assert_array_equal(merged.slice_edges, [[0., 2.], [2., 5.]])
+        hist_slice = merged.to_th1(1)
+        self.assertEqual(hist_slice.GetName(), 'merged_1')
+        np.testing.assert_allclose(hist_values(hist_slice), hist_values(reference))
+        np.testing.assert_allclose(project_slices(hist, var_to_project='X').integral(), hist_values(hist).sum(axis=0))
+
+    def test_slice_stats(self):
+        rng = np.random.default_rng(43)
+        x = rng.uniform(0, 4, 8000)
+        y = rng.normal(x, 1)
+        axis_spec_x = AxisSpec.from_edges([0., 1., 2., 4.], 'x', '')
+        df = slice_stats_from_columns(pd.Series(x), pd.Series(y), axis_spec_x, quantiles=(0.16, 0.5), truncation=(0., 0.7))
+        np.testing.assert_allclose(df['x'], [0.5, 1.5, 3.])
+        for islice, (low, high) in enumerate([(0., 1.), (1., 2.), (2., 4.)]):
+            values = np.sort(y[(x >= low) & (x < high)])
+            self.assertEqual(df['entries'][islice], len(values))
+            self.assertAlmostEqual(df['mean'][islice], values.mean())
+            self.assertAlmostEqual(df['rms'][islice], values.std())
+            self.assertEqual(df['median'][islice], np.quantile(values, 0.5, method='inverted_cdf'))
+            self.assertEqual(df['quantile_0.16'][islice], np.quantile(values, 0.16, method='inverted_cdf'))
+            self.assertAlmostEqual(df['truncated_mean'][islice], values[:int(np.ceil(0.7 * len(values)))].mean())
+
+        hist = build_TH2(x, y, AxisSpec(4, 0, 4, 'x', ''), AxisSpec(60, -3, 7, 'y', ''), name='h2_stats')
+        df_hist = slice_stats_from_hist(hist)
+        projections = project_slices(hist)
+        np.testing.assert_allclose(df_hist['mean'], projections.mean())
+        np.testing.assert_allclose(df_hist['rms'], projections.rms())
+        np.testing.assert_allclose(df_hist['median'], np.arange(4) + 0.5, atol=0.1)
+        self.assertEqual(len(slice_stats_from_hist(hist, [(0., 0.9), (8., 9.)])), 1)
+
+        # quantiles reached exactly at a bin edge followed by empty bins fall in the next non-empty bin
+        hist = build_TH2(np.full(8, 0.5), [0.5, 0.5, 1.5, 1.5, 4.5, 4.5, 4.5, 4.5], AxisSpec(1, 0, 1, 'x', ''),
+                         AxisSpec(6, 0, 6, 'y', ''), name='h2_quantile_edges')
+        df_hist = slice_stats_from_hist(hist, quantiles=(0., 0.25, 0.5, 1.))
+        self.assertEqual([df_hist[f'quantile_{quantile:g}'][0] for quantile in (0., 0.25, 0.5, 1.)], [0., 1., 4., 5.])
+
+    def test_efficiency_methods(self):
+        eff, low, up = efficiency_interval([5, 0, 10, 3], [10, 10, 10, 0], 'clopper_pearson', cl=0.95)
+        np.testing.assert_allclose(low, [beta.ppf(0.025, 5, 6), 0., beta.ppf(0.025, 10, 1), 0.])
+        np.testing.assert_allclose(up, [beta.ppf(0.975, 6, 5), beta.ppf(0.975, 1, 10), 1., 0.])
+        eff, low, up = efficiency_interval([5], [10], 'wilson', cl=0.95)
+        np.testing.assert_allclose([low[0], up[0]], [0.2365931, 0.7634069], rtol=1e-6)
+        eff, low, up = efficiency_interval([5], [10], 'bayesian', cl=0.95)
+        np.testing.assert_allclose([eff[0], low[0], up[0]], [0.5, beta.ppf(0.025, 6, 6), beta.ppf(0.975, 6, 6)])
+
+        rng = np.random.default_rng(31)
+        pt, eta = rng.exponential(2., 5000), rng.uniform(-1, 1, 5000)
+        passed = rng.uniform(0, 1, 5000) < 0.8
+        axis_pt, axis_eta = AxisSpec.from_edges([0., 0.5, 1., 2., 4., 10.], 'pt', ''), AxisSpec(4, -1, 1, 'eta', '')
+        hist_tot = build_TH2(pt, eta, axis_pt, axis_eta, name='tot')
+        hist_sel = build_TH2(pt[passed], eta[passed], axis_pt, axis_eta, name='sel')
+        hist_eff = build_efficiency(hist_tot, hist_sel, method='wilson')
+        self.assertEqual(hist_eff.GetName(), 'sel_eff')
+        np.testing.assert_array_equal(axis_edges(hist_eff.GetXaxis()), axis_pt.edges)
+        eff, low, up = efficiency_interval(hist_values(hist_sel), hist_values(hist_tot), 'wilson')
+        np.testing.assert_allclose(hist_values(hist_eff), eff, rtol=1e-6)
+        np.testing.assert_allclose(np.sqrt(hist_variances(hist_eff)), 0.5 * (up - low))
+
+        boost_tot = build_boost2(pt, eta, axis_pt, axis_eta)
+        boost_sel = build_boost2(pt[passed], eta[passed], axis_pt, axis_eta)
+        boost_eff = build_efficiency(boost_tot, boost_sel, method='wilson')
+        np.testing.assert_allclose(boost_eff.values(), eff)
+        np.testing.assert_allclose(boost_eff.variances(), (0.5 * (up - low))**2)
+
     def test_build_efficiency(self):
         
         data_tot = [random.uniform(-0.5, 4.5) for _ in range(100)]
@@ -1,8 +1,16 @@
 from torchic.core.api import (
     Dataset,
+    DatasetStream,
+    LazyDataset,
+    PlDataset,
+    DataFrameCache,
+    SubsetMask,
+    CutFlow,
     AxisSpec,
+    HistSpec,
     HistLoadInfo,
     histogram,
+    slice_stats,
     Plotter,
     fit
 )
@@ -13,9 +21,17 @@ from torchic import roopdf
 
 __all__ = [
     'Dataset',
+    'DatasetStream',
+    'LazyDataset',
+    'PlDataset',
+    'DataFrameCache',
+    'SubsetMask',
+    'CutFlow',
     'AxisSpec',
+    'HistSpec',
     'HistLoadInfo',
     'histogram',
+    'slice_stats',
     'Plotter',
     'fit',
     'physics',
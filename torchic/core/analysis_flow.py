@@ -5,6 +5,7 @@
 
 from abc import ABC, abstractmethod
 from torchic.core.dataset import Dataset
+from torchic.core.cut_flow import CutFlow
 from torchic.core.histogram import AxisSpec
 from torchic.utils.terminal_colors import TerminalColors as tc
 import numpy as np
@@ -69,6 +70,24 @@ class AnalysisFlow(ABC):
             return
         self._dataset.query(expression, inplace=True)
 
+    def apply_cuts(self, col_exps: list) -> CutFlow:
+        '''
+            Apply a list of cuts on the dataset in a single pass, compacting the dataset only once
+            Parameters:
+            - col_exps (list): column: expression pairs, in order (e.g. ['fPtHe3:fPtHe3 > 1.6', 'fEtaHe3:abs(fEtaHe3) < 0.9'])
+
+            Returns:
+            - CutFlow: entries and efficiency after each cut (see CutFlow.table and CutFlow.to_th1)
+        '''
+        cut_flow = CutFlow()
+        for col_exp in col_exps:
+            column, expression = col_exp.split(':')
+            if column not in self._dataset.columns:
+                print(tc.MAGENTA+'[WARNING]:'+tc.RESET+' Column',column,'not present in dataset!')
+                continue
+            cut_flow.add_cut(expression)
+        return self._dataset.cut_flow(cut_flow)
+
     def _visualize_plot(self, config: dict) -> None:
         '''
             Visualize a plot based on the configuration provided.
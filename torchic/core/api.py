@@ -1,10 +1,27 @@
 from torchic.core.dataset import (
     Dataset,
+    DatasetStream,
+    LazyDataset,
+    PlDataset,
+)
+
+from torchic.core.cache import (
+    DataFrameCache,
+)
+
+from torchic.core.subset_mask import (
+    SubsetMask,
+)
+
+from torchic.core.cut_flow import (
+    CutFlow,
 )
 
 from torchic.core import histogram
+from torchic.core import slice_stats
 from torchic.core.histogram import (
     AxisSpec,
+    HistSpec,
     HistLoadInfo
 )
 
@@ -16,9 +33,17 @@ from torchic.core import fit
 
 __all__ = [
     'Dataset',
+    'DatasetStream',
+    'LazyDataset',
+    'PlDataset',
+    'DataFrameCache',
+    'SubsetMask',
+    'CutFlow',
     'AxisSpec',
+    'HistSpec',
     'HistLoadInfo',
     'histogram',
+    'slice_stats',
     'Plotter'
     'fit',
 ]
\ No newline at end of file
@@ -0,0 +1,173 @@
+'''
+    On-disk cache of DataFrames converted from ROOT files.
+    Entries are stored as Arrow IPC files and loaded with memory mapping.
+'''
+
+import os
+import re
+import json
+import hashlib
+import pandas as pd
+
+from torchic.utils.terminal_colors import TerminalColors as tc
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+_SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3, 'TB': 1024**4}
+
+def _parse_size(size) -> int:
+    '''
+        Convert a size given as a number of bytes or as a string (e.g. '10 GB') to bytes.
+    '''
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.fullmatch(r'\s*([0-9.]+)\s*([KMGT]?B)\s*', size.upper())
+    if match is None:
+        raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Invalid size {size}')
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+class DataFrameCache:
+    '''
+        Size-bounded, least-recently-used cache of DataFrames on disk.
+
+        Example:
+            cache = DataFrameCache('/tmp/torchic_cache', max_size='20 GB')
+            dataset = Dataset.from_root(files, 'O2track', 'DF_*', columns, cache=cache)
+            print(cache.info())
+    '''
+
+    EXTENSION = '.arrow'
+
+    def __init__(self, cache_dir: str = None, max_size='10 GB'):
+        '''
+            Args:
+                cache_dir (str): Directory of the cache. Defaults to $TORCHIC_CACHE_DIR or ~/.cache/torchic
+                max_size (int or str): Maximum total size of the cache, in bytes or as a string (e.g. '10 GB')
+        '''
+        if pa is None:
+            raise ImportError(tc.RED+'[ERROR]: '+tc.RESET+'pyarrow is required for the DataFrame cache.')
+        if cache_dir is None:
+            cache_dir = os.environ.get('TORCHIC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'torchic'))
+        self._cache_dir = cache_dir
+        self._max_size = _parse_size(max_size)
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @staticmethod
+    def key(files: list, **params) -> str:
+        '''
+            Build the cache key of a conversion. The key covers the path, size and modification time
+            of each input file and all the given parameters (tree name, folder pattern, columns, ...).
+        '''
+        file_info = []
+        for file in files:
+            stat = os.stat(file)
+            file_info.append([os.path.abspath(file), stat.st_size, stat.st_mtime_ns])
+        payload = json.dumps({'files': file_info, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key + self.EXTENSION)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def load(self, key: str, storage: str = None) -> pd.DataFrame | None:
+        '''
+            Load an entry with memory mapping. Returns None if the entry is not cached.
+            With storage='arrow', the returned columns are pyarrow-backed views of the memory-mapped file.
+        '''
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        print(tc.GREEN+'[INFO]: '+tc.RESET+'Loading from cache: '+tc.UNDERLINE+tc.BLUE+path+tc.RESET)
+        # the table buffers keep the memory map alive, so the source must not be closed here
+        source = pa.memory_map(path, 'r')
+        table = pa.ipc.open_file(source).read_all()
+        os.utime(path)  # the modification time tracks the last access for the LRU eviction
+        if storage == 'arrow':
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        return table.to_pandas(split_blocks=True)
+
+    def store(self, key: str, df: pd.DataFrame, description: str = '') -> None:
+        '''
+            Store a DataFrame in the cache and evict the least recently used entries if the cache is too large.
+        '''
+        path = self._path(key)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            print(tc.MAGENTA+'[WARNING]: '+tc.RESET+f'DataFrame could not be cached: {e}')
+            return
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'torchic_description': description.encode()})
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _entries(self) -> list:
+        entries = []
+        for file in os.listdir(self._cache_dir):
+            if not file.endswith(self.EXTENSION):
+                continue
+            stat = os.stat(os.path.join(self._cache_dir, file))
+            entries.append((file[:-len(self.EXTENSION)], stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self) -> None:
+
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        while entries and total > self._max_size:
+            key, size, _ = entries.pop(0)
+            print(tc.GREEN+'[INFO]: '+tc.RESET+f'Evicting cache entry {key}')
+            os.remove(self._path(key))
+            total -= size
+
+    @property
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def info(self) -> pd.DataFrame:
+        '''
+            Describe the cache content, most recently used entries first.
+        '''
+        rows = []
+        for key, size, last_access in self._entries():
+            with pa.memory_map(self._path(key), 'r') as source:
+                schema = pa.ipc.open_file(source).schema
+            metadata = schema.metadata or {}
+            rows.append({
+                'key': key,
+                'size': size,
+                'last_access': pd.Timestamp(last_access, unit='s'),
+                'columns': len(schema.names),
+                'description': metadata.get(b'torchic_description', b'').decode(),
+            })
+        info = pd.DataFrame(rows, columns=['key', 'size', 'last_access', 'columns', 'description'])
+        return info.sort_values('last_access', ascending=False, ignore_index=True)
+
+    def remove(self, key: str) -> None:
+        if key in self:
+            os.remove(self._path(key))
+
+    def clear(self) -> None:
+        '''
+            Remove all the entries of the cache.
+        '''
+        for key, _, _ in self._entries():
+            os.remove(self._path(key))
+        print(tc.GREEN+'[INFO]: '+tc.RESET+f'Cleared cache {self._cache_dir}')
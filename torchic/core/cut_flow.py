@@ -0,0 +1,123 @@
+'''
+    Cut flow: an ordered list of cuts applied in a single pass, with per-cut accounting.
+'''
+
+import numpy as np
+import pandas as pd
+from ROOT import TH1D
+
+from torchic.utils.terminal_colors import TerminalColors as tc
+
+class CutFlow:
+    '''
+        Ordered list of cuts. Each cut is evaluated once to a boolean mask on the unfiltered dataset, the masks
+        are combined cumulatively to count the entries surviving each step, and the dataset is compacted only
+        once at the end.
+
+        Example:
+            cut_flow = CutFlow({'pt': 'fPt > 0.5', 'eta': 'abs(fEta) < 0.8', 'pid': 'abs(fNSigmaTPC) < 3'})
+            cut_flow.apply(dataset)
+            print(cut_flow.table())
+            h_cut_flow = cut_flow.to_th1('hCutFlow')
+    '''
+
+    def __init__(self, cuts=None):
+        '''
+            Args:
+                cuts (list or dict): The cut expressions (pandas query syntax), in order. With a dict,
+                    the keys are used as cut names, otherwise the expressions are.
+        '''
+        self._cuts = {}
+        self._counts = None
+        if isinstance(cuts, dict):
+            for name, expr in cuts.items():
+                self.add_cut(expr, name)
+        elif cuts is not None:
+            for expr in cuts:
+                self.add_cut(expr)
+
+    def add_cut(self, expr: str, name: str = None):
+
+        name = expr if name is None else name
+        if name in self._cuts:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Cut {name} already exists')
+        self._cuts[name] = expr
+        self._counts = None
+
+    @property
+    def cuts(self) -> dict:
+        return self._cuts
+
+    @property
+    def counts(self) -> list | None:
+        '''
+            Number of entries before any cut and after each cut, once evaluated.
+        '''
+        return self._counts
+
+    def evaluate(self, dataset) -> np.ndarray:
+        '''
+            Evaluate the cuts on a dataset and count the surviving entries after each of them.
+
+            Args:
+                dataset (Dataset): The dataset (pandas or polars engine)
+
+            Returns:
+                np.ndarray: Boolean mask of the entries passing all the cuts
+        '''
+        mask = np.ones(len(dataset.data), dtype=bool)
+        counts = [len(mask)]
+        for expr in self._cuts.values():
+            mask &= dataset._subset_mask(expr)
+            counts.append(int(np.count_nonzero(mask)))
+        self._counts = counts
+        return mask
+
+    def apply(self, dataset, *, inplace: bool = True):
+        '''
+            Evaluate the cuts and keep the entries passing all of them.
+
+            Args:
+                dataset (Dataset): The dataset (pandas or polars engine)
+                inplace (bool): Whether to modify the dataset in place. Otherwise a new dataset is returned.
+        '''
+        mask = self.evaluate(dataset)
+        if inplace:
+            dataset._compact(mask)
+        else:
+            return type(dataset)(dataset._subset_select(mask))
+
+    def table(self) -> pd.DataFrame:
+        '''
+            Cut flow table: entries after each cut, efficiency relative to the total (absolute) and
+            to the previous step (relative).
+        '''
+        if self._counts is None:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'The cut flow has not been evaluated yet.')
+        counts = np.array(self._counts, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            absolute = counts / counts[0]
+            relative = counts / np.concatenate([counts[:1], counts[:-1]])
+        return pd.DataFrame({
+            'cut': ['none'] + list(self._cuts.values()),
+            'entries': self._counts,
+            'absolute_efficiency': absolute,
+            'relative_efficiency': relative,
+        }, index=pd.Index(['all'] + list(self._cuts.keys()), name='name'))
+
+    def to_th1(self, name: str = 'cut_flow', title: str = 'Cut flow;;Entries') -> TH1D:
+        '''
+            Cut flow histogram, one labelled bin per step.
+        '''
+        if self._counts is None:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'The cut flow has not been evaluated yet.')
+        labels = ['all'] + list(self._cuts.keys())
+        hist = TH1D(name, title, len(labels), 0, len(labels))
+        for ibin, (label, count) in enumerate(zip(labels, self._counts), start=1):
+            hist.GetXaxis().SetBinLabel(ibin, label)
+            hist.SetBinContent(ibin, count)
+        hist.SetEntries(self._counts[0])
+        return hist
+
+    def __repr__(self) -> str:
+        return f'CutFlow({list(self._cuts.keys())})'
@@ -1,139 +1,858 @@
+import ast
+import io
+import re
+import time
+import tokenize
+from functools import lru_cache
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
 import pandas as pd
 import uproot
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_dataset
+    import pyarrow.fs as pa_fs
+except ImportError:
+    pa = None
+    pa_dataset = None
 import boost_histogram as bh
 from ROOT import TH1F, TH2F
 
-from torchic.core.histogram import AxisSpec, build_TH1, build_TH2, build_boost1, build_boost2
+from torchic.core.cache import DataFrameCache
+from torchic.core.cut_flow import CutFlow
+from torchic.core.subset_mask import SubsetMask
+from torchic.core.slice_stats import slice_stats_from_columns
+from torchic.core.histogram import FILL_BLOCK_SIZE, AxisSpec, HistSpec, as_array, build_TH1, build_TH2, build_THn, build_boost1, build_boost2, _MultiFill
 from torchic.utils.terminal_colors import TerminalColors as tc
+from torchic.utils.timeit import print_timing_summary
+
+class _SubsetExpression:
+    '''
+        Subset defined as a composition of other subsets, e.g. 'pion & ~central'.
+    '''
+
+    def __init__(self, expr: str):
+        self.expr = expr
+        self.tree = ast.parse(expr, mode='eval')
+
+def _evaluate_subset_expression(node, lookup) -> SubsetMask:
+
+    if isinstance(node, ast.Expression):
+        return _evaluate_subset_expression(node.body, lookup)
+    if isinstance(node, ast.Name):
+        return lookup(node.id)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Invert, ast.Not)):
+        return ~_evaluate_subset_expression(node.operand, lookup)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr, ast.BitXor)):
+        left = _evaluate_subset_expression(node.left, lookup)
+        right = _evaluate_subset_expression(node.right, lookup)
+        if isinstance(node.op, ast.BitAnd):
+            return left & right
+        return left | right if isinstance(node.op, ast.BitOr) else left ^ right
+    if isinstance(node, ast.BoolOp):
+        masks = [_evaluate_subset_expression(value, lookup) for value in node.values]
+        result = masks[0]
+        for mask in masks[1:]:
+            result = result & mask if isinstance(node.op, ast.And) else result | mask
+        return result
+    raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Unsupported subset expression: {ast.unparse(node)}')
 
 class SubsetDict:
     '''
-        A dictionary to access DataFrame subsets
+        A dictionary to access DataFrame subsets.
+        Row masks are stored packed in bits (N/8 bytes per subset). Boolean array conditions are packed when
+        the subset is added and follow the row selections of the dataset; expressions are evaluated the first
+        time they are used and cached until the dataset changes (see invalidate). The rows are selected only
+        for the requested columns. Subsets can be composed into new subsets with &, |, ^ and ~ (see combine).
     '''
 
-    def __init__(self):
+    def __init__(self, dataset):
 
+        self._dataset = dataset
         self._subsets = {}
+        self._masks = {}
 
     def add_subset(self, name, condition):
 
         if name in self._subsets.keys():
             raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subset {name} already exists')
+        if not isinstance(condition, (str, _SubsetExpression, SubsetMask)) and not (pl is not None and isinstance(condition, pl.Expr)):
+            # only the packed mask is kept, not the N-byte condition
+            condition = SubsetMask.from_bool(self._dataset._subset_mask(condition))
         self._subsets[name] = condition
 
+    def combine(self, name: str, expr: str):
+        '''
+            Add a subset composed of existing subsets, e.g. combine('pion_pos', 'pion & positive & ~central').
+            The composition is evaluated on the packed masks, without selecting any row of the dataset.
+
+            Args:
+                name (str): The name of the new subset
+                expr (str): Expression of subset names with &, |, ^, ~ (and, or, not) and parentheses
+        '''
+        condition = _SubsetExpression(expr)
+        names = {node.id for node in ast.walk(condition.tree) if isinstance(node, ast.Name)}
+        missing = names - set(self._subsets.keys())
+        if missing:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subsets {sorted(missing)} not defined')
+        self.add_subset(name, condition)
+
+    def bits(self, key) -> SubsetMask:
+        '''
+            Packed row mask of a subset.
+        '''
+        if key not in self._masks:
+            condition = self._subsets[key]
+            if isinstance(condition, SubsetMask):
+                if len(condition) != len(self._dataset):
+                    raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subset mask of length {len(condition)} does not match the dataset ({len(self._dataset)} rows).')
+                return condition
+            if isinstance(condition, _SubsetExpression):
+                self._masks[key] = _evaluate_subset_expression(condition.tree, self.bits)
+            else:
+                self._masks[key] = SubsetMask.from_bool(self._dataset._subset_mask(condition))
+        return self._masks[key]
+
+    def mask(self, key) -> np.ndarray:
+        '''
+            Boolean row mask of a subset.
+        '''
+        return self.bits(key).to_bool()
+
+    def count(self, key) -> int:
+        '''
+            Number of rows of a subset.
+        '''
+        return self.bits(key).count()
+
+    def counts(self) -> pd.Series:
+        '''
+            Number of rows of each subset.
+        '''
+        return pd.Series({key: self.count(key) for key in self._subsets}, dtype=np.int64)
+
+    def get(self, key, columns=None):
+        '''
+            Rows of a subset, for a single column (str), a list of columns or all the columns (None).
+        '''
+        return self._dataset._subset_select(self.mask(key), columns)
+
+    def invalidate(self, rows: np.ndarray = None):
+        '''
+            Drop the cached masks. Called whenever the rows or columns of the dataset change.
+
+            Args:
+                rows (np.ndarray, optional): Boolean mask of the rows kept, if the rows of the dataset changed.
+                    The packed masks of the array conditions are reduced to these rows.
+        '''
+        self._masks.clear()
+        if rows is None:
+            return
+        for name, condition in self._subsets.items():
+            if isinstance(condition, SubsetMask):
+                self._subsets[name] = SubsetMask.from_bool(condition.to_bool()[rows])
+
+    def keys(self):
+        return self._subsets.keys()
+
+    def __contains__(self, key) -> bool:
+        return key in self._subsets
+
     def __getitem__(self, key):
-        return self._subsets[key]()
+        return self.get(key)
+
+#############################################################
+
+def _as_files_list(files) -> list:
+
+    if isinstance(files, str) or (isinstance(files, list) and all(isinstance(file, str) for file in files)):
+        return files if isinstance(files, list) else [files]
+    raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'Input data must be a string or a list of strings.')
+
+def _root_tree_paths(files_list: list, tree_name: str, folder_name: str) -> list:
+    '''
+        Resolve the list of uproot object paths ('file:folder/tree') to read.
+        If folder_name ends with '*', all top-level folders starting with the given base are used
+        (only the highest cycle of each folder is kept).
+    '''
+
+    wildcard = folder_name.endswith('*')
+    base = folder_name[:-1] if wildcard else folder_name
+    paths = []
+    for file in files_list:
+        if not wildcard:
+            paths.append(f'{file}:{folder_name}/{tree_name}')
+            continue
+
+        with uproot.open(file) as f:
+            keys = list(f.keys())
+        _file_folders = [folder for folder in keys if (folder.startswith(base) and '/' not in folder)]
+        file_folders_duplicated = [folder.split(';')[0] for folder in _file_folders] # list with potentially duplicated folders
+        seen = {}
+        for idx, val in enumerate(file_folders_duplicated):
+            if val not in seen:
+                seen[val] = idx
+        file_folders = [_file_folders[idx] for idx in seen.values()]
+
+        if not file_folders:
+            print(tc.RED+'[WARNING]: '+tc.RESET+f'No folders matching "{base}*" in {file}, skipping.')
+        for folder in file_folders:
+            paths.append(f'{file}:{folder}/{tree_name}')
+    return paths
+
+def _expression_columns(expr: str) -> set:
+    '''
+        Names referenced by a pandas query/eval expression (function names and @local variables excluded).
+    '''
+
+    quoted = set(re.findall(r'`([^`]*)`', expr))
+    cleaned = re.sub(r'`[^`]*`', '_', expr)
+    cleaned = re.sub(r'@\w+', '_', cleaned)
+    tree = ast.parse(cleaned.strip(), mode='eval')
+    functions = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and id(node) not in functions}
+    return (names - {'_'}) | quoted
+
+class _BitwiseRewriter(ast.NodeTransformer):
+    '''
+        Rewrite the boolean operators of a pandas query expression ('and', 'or', 'not', chained comparisons)
+        as the element-wise operators '&', '|', '~', so that it can be evaluated on arrays or expressions.
+    '''
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return result
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        comparisons = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            comparisons.append(ast.Compare(left=left, ops=[op], comparators=[right]))
+            left = right
+        result = comparisons[0]
+        for comparison in comparisons[1:]:
+            result = ast.BinOp(left=result, op=ast.BitAnd(), right=comparison)
+        return result
+
+def _replace_booleans(expr: str) -> str:
+    '''
+        Replace '&' and '|' by 'and' and 'or', as pandas does before parsing, so that they bind looser than
+        the comparisons: 'x > 1 & y > 2' is '(x > 1) & (y > 2)', not 'x > (1 & y) > 2'.
+    '''
+    tokens = []
+    for token in tokenize.generate_tokens(io.StringIO(expr).readline):
+        if token.type == tokenize.OP and token.string in ('&', '|'):
+            tokens.append((tokenize.NAME, 'and' if token.string == '&' else 'or'))
+        else:
+            tokens.append((token.type, token.string))
+    return tokenize.untokenize(tokens)
+
+def _parse_expression(expr: str) -> tuple:
+    '''
+        Parse a pandas query/eval expression into an element-wise Python AST.
+        Backtick-quoted column names are replaced by placeholder identifiers, and the operators
+        follow the pandas precedence ('&' and '|' bind looser than the comparisons).
+
+        Returns:
+            tuple: (ast.Expression, map placeholder -> column name)
+    '''
+
+    quoted = {}
+    def _placeholder(match):
+        name = f'__column_{len(quoted)}'
+        quoted[name] = match.group(1)
+        return name
+    cleaned = _replace_booleans(re.sub(r"`([^`]*)`", _placeholder, expr))
+    tree = ast.parse(cleaned.strip(), mode='eval')
+    tree = ast.fix_missing_locations(_BitwiseRewriter().visit(tree))
+    return tree, quoted
+
+_EXPRESSION_FUNCTIONS = {name: getattr(np, name) for name in [
+    'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2', 'sinh', 'cosh', 'tanh', 'arcsinh', 'arccosh',
+    'arctanh', 'exp', 'expm1', 'log', 'log1p', 'log10', 'sqrt', 'abs', 'floor', 'ceil', 'where',
+]}
+_EXPRESSION_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Constant,
+                     ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.BitAnd, ast.BitOr,
+                     ast.unaryop, ast.cmpop)
+NUMEXPR_MIN_ENTRIES = 1 << 20
+
+def _kernel_array(series) -> np.ndarray | None:
+    '''
+        Numeric numpy view of a column for a compiled expression, or None if the column needs the pandas semantics
+        (nulls, strings, objects).
+    '''
+    if not isinstance(series, pd.Series):
+        return None
+    if isinstance(series.dtype, pd.ArrowDtype) and series.array.__arrow_array__().null_count > 0:
+        return None
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and not isinstance(series.dtype, pd.ArrowDtype):
+        return None
+    values = as_array(series)
+    return values if values.dtype.kind in 'biuf' else None
+
+def _numexpr_array(values: np.ndarray) -> np.ndarray | None:
+    '''
+        Cast an array to one of the types supported by numexpr (bool, int32, int64, float32, float64).
+    '''
+    kind, itemsize = values.dtype.kind, values.dtype.itemsize
+    if kind == 'b' or values.dtype in (np.int32, np.int64, np.float32, np.float64):
+        return values
+    if kind == 'f':
+        return values.astype(np.float32)
+    if (kind == 'i' and itemsize < 4) or (kind == 'u' and itemsize < 4):
+        return values.astype(np.int32)
+    if kind == 'u' and itemsize == 4:
+        return values.astype(np.int64)
+    return None
+
+class _FloatConstants(ast.NodeTransformer):
+    '''
+        Replace the float constants of an expression with named inputs, so that numexpr does not promote
+        float32 columns to float64 (pandas casts the constants to float32 in that case).
+    '''
+
+    def __init__(self):
+        self.constants = {}
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, float):
+            name = f'__constant_{len(self.constants)}'
+            self.constants[name] = node.value
+            return ast.Name(id=name, ctx=ast.Load())
+        return node
+
+class _CompiledExpression:
+    '''
+        A query/eval expression parsed once. The column references are resolved and the expression is
+        compiled to a numpy code object; numexpr kernels are compiled on demand and cached by input dtypes.
+    '''
+
+    def __init__(self, expr: str, tree: ast.Expression, placeholders: dict):
+
+        self.expr = expr
+        functions = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+        self._variables = list(dict.fromkeys(node.id for node in ast.walk(tree)
+                                             if isinstance(node, ast.Name) and id(node) not in functions))
+        self.columns = [placeholders.get(variable, variable) for variable in self._variables]
+        self._code = compile(tree, '<expression>', 'eval')
+
+        rewriter = _FloatConstants()
+        numexpr_tree = rewriter.visit(ast.parse(ast.unparse(tree), mode='eval'))
+        self._numexpr_source = ast.unparse(numexpr_tree)
+        self._constants = rewriter.constants
+        self._kernels = {}
+
+    def _evaluate_numexpr(self, arrays: list) -> np.ndarray | None:
+
+        arrays = [_numexpr_array(values) for values in arrays]
+        if any(values is None for values in arrays):
+            return None
+        float_dtypes = {values.dtype for values in arrays if values.dtype.kind == 'f'}
+        constant_dtype = np.float32 if float_dtypes == {np.dtype(np.float32)} else np.float64
+        constants = [constant_dtype(value) for value in self._constants.values()]
+
+        key = tuple(values.dtype.str for values in arrays) + (np.dtype(constant_dtype).str,)
+        if key not in self._kernels:
+            types = {np.dtype(bool): bool, np.dtype(np.int32): np.int32, np.dtype(np.int64): np.int64,
+                     np.dtype(np.float32): float, np.dtype(np.float64): np.float64}
+            signature = [(variable, types[values.dtype]) for variable, values in zip(self._variables, arrays)]
+            signature += [(name, types[np.dtype(constant_dtype)]) for name in self._constants]
+            try:
+                self._kernels[key] = ne.NumExpr(self._numexpr_source, signature=signature, truediv=True)
+            except Exception:
+                self._kernels[key] = None
+        kernel = self._kernels[key]
+        return None if kernel is None else kernel(*arrays, *constants)
+
+    def evaluate(self, frame: pd.DataFrame) -> np.ndarray | None:
+        '''
+            Evaluate the expression on a DataFrame. Returns None if the expression cannot be evaluated
+            with the compiled kernels, in which case pandas should be used.
+        '''
+        if not self._variables or not all(column in frame.columns for column in self.columns):
+            return None
+        arrays = [_kernel_array(frame[column]) for column in self.columns]
+        if any(values is None for values in arrays):
+            return None
+
+        # numpy keeps the narrow integer types and wraps around (uint8 200 * 100 = 32), while pandas evaluates
+        # them with numexpr: use the same kernels for these columns, or pandas itself if they are not available
+        narrow = any(values.dtype.kind in 'iu' and values.dtype.itemsize < 8 for values in arrays)
+        result = None
+        if ne is not None and (narrow or (len(frame) >= NUMEXPR_MIN_ENTRIES and ne.get_num_threads() > 1)):
+            result = self._evaluate_numexpr(arrays)
+            if result is not None and result.dtype.kind in 'iu':
+                result = result.astype(np.int64, copy=False)
+        if result is None:
+            if narrow:
+                return None
+            try:
+                with np.errstate(all='ignore'):
+                    result = eval(self._code, {'__builtins__': {}, **_EXPRESSION_FUNCTIONS}, dict(zip(self._variables, arrays)))
+            except Exception:
+                return None
+        if not isinstance(result, np.ndarray) or result.shape != (len(frame),):
+            return None
+        return result
+
+@lru_cache(maxsize=1024)
+def _compile_expression(expr: str) -> _CompiledExpression | None:
+    '''
+        Compile a pandas query/eval expression, once per expression string. Returns None for expressions
+        outside the element-wise subset handled by the compiler (@variables, 'in', strings, attributes, ...).
+    '''
+    if '@' in expr:
+        return None
+    try:
+        tree, placeholders = _parse_expression(expr)
+    except (SyntaxError, tokenize.TokenError):
+        return None
+    for node in ast.walk(tree):
+        if not isinstance(node, _EXPRESSION_NODES) or isinstance(node, (ast.In, ast.NotIn, ast.Is, ast.IsNot)):
+            return None
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (bool, int, float)):
+            return None
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.func.id not in _EXPRESSION_FUNCTIONS or node.keywords):
+            return None
+    return _CompiledExpression(expr, tree, placeholders)
+
+def _eval_frame(frame: pd.DataFrame, expr: str, **kwargs) -> pd.Series:
+    '''
+        DataFrame.eval through the expression compiler, falling back to pandas when needed.
+    '''
+    compiled = None if kwargs else _compile_expression(expr)
+    result = compiled.evaluate(frame) if compiled is not None else None
+    if result is None:
+        return frame.eval(expr, **kwargs)
+    return pd.Series(result, index=frame.index)
+
+def _query_mask(frame: pd.DataFrame, expr: str, **kwargs) -> np.ndarray:
+    '''
+        Boolean mask of the rows selected by DataFrame.query, through the expression compiler.
+    '''
+    compiled = None if kwargs else _compile_expression(expr)
+    mask = compiled.evaluate(frame) if compiled is not None else None
+    if mask is None or mask.dtype != bool:
+        mask = np.asarray(frame.eval(expr, **kwargs), dtype=bool)
+    return mask
+
+def _query_frame(frame: pd.DataFrame, expr: str, **kwargs) -> pd.DataFrame:
+    '''
+        DataFrame.query through the expression compiler, falling back to pandas when needed.
+    '''
+    compiled = None if kwargs else _compile_expression(expr)
+    mask = compiled.evaluate(frame) if compiled is not None else None
+    if mask is None or mask.dtype != bool:
+        return frame.query(expr, **kwargs)
+    return frame.take(np.flatnonzero(mask))
+
+def _cut_columns(cut: str, columns: list, available: list) -> tuple:
+    '''
+        Columns to read in order to apply a cut, and columns to drop once it has been applied.
+
+        Args:
+            cut (str): The selection expression
+            columns (list): The exact list of requested columns (None for all)
+            available (list): The columns available in the source
+
+        Returns:
+            tuple: (columns to read, columns to drop after the cut)
+    '''
+
+    if columns is None:
+        return None, []
+    extra = [column for column in _expression_columns(cut) if column not in columns and column in available]
+    return list(columns) + extra, extra
+
+def _apply_cut(chunks, cut: str, drop: list) -> list:
+    '''
+        Apply the cut to each chunk as soon as it is produced, so that only passing rows are kept.
+    '''
+
+    selected = []
+    for chunk in chunks:
+        chunk = _query_frame(chunk, cut)
+        if drop:
+            chunk = chunk.drop(columns=drop)
+        selected.append(chunk)
+    return selected
+
+def _read_root_tree(path: str, columns: list, cut: str, step_size, uproot_kwargs: dict) -> tuple:
+    '''
+        Read a single tree ('file:folder/tree') into a DataFrame.
+        If a cut is given, the tree is read in chunks of step_size and the cut is applied to each chunk.
+        Defined at module level so that it can be dispatched to a process pool.
+
+        Returns:
+            tuple: (DataFrame, elapsed time in seconds)
+    '''
+
+    start = time.time()
+    print(tc.GREEN+'[INFO]: '+tc.RESET+'Opening file: '+tc.UNDERLINE+tc.BLUE+path+tc.RESET)
+    tree = uproot.open(path)
+    if cut is None:
+        df = tree.arrays(filter_name=columns, library='pd', **uproot_kwargs)
+        return df, time.time() - start
+
+    selected_columns = tree.keys(filter_name=columns) if columns is not None else None
+    read_columns, drop = _cut_columns(cut, selected_columns, tree.keys())
+    chunks = tree.iterate(filter_name=read_columns, library='pd', step_size=step_size, **uproot_kwargs)
+    dfs = _apply_cut(chunks, cut, drop)
+    if dfs:
+        df = pd.concat(dfs, ignore_index=True, copy=False)
+    else:
+        df = tree.arrays(filter_name=selected_columns, library='pd', entry_stop=0)
+    return df, time.time() - start
+
+def _read_file(file: str, kwargs: dict, cut: str = None) -> pd.DataFrame:
+
+    print(tc.GREEN+'[INFO]: '+tc.RESET+'Opening file: '+tc.UNDERLINE+tc.BLUE+file+tc.RESET)
+    reader = pd.read_csv if file.endswith('.csv') else pd.read_parquet
+    if cut is None:
+        return reader(file, **kwargs)
+
+    # read_csv selects columns with usecols, read_parquet with columns
+    columns_key = 'usecols' if file.endswith('.csv') else 'columns'
+    columns = kwargs.get(columns_key, None)
+    if columns is not None and not callable(columns):
+        read_columns = list(columns) + [column for column in _expression_columns(cut) if column not in columns]
+        df = reader(file, **{**kwargs, columns_key: read_columns})
+        drop = [column for column in read_columns if column not in columns and column in df.columns]
+    else:
+        df = reader(file, **kwargs)
+        drop = []
+    return _apply_cut([df], cut, drop)[0]
+
+def _read_parquet_dataset(files: list, columns: list = None, memory_map: bool = False, cut: str = None, **kwargs) -> pd.DataFrame:
+    '''
+        Read a list of parquet files as a single pyarrow dataset. Only the requested columns are read
+        and the files are scanned with the pyarrow thread pool.
+
+        Args:
+            files (list): The parquet files
+            columns (list): The columns to read (all if None)
+            memory_map (bool): Whether to memory-map the (local) files
+            cut (str): Selection applied to each record batch before concatenation
+            **kwargs: Additional keyword arguments to be passed to pyarrow.dataset.Dataset.to_table (to_batches if cut is given)
+    '''
+
+    if pa_dataset is None:
+        raise ImportError(tc.RED+'[ERROR]: '+tc.RESET+'pyarrow is required for the pyarrow parquet backend.')
+
+    print(tc.GREEN+'[INFO]: '+tc.RESET+f'Opening {len(files)} parquet files with pyarrow.dataset')
+    filesystem = pa_fs.LocalFileSystem(use_mmap=True) if memory_map else None
+    dataset = pa_dataset.dataset(files, format='parquet', filesystem=filesystem)
+    if cut is None:
+        table = dataset.to_table(columns=columns, **kwargs)
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    read_columns, drop = _cut_columns(cut, columns, dataset.schema.names)
+    batches = (batch.to_pandas() for batch in dataset.to_batches(columns=read_columns, **kwargs))
+    dfs = _apply_cut(batches, cut, drop)
+    if not dfs:
+        return dataset.schema.empty_table().to_pandas()[columns if columns is not None else dataset.schema.names]
+    return pd.concat(dfs, ignore_index=True, copy=False)
+
+def _convert_storage(df: pd.DataFrame, storage: str) -> pd.DataFrame:
+    '''
+        Convert the columns of a DataFrame to the requested storage, one column at a time: the columns already in
+        the requested storage are shared with the input, and the DataFrame is not consolidated.
+            - 'arrow': pyarrow-backed columns (pd.ArrowDtype). Numeric numpy columns are wrapped without copy.
+            - 'numpy': numpy-backed columns in their native dtype. Numeric arrow columns without nulls are viewed without copy.
+            - None: the DataFrame is left untouched.
+    '''
+
+    if storage is None:
+        return df
+    if storage == 'arrow':
+        if pa is None:
+            raise ImportError(tc.RED+'[ERROR]: '+tc.RESET+'pyarrow is required for the arrow storage.')
+        columns = {column: series.array if isinstance(series.dtype, pd.ArrowDtype)
+                   else pd.arrays.ArrowExtensionArray(pa.array(series, from_pandas=True))
+                   for column, series in df.items()}
+    elif storage == 'numpy':
+        arrow_columns = [column for column, series in df.items() if isinstance(series.dtype, pd.ArrowDtype)]
+        if not arrow_columns:
+            return df
+        columns = {column: as_array(series) if column in arrow_columns else series.array
+                   for column, series in df.items()}
+    else:
+        raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Unknown storage {storage}: use "numpy" or "arrow".')
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+_DOWNCAST_INTEGER_DTYPES = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32]
+
+def _downcast_dtype(values: np.ndarray) -> np.dtype:
+    '''
+        Smallest dtype that represents all the values exactly. Integers are narrowed to the
+        smallest type covering their range, float64 to float32 only if every value round-trips.
+    '''
+
+    if values.dtype.kind in 'iu' and len(values) > 0:
+        vmin, vmax = values.min(), values.max()
+        for dtype in _DOWNCAST_INTEGER_DTYPES:
+            info = np.iinfo(dtype)
+            if np.dtype(dtype).itemsize >= values.dtype.itemsize:
+                break
+            if info.min <= vmin and vmax <= info.max:
+                return np.dtype(dtype)
+    elif values.dtype == np.float64:
+        narrowed = values.astype(np.float32)
+        if np.array_equal(narrowed.astype(np.float64), values, equal_nan=True):
+            return np.dtype(np.float32)
+    return values.dtype
+
+def _apply_dtype_policy(df: pd.DataFrame, policy) -> tuple:
+    '''
+        Cast the columns of a DataFrame according to a dtype policy.
+
+        Args:
+            df (pd.DataFrame): The input data
+            policy (dict or str): A map column -> dtype, or 'auto' to downcast every numeric column safely
+
+        Returns:
+            tuple: (converted DataFrame, memory report with the bytes per column before and after)
+    '''
+
+    if isinstance(policy, str):
+        if policy != 'auto':
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Unknown dtype policy {policy}: use "auto" or a column -> dtype map.')
+        targets = {}
+        for column in df.columns:
+            values = as_array(df[column])
+            if values.dtype.kind in 'iuf':
+                targets[column] = _downcast_dtype(values)
+    elif isinstance(policy, dict):
+        targets = {column: np.dtype(dtype) for column, dtype in policy.items()}
+    else:
+        raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'The dtype policy must be "auto" or a column -> dtype map.')
+
+    bytes_before = df.memory_usage(index=False, deep=True)
+    dtypes_before = df.dtypes.astype(str)
+    converted = {}
+    for column, dtype in targets.items():
+        if isinstance(df[column].dtype, pd.ArrowDtype):
+            if df[column].dtype.numpy_dtype != dtype:
+                converted[column] = df[column].astype(pd.ArrowDtype(pa.from_numpy_dtype(dtype)))
+        elif df[column].dtype != dtype:
+            converted[column] = df[column].astype(dtype)
+    if converted:
+        df = df.assign(**converted)
+
+    report = pd.DataFrame({
+        'dtype_before': dtypes_before,
+        'dtype_after': df.dtypes.astype(str),
+        'bytes_before': bytes_before,
+        'bytes_after': df.memory_usage(index=False, deep=True),
+    })
+    report['saved'] = report['bytes_before'] - report['bytes_after']
+    return df, report
+
+def _map_ordered(func, tasks: list, *args, n_workers: int = None, executor='thread') -> list:
+    '''
+        Apply func to each task, optionally over a thread or process pool.
+        The results are returned in the same order as the tasks.
+
+        Args:
+            func: Function called as func(task, *args)
+            tasks (list): The tasks to process
+            n_workers (int): Number of workers. If None or 1 (and no Executor instance is given), tasks run serially
+            executor (str or Executor): 'thread', 'process' or an Executor instance (not shut down here)
+    '''
+
+    iterables = [tasks] + [repeat(arg) for arg in args]
+    if isinstance(executor, Executor):
+        return list(executor.map(func, *iterables))
+    if n_workers is None or n_workers <= 1:
+        return list(map(func, *iterables))
+
+    if executor == 'thread':
+        pool_type = ThreadPoolExecutor
+    elif executor == 'process':
+        pool_type = ProcessPoolExecutor
+    else:
+        raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Unknown executor {executor}: use "thread", "process" or an Executor instance.')
+    with pool_type(max_workers=n_workers) as pool:
+        return list(pool.map(func, *iterables))
 
 #############################################################
 
 class Dataset:
 
-    def __init__(self, data, **kwargs):
+    def __new__(cls, data=None, *args, engine: str = 'pandas', **kwargs):
+        if cls is Dataset and engine == 'polars':
+            return super().__new__(PlDataset)
+        return super().__new__(cls)
+
+    def __init__(self, data, storage: str = None, dtypes=None, engine: str = 'pandas', **kwargs):
         '''
             Constructor for the Dataset class.
             
             Args:
                 data (str, list, or pd.DataFrame): The input data to be loaded. If a string, it should be the path to a single file. If a list, it should be a list of paths to multiple files. If a pd.DataFrame, it should be the data itself.
+                storage (str): Column storage. 'arrow' keeps pyarrow-backed columns (pd.ArrowDtype) that are handed to the
+                    histogram builders without copies, 'numpy' uses numpy arrays in their native dtype. If None, the data are kept as loaded.
+                dtypes (dict or str): dtype policy applied at load time, see apply_dtype_policy.
+                engine (str): 'pandas' (default) or 'polars'. With 'polars', a PlDataset is returned, exposing the same API
+                    on top of a polars DataFrame.
                 **kwargs: Additional keyword arguments to be passed to the pandas read_csv or read_parquet functions.
                     - columns (list): The list of columns to read from the file.
                     - folder_name (str): The name of the folder in the root file.
                     - tree_name (str): The name of the tree in the root file.
+                    - n_workers (int): Number of concurrent file reads (default: serial).
+                    - executor (str or Executor): 'thread', 'process' or an Executor instance used for concurrent reads.
+                    - parquet_backend (str): 'pandas' (default) or 'pyarrow'. The latter scans all the files as a single
+                        pyarrow dataset, reading only the requested columns.
+                    - memory_map (bool): Memory-map local files (pyarrow backend only).
+                    - cut (str): Selection applied to each file (record batch for the pyarrow backend) before concatenation.
+                        Columns only needed by the cut are dropped afterwards.
         '''
         
+        if engine != 'pandas':
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Unknown engine {engine}: use "pandas" or "polars".')
         self._data = pd.DataFrame()
+        self._subsets = SubsetDict(self)
         self._open(data, **kwargs)
-        self._subsets = SubsetDict()
+        self._dtype_report = None
+        if dtypes is not None:
+            self.apply_dtype_policy(dtypes)
+        self._data = _convert_storage(self._data, storage)
 
     def __getitem__(self, key):
         if ':' in key:
             key1, key2 = key.split(':')
-            subset = self._subsets[key1]
-            return subset[key2] if key2 else subset
+            return self._subsets.get(key1, key2 if key2 else None)
         return self._data[key]
     
     def __setitem__(self, key, value):
         self._data[key] = value
+        self._subsets.invalidate()
 
-    def _open(self, data, **kwargs):
+    def _open(self, data, n_workers: int = None, executor='thread', parquet_backend: str = 'pandas', memory_map: bool = False, cut: str = None, **kwargs):
 
         if isinstance(data, pd.DataFrame):
             self._data = data
         elif isinstance(data, str) or (isinstance(data, list) and all(isinstance(file, str) for file in data)):
             self._files = data if isinstance(data, list) else [data]
             for file in self._files:
-                if file.endswith('.csv'):
-                    print(tc.GREEN+'[INFO]: '+tc.RESET+'Opening file: '+tc.UNDERLINE+tc.BLUE+file+tc.RESET)
-                    self._data = pd.concat([self._data, pd.read_csv(file, **kwargs)], ignore_index=True, copy=False)
-                elif file.endswith('.parquet'):
-                    print(tc.GREEN+'[INFO]: '+tc.RESET+'Opening file: '+tc.UNDERLINE+tc.BLUE+file+tc.RESET)
-                    self._data = pd.concat([self._data, pd.read_parquet(file, **kwargs)], ignore_index=True, copy=False)
-                else:
-                    raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'Input data must be a list of .root or .csv files.')
+                if not (file.endswith('.csv') or file.endswith('.parquet')):
+                    raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'Input data must be a list of .parquet or .csv files.')
+
+            if parquet_backend == 'pyarrow':
+                if not all(file.endswith('.parquet') for file in self._files):
+                    raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'The pyarrow backend only supports .parquet files.')
+                self._data = _read_parquet_dataset(self._files, memory_map=memory_map, cut=cut, **kwargs)
+            elif parquet_backend == 'pandas':
+                dfs = _map_ordered(_read_file, self._files, kwargs, cut, n_workers=n_workers, executor=executor)
+                self._data = pd.concat(dfs, ignore_index=True, copy=False) if dfs else pd.DataFrame()
+            else:
+                raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Unknown parquet backend {parquet_backend}: use "pandas" or "pyarrow".')
         else:
             raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'Input data must be a string, a list of strings, or a pandas DataFrame.')
         
     @classmethod
-    def from_root(cls, files, tree_name: str, folder_name: str = None, columns: list = None, **kwargs) -> 'Dataset':
+    def from_root(cls, files, tree_name: str, folder_name: str = None, columns: list = None,
+                  n_workers: int = None, executor='thread', cut: str = None, step_size='100 MB',
+                  cache=None, storage: str = None, dtypes=None, engine: str = 'pandas', **kwargs) -> 'Dataset':
         """
         Improved from_root: collects DataFrames in a list, uses uproot.concatenate when possible,
         handles missing trees, and concatenates once at the end.
+
+        When folder_name is given, each (file, folder) tree is an independent read task. With n_workers > 1
+        (or an Executor instance) the tasks are spread over a thread ('thread') or process ('process') pool.
+        The concatenation order is always the order of the tasks, and a timing summary is printed at the end.
+
+        If a cut expression is given (pandas query syntax), each tree is read in chunks of step_size and the cut
+        is applied to every chunk before concatenation. Columns only needed by the cut are dropped afterwards.
+
+        cache (bool, str or DataFrameCache): Opt-in on-disk cache of the converted DataFrame. True uses the default
+        cache directory, a string is used as cache directory. A cache hit is memory-mapped instead of read with uproot.
+
+        storage (str): Column storage of the returned Dataset ('numpy', 'arrow' or None, see Dataset.__init__).
+        dtypes (dict or str): dtype policy applied to the loaded data ('auto' or a column -> dtype map, see apply_dtype_policy).
+        engine (str): 'pandas' (default) or 'polars' (returns a PlDataset).
         """
 
-        files_list = []
-        if isinstance(files, str) or (isinstance(files, list) and all(isinstance(file, str) for file in files)):
-            files_list = files if isinstance(files, list) else [files]
-        else: 
-            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'Input data must be a string or a list of strings.')
-        
+        files_list = _as_files_list(files)
         uproot_kwargs = {k: v for k, v in kwargs.items() if k not in ['tree_name', 'columns', 'folder_name']}
 
+        if cache is not None and cache is not False:
+            if not isinstance(cache, DataFrameCache):
+                cache = DataFrameCache() if cache is True else DataFrameCache(cache)
+            key = DataFrameCache.key(files_list, tree_name=tree_name, folder_name=folder_name, columns=columns,
+                                     cut=cut, uproot_kwargs=uproot_kwargs)
+            data = cache.load(key, storage=storage)
+            if data is None:
+                data = Dataset.from_root(files_list, tree_name, folder_name, columns, n_workers=n_workers, executor=executor,
+                                         cut=cut, step_size=step_size, **kwargs).data
+                cache.store(key, data, description=f'{tree_name} from {len(files_list)} file(s): {files_list[0]}')
+            return cls(data, storage=storage, dtypes=dtypes, engine=engine)
+
         # If no folder_name wildcard and multiple files, try uproot.concatenate in one shot
-        if folder_name is None:
+        if folder_name is None and cut is None:
             data = uproot.concatenate(
                 {file: tree_name for file in files_list},
                 filter_name=columns,
                 library="pd",
                 **uproot_kwargs
             )
-            return cls(data)
+            return cls(data, storage=storage, dtypes=dtypes, engine=engine)
 
         else:
-            dfs = []
-            wildcard = folder_name.endswith('*')
-            base = folder_name[:-1] if wildcard else folder_name
-            for file in files_list:
-                f = uproot.open(file)
-                
-                if wildcard:
-                    keys = list(f.keys())
-                    _file_folders = [folder for folder in keys if (folder.startswith(base) and '/' not in folder)]
-                    file_folders_duplicated = [folder.split(';')[0] for folder in _file_folders] # list with potentially duplicated folders
-                    seen = {}
-                    for idx, val in enumerate(file_folders_duplicated):
-                        if val not in seen:
-                            seen[val] = idx
-                    file_folders = [_file_folders[idx] for idx in seen.values()]
-
-                    if not file_folders:
-                        print(tc.RED+'[WARNING]: '+tc.RESET+f'No folders matching "{base}*" in {file}, skipping.')
-                    for folder in file_folders:
-                        path = f'{file}:{folder}/{tree_name}'
-                        print(tc.GREEN+'[INFO]: '+tc.RESET+'Opening file: '+tc.UNDERLINE+tc.BLUE+path+tc.RESET)
-                        df_temp = uproot.open(path).arrays(filter_name=columns, library='pd', **uproot_kwargs)
-                        dfs.append(df_temp)
-                        
-                else:
-                    path = f'{file}:{folder_name}/{tree_name}'
-                    print(tc.GREEN+'[INFO]: '+tc.RESET+'Opening file: '+tc.UNDERLINE+tc.BLUE+path+tc.RESET)
-                    df_temp = uproot.open(path).arrays(filter_name=columns, library='pd', **uproot_kwargs)
-                    dfs.append(df_temp)
+            if folder_name is None:
+                paths = [f'{file}:{tree_name}' for file in files_list]
+            else:
+                paths = _root_tree_paths(files_list, tree_name, folder_name)
+            start = time.time()
+            results = _map_ordered(_read_root_tree, paths, columns, cut, step_size, uproot_kwargs, n_workers=n_workers, executor=executor)
+            dfs = [df for df, _ in results]
+            print_timing_summary({path: elapsed for path, (_, elapsed) in zip(paths, results)}, wall_time=time.time()-start)
 
             try:
                 data = pd.concat(dfs, ignore_index=True, copy=False)
             except Exception as e:
                 print(tc.RED+'[ERROR]: '+tc.RESET+f'Concatenation failed: {e}, falling back to default concat.')
                 data = pd.concat(dfs, ignore_index=True)
-            return cls(data)      
+            return cls(data, storage=storage, dtypes=dtypes, engine=engine)
+
+    @classmethod
+    def stream_root(cls, files, tree_name: str, folder_name: str = None, columns: list = None, step_size='100 MB', **kwargs) -> 'DatasetStream':
+        '''
+            Open ROOT files in streaming mode. The data are read in chunks of step_size and
+            never fully loaded in memory (see DatasetStream).
+
+            Args:
+                files (str or list): The path(s) to the ROOT file(s)
+                tree_name (str): The name of the tree in the ROOT file
+                folder_name (str): The name of the folder containing the tree. A trailing '*' selects all matching folders
+                columns (list): The list of columns to read
+                step_size (int or str): Number of entries (int) or memory size (str, e.g. '100 MB') of each chunk
+                **kwargs: Additional keyword arguments to be passed to uproot.iterate
+        '''
+        return DatasetStream(files, tree_name, folder_name, columns, step_size=step_size, **kwargs)
     
     @classmethod
     def concat(cls, datasets: list, **kwargs) -> 'Dataset':
@@ -171,16 +890,77 @@ class Dataset:
     @property
     def subsets(self):
         return self._subsets
+
+    @property
+    def dtype_report(self) -> pd.DataFrame | None:
+        '''
+            Memory report of the last dtype policy applied to the dataset.
+        '''
+        return self._dtype_report
+
+    def apply_dtype_policy(self, policy, verbose: bool = True) -> pd.DataFrame:
+        '''
+            Cast the columns of the dataset according to a dtype policy.
+
+            Args:
+                policy (dict or str): An explicit map column -> dtype (e.g. {'fPartID': 'uint8'}), or 'auto'
+                    to scan the value ranges and downcast each numeric column to the smallest dtype
+                    that represents it exactly.
+                verbose (bool): Print the total memory before and after.
+
+            Returns:
+                pd.DataFrame: Memory report with dtypes and bytes per column, before and after.
+        '''
+        self._data, self._dtype_report = _apply_dtype_policy(self._data, policy)
+        self._subsets.invalidate()
+        if verbose:
+            before, after = self._dtype_report['bytes_before'].sum(), self._dtype_report['bytes_after'].sum()
+            print(tc.GREEN+'[INFO]: '+tc.RESET+f'dtype policy applied: {before/1024**2:.1f} MB -> {after/1024**2:.1f} MB')
+        return self._dtype_report
     
     def add_subset(self, name, condition):
         '''
             Add a subset to the dataset by applying a condition.
+
+            Args:
+                name (str): The name of the subset
+                condition (pd.Series, np.ndarray, SubsetMask or str): A boolean mask (a Series is aligned on the
+                    index of the dataset) or a string expression, evaluated with eval.
+                    To compose existing subsets, use dataset.subsets.combine(name, 'a & ~b').
         '''
-        self._subsets.add_subset(name, lambda: self._data.loc[condition])
+        self._subsets.add_subset(name, condition)
+
+    def _subset_mask(self, condition) -> np.ndarray:
+
+        if isinstance(condition, SubsetMask):
+            condition = condition.to_bool()
+        elif isinstance(condition, str):
+            condition = _eval_frame(self._data, condition)
+        if isinstance(condition, pd.Series):
+            if not condition.index.equals(self._data.index):
+                condition = condition.reindex(self._data.index, fill_value=False)
+            return condition.to_numpy(dtype=bool, na_value=False)
+        mask = np.asarray(condition, dtype=bool)
+        if len(mask) != len(self._data):
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subset mask of length {len(mask)} does not match the dataset ({len(self._data)} rows).')
+        return mask
+
+    def _subset_select(self, mask: np.ndarray, columns=None):
+
+        if columns is None:
+            return self._data.loc[mask]
+        return self._data.loc[mask, columns]
+
+    def _compact(self, mask: np.ndarray):
+
+        self._data = self._data.take(np.flatnonzero(mask))
+        self._subsets.invalidate(mask)
 
     def query(self, expr: str, *, inplace: bool = True, **kwargs) -> pd.DataFrame | None:
         '''
             Query the dataset using a string expression.
+            The expression is compiled once and cached (see _compile_expression); expressions that the compiler
+            does not handle, or calls with additional keyword arguments, go through pandas.
             
             Args:
                 expr (str): The query expression.
@@ -189,11 +969,26 @@ class Dataset:
         '''
         
         if inplace:
-            self._data.query(expr, inplace=True, **kwargs)
+            self._compact(_query_mask(self._data, expr, **kwargs))
         else:
-            tmp_data = self._data.query(expr, inplace=False, **kwargs).copy()
+            tmp_data = _query_frame(self._data, expr, **kwargs).copy()
             return Dataset(tmp_data)
 
+    def cut_flow(self, cuts) -> CutFlow:
+        '''
+            Apply an ordered list of cuts in a single pass, keeping track of the entries removed by each of them.
+            The dataset is compacted once, after all the cuts have been evaluated.
+
+            Args:
+                cuts (list, dict or CutFlow): The cut expressions, optionally by name (see CutFlow)
+
+            Returns:
+                CutFlow: The evaluated cut flow, see CutFlow.table and CutFlow.to_th1
+        '''
+        cut_flow = cuts if isinstance(cuts, CutFlow) else CutFlow(cuts)
+        cut_flow.apply(self, inplace=True)
+        return cut_flow
+
     def concat(self, other, **kwargs) -> 'Dataset':
         '''
             Concatenate two datasets.
@@ -222,14 +1017,14 @@ class Dataset:
     
     def eval(self, expr: str, **kwargs) -> pd.DataFrame:
         '''
-            Evaluate an expression in the dataset.
+            Evaluate an expression in the dataset, with the same compiled expressions as query.
 
             Args:
                 expr (str): The expression to evaluate.
                 **kwargs: Additional keyword arguments to be passed to the pandas eval function.
         '''
         
-        return self._data.eval(expr, **kwargs)
+        return _eval_frame(self._data, expr, **kwargs)
     
     def apply(self, func, **kwargs) -> pd.DataFrame:
         '''
@@ -252,7 +1047,10 @@ class Dataset:
         '''
         
         if inplace:
+            labels_before = self._data.index
             self._data.drop(labels=labels, axis=axis, index=index, columns=columns, level=level, inplace=True, errors=errors)
+            rows = labels_before.isin(self._data.index) if len(self._data) != len(labels_before) else None
+            self._subsets.invalidate(rows)
         else:
             return self._data.drop(labels=labels, axis=axis, index=index, columns=columns, level=level, inplace=False, errors=errors)
 
@@ -266,6 +1064,84 @@ class Dataset:
         
         return self._data.head(n)
 
+    def lazy(self, chunk_size: int = None) -> 'LazyDataset':
+        '''
+            Lazy view of the dataset: cuts, derived columns, subsets and histograms are booked
+            and executed in a single pass when run() is called (see LazyDataset).
+
+            Args:
+                chunk_size (int): Number of entries processed at once (default: all)
+        '''
+        return LazyDataset(self, chunk_size)
+
+    def build_many(self, specs: list) -> dict:
+        '''
+            Build many histograms in a single pass over the dataset.
+            The specs are grouped by subset and cut, so that each selection is evaluated once, and the dataset
+            is processed in blocks of FILL_BLOCK_SIZE entries: in each block and selection, every column is
+            widened to double precision once and binned once per distinct axis, and the bin indices are shared
+            by all the histograms that use them. ROOT histograms are accumulated in double precision over the
+            whole pass and written once at the end.
+
+            Args:
+                specs (list): The histogram specifications (HistSpec). Each spec can define a subset, a cut,
+                    a weights column and the backend ('root' or 'boost').
+
+            Returns:
+                dict: The filled histograms, by name
+
+            Example:
+                specs = [HistSpec('fPt', AxisSpec(100, 0, 10, 'hPt', ';#it{p}_{T};')),
+                         HistSpec('fPt', AxisSpec(100, 0, 10, 'hPtCentral', ';#it{p}_{T};'), subset='central'),
+                         HistSpec('fP', AxisSpec(100, 0, 10, 'hP', ''), 'fDeDx', AxisSpec(100, 0, 1000, 'hDeDx', ''))]
+                histograms = dataset.build_many(specs)
+        '''
+        histograms = {}
+        groups = {}
+        for spec in specs:
+            if spec.name in histograms:
+                raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Histogram {spec.name} defined twice')
+            if spec.subset is not None and spec.subset not in self._subsets:
+                raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subset {spec.subset} not defined')
+            histograms[spec.name] = spec.build()
+            groups.setdefault((spec.subset, spec.cut), []).append(spec)
+
+        selections = {}
+        for subset, cut in groups:
+            mask = self._subsets.mask(subset) if subset else None
+            if cut:
+                cut_mask = self._subset_mask(cut)
+                mask = cut_mask if mask is None else mask & cut_mask
+            selections[(subset, cut)] = None if mask is None else np.flatnonzero(mask)
+
+        columns = {column: as_array(self._data[column]) for spec in specs for column in spec.input_columns}
+        nentries = len(self._data)
+        filler = _MultiFill(specs, histograms, max(min(FILL_BLOCK_SIZE, nentries), 1))
+        for start in range(0, nentries, FILL_BLOCK_SIZE):
+            stop = min(start + FILL_BLOCK_SIZE, nentries)
+            for key, group in groups.items():
+                index = selections[key]
+                rows = slice(start, stop) if index is None else index[np.searchsorted(index, start):np.searchsorted(index, stop)]
+                input_columns = dict.fromkeys(column for spec in group for column in spec.input_columns)
+                filler.fill(group, {column: columns[column][rows] for column in input_columns})
+        filler.write()
+        return histograms
+
+    def _hist_inputs(self, columns: list, subset: str = None, weights=None) -> tuple:
+        '''
+            Columns to fill a histogram with, restricted to the subset, and the matching weights.
+            weights can be a column name or an array with one entry per row of the dataset.
+        '''
+        names = list(dict.fromkeys(columns + ([weights] if isinstance(weights, str) else [])))
+        frame = self._subsets.get(subset, names) if subset else self._data
+        if isinstance(weights, str):
+            weights = frame[weights]
+        elif weights is not None:
+            weights = as_array(weights)
+            if subset:
+                weights = weights[self._subsets.mask(subset)]
+        return [frame[column] for column in columns], weights
+
     def build_th1(self, column: str, axis_spec_x: AxisSpec, **kwargs) -> TH1F:
         '''
             Build a histogram with one axis
@@ -276,18 +1152,17 @@ class Dataset:
 
                 kwargs:
                     subset (str): The name of the subset to use for the histogram. If not provided, the full dataset is used.
+                    weights (str or np.ndarray): The weights column, or an array with one weight per row of the dataset.
                     name (str): The name of the histogram. If not provided, a default name is generated.
                     title (str): The title of the histogram. If not provided, a default title is generated.
+                    n_workers (int): Number of threads of a partitioned fill. 0 uses all the cores. If not provided, the fill runs on the calling thread.
 
     
             Returns:
                 TH1F: The histogram
         '''
-        subset = kwargs.get('subset', None)
-        if subset:
-            return build_TH1(self._subsets[subset][column], axis_spec_x, **kwargs)
-        else:
-            return build_TH1(self._data[column], axis_spec_x, **kwargs)
+        (data,), weights = self._hist_inputs([column], kwargs.get('subset', None), kwargs.get('weights', None))
+        return build_TH1(data, axis_spec_x, **{**kwargs, 'weights': weights})
         
     def build_th2(self, column_x: str, column_y: str, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec, **kwargs) -> TH2F:
         '''
@@ -301,17 +1176,16 @@ class Dataset:
 
                 kwargs:
                     subset (str): The name of the subset to use for the histogram. If not provided, the full dataset is used.
+                    weights (str or np.ndarray): The weights column, or an array with one weight per row of the dataset.
                     name (str): The name of the histogram. If not provided, a default name is generated.
                     title (str): The title of the histogram. If not provided, a default title is generated.
+                    n_workers (int): Number of threads of a partitioned fill. 0 uses all the cores. If not provided, the fill runs on the calling thread.
     
             Returns:
                 TH2F: The histogram
         '''
-        subset = kwargs.get('subset', None)
-        if subset:
-            return build_TH2(self._subsets[subset][column_x], self._subsets[subset][column_y], axis_spec_x, axis_spec_y, **kwargs)
-        else:
-            return build_TH2(self._data[column_x], self._data[column_y], axis_spec_x, axis_spec_y, **kwargs)
+        (data_x, data_y), weights = self._hist_inputs([column_x, column_y], kwargs.get('subset', None), kwargs.get('weights', None))
+        return build_TH2(data_x, data_y, axis_spec_x, axis_spec_y, **{**kwargs, 'weights': weights})
     
     def build_boost1d(self, column: str, axis_spec_x: AxisSpec, **kwargs) -> bh.Histogram:
         '''
@@ -320,15 +1194,17 @@ class Dataset:
             Args:
                 column (str): The column to be histogrammed
                 axis_spec_x (AxisSpec): The specification for the x-axis
+
+                kwargs:
+                    subset (str): The name of the subset to use for the histogram. If not provided, the full dataset is used.
+                    weights (str or np.ndarray): The weights column, or an array with one weight per row of the dataset.
+                    storage (bh.storage.Storage): The storage of the histogram (default: Weight() with weights, Double() otherwise).
     
             Returns:
                 TH1F: The histogram
         '''
-        subset = kwargs.get('subset', None)
-        if subset:
-            return build_boost1(self._subsets[subset][column], axis_spec_x)
-        else:
-            return build_boost1(self._data[column], axis_spec_x)
+        (data,), weights = self._hist_inputs([column], kwargs.get('subset', None), kwargs.get('weights', None))
+        return build_boost1(data, axis_spec_x, weights=weights, storage=kwargs.get('storage', None))
         
     def build_boost2d(self, column_x: str, column_y: str, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec, **kwargs) -> bh.Histogram:
         '''
@@ -337,12 +1213,631 @@ class Dataset:
             Args:
                 column (str): The column to be histogrammed
                 axis_spec_x (AxisSpec): The specification for the x-axis
+
+                kwargs: see build_boost1d
     
             Returns:
                 TH1F: The histogram
         '''
-        subset = kwargs.get('subset', None)
-        if subset:
-            return build_boost2(self._subsets[subset][column_x], self._subsets[subset][column_y], axis_spec_x, axis_spec_y)
+        (data_x, data_y), weights = self._hist_inputs([column_x, column_y], kwargs.get('subset', None), kwargs.get('weights', None))
+        return build_boost2(data_x, data_y, axis_spec_x, axis_spec_y, weights=weights, storage=kwargs.get('storage', None))
+
+    def build_thn(self, columns: list, axis_specs: list, **kwargs):
+        '''
+            Build a histogram with N axes (e.g. pt, eta, centrality, nsigma, cluster size for multi-differential corrections)
+
+            Args:
+                columns (list): The columns to be histogrammed, one per axis
+                axis_specs (list): The specification of each axis (AxisSpec)
+
+                kwargs:
+                    subset (str): The name of the subset to use for the histogram. If not provided, the full dataset is used.
+                    weights (str or np.ndarray): The weights column, or an array with one weight per row of the dataset.
+                    backend (str): 'boost' (default) for a dense boost histogram, 'root' for a THnSparseD
+                    name, title (str): Name and title of the THnSparseD
+
+            Returns:
+                bh.Histogram or THnSparseD: The histogram
+        '''
+        data, weights = self._hist_inputs(list(columns), kwargs.pop('subset', None), kwargs.pop('weights', None))
+        return build_THn(data, axis_specs, weights=weights, **kwargs)
+
+    def slice_stats(self, column_x: str, column_y: str, axis_spec_x: AxisSpec, **kwargs) -> pd.DataFrame:
+        '''
+            Mean, RMS, quantiles and truncated mean of a column in each bin of another one (see slice_stats_from_columns)
+
+            Args:
+                column_x (str): The column defining the slices
+                column_y (str): The column whose distribution is described in each slice
+                axis_spec_x (AxisSpec): The slices in x
+
+                kwargs:
+                    subset (str): The name of the subset to use. If not provided, the full dataset is used.
+                    weights (str or np.ndarray): The weights column, or an array with one weight per row of the dataset.
+                    quantiles, truncation, drop_empty: see slice_stats_from_columns
+
+            Returns:
+                pd.DataFrame: One row per slice, ready for create_graph
+        '''
+        (data_x, data_y), weights = self._hist_inputs([column_x, column_y], kwargs.pop('subset', None), kwargs.pop('weights', None))
+        return slice_stats_from_columns(data_x, data_y, axis_spec_x, weights=weights, **kwargs)
+
+
+#############################################################
+
+class DatasetStream:
+    '''
+        Chunked access to ROOT trees. Each chunk is exposed as a Dataset, while the booked
+        histograms are accumulated chunk by chunk. Peak memory depends on the chunk size only.
+
+        Example:
+            stream = Dataset.stream_root(files, 'O2track', 'DF_*', columns=['fPt', 'fEta'], step_size='200 MB')
+            stream.add_subset('central', 'abs(fEta) < 0.5')
+            stream.book_th1('fPt', AxisSpec(100, 0, 10, 'hPt', ';#it{p}_{T};'), subset='central')
+            histograms = stream.run()
+    '''
+
+    def __init__(self, files, tree_name: str, folder_name: str = None, columns: list = None, step_size='100 MB', **kwargs):
+
+        self._files = _as_files_list(files)
+        self._tree_name = tree_name
+        self._folder_name = folder_name
+        self._columns = columns
+        self._step_size = step_size
+        self._uproot_kwargs = {k: v for k, v in kwargs.items() if k not in ['tree_name', 'columns', 'folder_name', 'step_size']}
+
+        self._subset_conditions = {}
+        self._specs = []
+        self._histograms = {}
+
+    def _sources(self):
+
+        if self._folder_name is None:
+            return {file: self._tree_name for file in self._files}
+        return _root_tree_paths(self._files, self._tree_name, self._folder_name)
+
+    def __iter__(self):
+        '''
+            Iterate over the chunks, yielding a Dataset for each of them.
+            The registered subsets are available in each chunk.
+        '''
+        for df_chunk in uproot.iterate(self._sources(), filter_name=self._columns, step_size=self._step_size,
+                                       library='pd', **self._uproot_kwargs):
+            chunk = Dataset(df_chunk)
+            for name, condition in self._subset_conditions.items():
+                chunk.add_subset(name, chunk.eval(condition))
+            yield chunk
+
+    @property
+    def histograms(self) -> dict:
+        return self._histograms
+
+    def add_subset(self, name: str, condition: str):
+        '''
+            Register a subset, defined by a string expression evaluated on each chunk.
+        '''
+        if name in self._subset_conditions:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subset {name} already exists')
+        if not isinstance(condition, str):
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'Subset conditions of a DatasetStream must be string expressions.')
+        self._subset_conditions[name] = condition
+
+    def book(self, spec: HistSpec):
+        '''
+            Register a histogram to be filled while streaming.
+
+            Args:
+                spec (HistSpec): The specification of the histogram
+        '''
+        if spec.name in self._histograms:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Histogram {spec.name} already booked')
+        if spec.subset is not None and spec.subset not in self._subset_conditions:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subset {spec.subset} not defined')
+
+        hist = spec.build()
+        self._specs.append(spec)
+        self._histograms[spec.name] = hist
+        return hist
+
+    def book_th1(self, column: str, axis_spec_x: AxisSpec, **kwargs) -> TH1F:
+        '''
+            Register a histogram with one axis. The histogram is returned empty and filled by run().
+
+            Args:
+                column (str): The column to be histogrammed
+                axis_spec_x (AxisSpec): The specification for the x-axis
+
+                kwargs:
+                    subset (str): The name of the subset to use for the histogram
+                    cut (str): An additional selection applied to this histogram only
+                    name (str): The name of the histogram
+                    title (str): The title of the histogram
+        '''
+        return self.book(HistSpec(column, axis_spec_x, **kwargs))
+
+    def book_th2(self, column_x: str, column_y: str, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec, **kwargs) -> TH2F:
+        '''
+            Register a histogram with two axes. The histogram is returned empty and filled by run().
+
+            Args:
+                column_x, column_y (str): The columns to be histogrammed on the x- and y-axis
+                axis_spec_x, axis_spec_y (AxisSpec): The specifications for the x- and y-axis
+
+                kwargs: see book_th1
+        '''
+        return self.book(HistSpec(column_x, axis_spec_x, column_y, axis_spec_y, **kwargs))
+
+    def fill(self, chunk: Dataset):
+        '''
+            Fill the booked histograms with a single chunk.
+        '''
+        for spec in self._specs:
+            frame = chunk.data
+            if spec.subset:
+                needed = spec.input_columns + (sorted(_expression_columns(spec.cut)) if spec.cut else [])
+                frame = chunk.subsets.get(spec.subset, [column for column in dict.fromkeys(needed) if column in chunk.columns])
+            if spec.cut:
+                frame = _query_frame(frame, spec.cut)
+            spec.fill(self._histograms[spec.name], *[frame[column] for column in spec.columns],
+                      weights=frame[spec.weights] if spec.weights else None)
+
+    def run(self) -> dict:
+        '''
+            Loop over all the chunks and fill the booked histograms.
+
+            Returns:
+                dict: The filled histograms, by name
+        '''
+        nentries = 0
+        for ichunk, chunk in enumerate(self):
+            self.fill(chunk)
+            nentries += len(chunk)
+            print(tc.GREEN+'[INFO]: '+tc.RESET+f'Processed chunk {ichunk} ({nentries} entries)')
+        return self._histograms
+
+    def lazy(self) -> 'LazyDataset':
+        '''
+            Lazy view of the stream: operations are booked and executed in a single pass over the chunks.
+        '''
+        return LazyDataset(self)
+
+#############################################################
+
+class _LazyNode:
+    '''
+        Node of the operation graph of a LazyDataset.
+        kind is one of 'source', 'filter', 'subset', 'define' or 'hist'.
+    '''
+
+    def __init__(self, kind: str, parent: '_LazyNode' = None, **payload):
+        self.kind = kind
+        self.parent = parent
+        self.children = []
+        self.payload = payload
+        if parent is not None:
+            parent.children.append(self)
+
+    def ancestors(self):
+        node = self
+        while node is not None:
+            yield node
+            node = node.parent
+
+    def describe(self) -> str:
+        if self.kind == 'source':
+            return f'Source: {self.payload["description"]}'
+        if self.kind == 'filter':
+            return f'Filter: {self.payload["expr"]}'
+        if self.kind == 'subset':
+            return f'Subset {self.payload["name"]}: {self.payload["expr"]}'
+        if self.kind == 'define':
+            return f'Define {self.payload["name"]} = {self.payload["expr"]}'
+        spec = self.payload['spec']
+        cut = f' [cut: {spec.cut}]' if spec.cut else ''
+        subset = f' [subset: {self.payload["subset"].payload["name"]}]' if 'subset' in self.payload else ''
+        return f'Histogram {spec.name} ({spec.backend}): {" vs ".join(spec.columns)}{cut}{subset}'
+
+class _LazyGraph:
+    '''
+        Operation graph shared by all the LazyDataset views created from the same source.
+    '''
+
+    def __init__(self, source, chunk_size: int = None):
+        self.source = source
+        self.chunk_size = chunk_size
+        if isinstance(source, DatasetStream):
+            description = f'DatasetStream ({len(source._files)} file(s))'
+        else:
+            description = f'Dataset ({len(source)} entries)'
+        self.root = _LazyNode('source', description=description)
+        self.nodes = [self.root]
+        self.subsets = {}
+        self.histograms = {}
+        self.done = False
+
+    def add(self, kind: str, parent: _LazyNode, **payload) -> _LazyNode:
+        if self.done:
+            raise RuntimeError(tc.RED+'[ERROR]: '+tc.RESET+'The graph has already been executed.')
+        node = _LazyNode(kind, parent, **payload)
+        self.nodes.append(node)
+        return node
+
+    def chunks(self):
+        if isinstance(self.source, DatasetStream):
+            for chunk in self.source:
+                yield chunk.data
+        elif isinstance(self.source, PlDataset):
+            # the nodes are evaluated with pandas: the polars data is converted one chunk at a time
+            chunk_size = self.chunk_size if self.chunk_size is not None else max(len(self.source), 1)
+            for start in range(0, len(self.source), chunk_size):
+                yield self.source.data.slice(start, chunk_size).to_pandas()
+        elif self.chunk_size is None:
+            yield self.source.data
+        else:
+            for start in range(0, len(self.source), self.chunk_size):
+                yield self.source.data.iloc[start:start+self.chunk_size]
+
+    def process(self, frame: pd.DataFrame) -> None:
+        '''
+            Evaluate every node on a single chunk. Nodes are stored in creation order, which is a
+            topological order of the graph, so each mask is computed once from its parent's mask.
+        '''
+        frame = frame.copy(deep=False)
+        masks = {}
+        for node in self.nodes:
+            parent_mask = masks.get(id(node.parent))
+            if node.kind == 'source':
+                masks[id(node)] = None
+            elif node.kind == 'define':
+                frame[node.payload['name']] = _eval_frame(frame, node.payload['expr'])
+                masks[id(node)] = parent_mask
+            elif node.kind in ('filter', 'subset'):
+                mask = as_array(_eval_frame(frame, node.payload['expr'])).astype(bool, copy=False)
+                masks[id(node)] = mask if parent_mask is None else parent_mask & mask
+            else:
+                spec = node.payload['spec']
+                mask = parent_mask
+                if 'subset' in node.payload:
+                    subset_mask = masks[id(node.payload['subset'])]
+                    mask = subset_mask if mask is None else mask & subset_mask
+                if spec.cut:
+                    cut_mask = as_array(_eval_frame(frame, spec.cut)).astype(bool, copy=False)
+                    mask = cut_mask if mask is None else mask & cut_mask
+                data = [as_array(frame[column]) for column in spec.input_columns]
+                if mask is not None:
+                    data = [arr[mask] for arr in data]
+                weights = data.pop() if spec.weights else None
+                spec.fill(self.histograms[spec.name], *data, weights=weights)
+
+    def run(self) -> dict:
+        if self.done:
+            print(tc.MAGENTA+'[WARNING]: '+tc.RESET+'The graph has already been executed, returning the booked results.')
+            return self.histograms
+        nentries = 0
+        for ichunk, frame in enumerate(self.chunks()):
+            self.process(frame)
+            nentries += len(frame)
+        print(tc.GREEN+'[INFO]: '+tc.RESET+f'Graph executed in a single pass: {ichunk+1 if nentries else 0} chunk(s), {nentries} entries')
+        self.done = True
+        return self.histograms
+
+class LazyDataset:
+    '''
+        Deferred view of a Dataset (or DatasetStream). Cuts, derived columns, subsets and histograms are
+        recorded in an operation graph and executed together in a single pass over the data when run() is called.
+
+        Example:
+            lazy = dataset.lazy()
+            lazy.define('fP', 'fPt * cosh(fEta)')
+            selected = lazy.query('fPt > 1')
+            selected.add_subset('central', 'abs(fEta) < 0.5')
+            h_p = selected.build_th1('fP', AxisSpec(100, 0, 10, 'hP', ';#it{p};'), subset='central')
+            lazy.print_plan()
+            lazy.run()  # h_p is filled
+    '''
+
+    def __init__(self, source, chunk_size: int = None, *, _graph: _LazyGraph = None, _node: _LazyNode = None):
+        '''
+            Args:
+                source (Dataset or DatasetStream): The data to process
+                chunk_size (int): Number of entries processed at once for an in-memory Dataset (default: all)
+        '''
+        self._graph = _graph if _graph is not None else _LazyGraph(source, chunk_size)
+        self._node = _node if _node is not None else self._graph.root
+
+    def _view(self, node: _LazyNode) -> 'LazyDataset':
+        return LazyDataset(self._graph.source, _graph=self._graph, _node=node)
+
+    @property
+    def histograms(self) -> dict:
+        return self._graph.histograms
+
+    def query(self, expr: str) -> 'LazyDataset':
+        '''
+            Book a cut. Returns a view on the selected entries; the current view is unchanged.
+        '''
+        return self._view(self._graph.add('filter', self._node, expr=expr))
+
+    def define(self, name: str, expr: str) -> 'LazyDataset':
+        '''
+            Book a derived column, computed with DataFrame.eval on each chunk.
+        '''
+        return self._view(self._graph.add('define', self._node, name=name, expr=expr))
+
+    def __setitem__(self, key: str, expr: str):
+        self._node = self._graph.add('define', self._node, name=key, expr=expr)
+
+    def add_subset(self, name: str, condition: str):
+        '''
+            Book a named subset, defined by a string expression on top of the cuts of this view.
+        '''
+        if name in self._graph.subsets:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subset {name} already exists')
+        if not isinstance(condition, str):
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'Subset conditions of a LazyDataset must be string expressions.')
+        self._graph.subsets[name] = self._graph.add('subset', self._node, name=name, expr=condition)
+
+    def book(self, spec: HistSpec):
+        '''
+            Book a histogram. The returned histogram is empty until run() is called.
+            With a subset, the entries are those selected both by the subset and by the cuts of this view.
+        '''
+        if spec.name in self._graph.histograms:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Histogram {spec.name} already booked')
+        parent, payload = self._node, {}
+        if spec.subset is not None:
+            if spec.subset not in self._graph.subsets:
+                raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subset {spec.subset} not defined')
+            subset = self._graph.subsets[spec.subset]
+            if self._node in subset.ancestors():
+                # the subset is defined on top of the cuts of this view
+                parent = subset
+            else:
+                payload['subset'] = subset
+        hist = spec.build()
+        self._graph.add('hist', parent, spec=spec, **payload)
+        self._graph.histograms[spec.name] = hist
+        return hist
+
+    def build_th1(self, column: str, axis_spec_x: AxisSpec, **kwargs) -> TH1F:
+        return self.book(HistSpec(column, axis_spec_x, **kwargs))
+
+    def build_th2(self, column_x: str, column_y: str, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec, **kwargs) -> TH2F:
+        return self.book(HistSpec(column_x, axis_spec_x, column_y, axis_spec_y, **kwargs))
+
+    def build_boost1d(self, column: str, axis_spec_x: AxisSpec, **kwargs) -> bh.Histogram:
+        return self.book(HistSpec(column, axis_spec_x, backend='boost', **kwargs))
+
+    def build_boost2d(self, column_x: str, column_y: str, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec, **kwargs) -> bh.Histogram:
+        return self.book(HistSpec(column_x, axis_spec_x, column_y, axis_spec_y, backend='boost', **kwargs))
+
+    def plan(self) -> str:
+        '''
+            Text representation of the operation graph.
+        '''
+        lines = []
+        def _describe(node: _LazyNode, prefix: str, is_last: bool, is_root: bool):
+            connector = '' if is_root else ('└── ' if is_last else '├── ')
+            lines.append(prefix + connector + node.describe())
+            child_prefix = prefix + ('' if is_root else ('    ' if is_last else '│   '))
+            for ichild, child in enumerate(node.children):
+                _describe(child, child_prefix, ichild == len(node.children) - 1, False)
+        _describe(self._graph.root, '', True, True)
+        return '\n'.join(lines)
+
+    def print_plan(self) -> None:
+        print(self.plan())
+
+    def run(self) -> dict:
+        '''
+            Execute the graph in a single pass over the data and fill all the booked histograms.
+
+            Returns:
+                dict: The filled histograms, by name
+        '''
+        return self._graph.run()
+
+#############################################################
+
+_POLARS_FUNCTIONS = {
+    'abs': lambda expr: expr.abs(),
+    'sqrt': lambda expr: expr.sqrt(),
+    'exp': lambda expr: expr.exp(),
+    'log': lambda expr: expr.log(),
+    'log10': lambda expr: expr.log10(),
+    'sin': lambda expr: expr.sin(),
+    'cos': lambda expr: expr.cos(),
+    'tan': lambda expr: expr.tan(),
+    'arcsin': lambda expr: expr.arcsin(),
+    'arccos': lambda expr: expr.arccos(),
+    'arctan': lambda expr: expr.arctan(),
+    'sinh': lambda expr: expr.sinh(),
+    'cosh': lambda expr: expr.cosh(),
+    'tanh': lambda expr: expr.tanh(),
+    '__is_in': lambda expr, values: expr.is_in(list(values)),
+}
+
+class _MembershipRewriter(ast.NodeTransformer):
+    '''
+        Rewrite the membership tests 'x in [...]' and 'x not in [...]' as calls to Expr.is_in.
+    '''
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) != 1 or not isinstance(node.ops[0], (ast.In, ast.NotIn)):
+            return node
+        call = ast.Call(func=ast.Name(id='__is_in', ctx=ast.Load()), args=[node.left, node.comparators[0]], keywords=[])
+        return call if isinstance(node.ops[0], ast.In) else ast.UnaryOp(op=ast.Invert(), operand=call)
+
+def _to_polars_expr(expr: str) -> 'pl.Expr':
+    '''
+        Translate a pandas query/eval expression (e.g. 'fPt > 1 and abs(fEta) < 0.8') into a polars expression.
+    '''
+
+    tree, quoted = _parse_expression(expr)
+    tree = ast.fix_missing_locations(_MembershipRewriter().visit(tree))
+    names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    context = {name: pl.col(quoted.get(name, name)) for name in names if name not in _POLARS_FUNCTIONS}
+    return eval(compile(tree, '<expression>', 'eval'), {'__builtins__': {}, **_POLARS_FUNCTIONS}, context)
+
+class PlDataset(Dataset):
+    '''
+        Dataset with a polars DataFrame backend. It exposes the same API as Dataset, with query, subsets and
+        histogram inputs evaluated by the polars multithreaded engine.
+        It is returned by Dataset(..., engine='polars') and Dataset.from_root(..., engine='polars').
+    '''
+
+    def __init__(self, data, storage: str = None, dtypes=None, engine: str = 'polars', **kwargs):
+        '''
+            Args:
+                data (pl.DataFrame, pd.DataFrame, str or list): The data, or the path(s) to .csv/.parquet files
+                dtypes (dict or str): dtype policy applied at load time, see Dataset.apply_dtype_policy
+                **kwargs: Additional keyword arguments to be passed to the Dataset file readers
+        '''
+        if pl is None:
+            raise ImportError(tc.RED+'[ERROR]: '+tc.RESET+'polars is required for the polars engine.')
+
+        if isinstance(data, pl.DataFrame):
+            self._data = data
+        elif isinstance(data, Dataset):
+            self._data = data.data if isinstance(data, PlDataset) else pl.from_pandas(data.data)
+        else:
+            self._data = pl.from_pandas(Dataset(data, **kwargs).data)
+        self._subsets = SubsetDict(self)
+        self._dtype_report = None
+        if dtypes is not None:
+            self.apply_dtype_policy(dtypes)
+
+    def __getitem__(self, key):
+        if ':' in key:
+            key1, key2 = key.split(':')
+            return self._subsets.get(key1, key2 if key2 else None)
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        '''
+            Add or replace a column. value can be an array, a polars expression or a string expression.
+        '''
+        if isinstance(value, str):
+            value = _to_polars_expr(value)
+        elif not isinstance(value, pl.Expr):
+            value = pl.Series(key, as_array(value))
+        self._data = self._data.with_columns(value.alias(key))
+        self._subsets.invalidate()
+
+    @property
+    def columns(self):
+        return self._data.columns
+
+    def apply_dtype_policy(self, policy, verbose: bool = True) -> pd.DataFrame:
+        '''
+            Cast the columns of the dataset according to a dtype policy (see Dataset.apply_dtype_policy).
+        '''
+        if isinstance(policy, str) and policy == 'auto':
+            policy = {column: _downcast_dtype(self._data[column].to_numpy()) for column in self._data.columns
+                      if self._data[column].dtype.is_numeric()}
+        elif not isinstance(policy, dict):
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'The dtype policy must be "auto" or a column -> dtype map.')
+
+        bytes_before = {column: self._data[column].estimated_size() for column in self._data.columns}
+        dtypes_before = {column: str(self._data[column].dtype) for column in self._data.columns}
+        casts = [pl.col(column).cast(pl.Series(np.empty(0, dtype=np.dtype(dtype))).dtype) for column, dtype in policy.items()]
+        self._data = self._data.with_columns(casts)
+        self._subsets.invalidate()
+
+        self._dtype_report = pd.DataFrame({
+            'dtype_before': dtypes_before,
+            'dtype_after': {column: str(self._data[column].dtype) for column in self._data.columns},
+            'bytes_before': bytes_before,
+            'bytes_after': {column: self._data[column].estimated_size() for column in self._data.columns},
+        })
+        self._dtype_report['saved'] = self._dtype_report['bytes_before'] - self._dtype_report['bytes_after']
+        if verbose:
+            before, after = self._dtype_report['bytes_before'].sum(), self._dtype_report['bytes_after'].sum()
+            print(tc.GREEN+'[INFO]: '+tc.RESET+f'dtype policy applied: {before/1024**2:.1f} MB -> {after/1024**2:.1f} MB')
+        return self._dtype_report
+
+    def _mask_expr(self, condition) -> 'pl.Expr | pl.Series':
+        if isinstance(condition, str):
+            return _to_polars_expr(condition)
+        if isinstance(condition, (pl.Expr, pl.Series)):
+            return condition
+        return pl.Series(as_array(condition).astype(bool, copy=False))
+
+    def add_subset(self, name, condition):
+        '''
+            Add a subset to the dataset. condition can be a string expression, a polars expression or a boolean array.
+        '''
+        if not isinstance(condition, SubsetMask):
+            condition = self._mask_expr(condition)
+        self._subsets.add_subset(name, condition)
+
+    def _subset_mask(self, condition) -> np.ndarray:
+
+        if isinstance(condition, SubsetMask):
+            condition = pl.Series(condition.to_bool())
         else:
-            return build_boost2(self._data[column_x], self._data[column_y], axis_spec_x, axis_spec_y)
+            condition = self._mask_expr(condition)
+        if isinstance(condition, pl.Expr):
+            condition = self._data.select(condition.alias('mask'))['mask']
+        mask = condition.fill_null(False).to_numpy().astype(bool, copy=False)
+        if len(mask) != len(self._data):
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Subset mask of length {len(mask)} does not match the dataset ({len(self._data)} rows).')
+        return mask
+
+    def _subset_select(self, mask: np.ndarray, columns=None):
+
+        if columns is None:
+            return self._data.filter(mask)
+        if isinstance(columns, str):
+            return self._data[columns].filter(mask)
+        return self._data.select(columns).filter(mask)
+
+    def _compact(self, mask: np.ndarray):
+
+        self._data = self._data.filter(mask)
+        self._subsets.invalidate(mask)
+
+    def query(self, expr: str, *, inplace: bool = True, **kwargs) -> 'PlDataset | None':
+        '''
+            Query the dataset using a string expression (pandas query syntax) or a polars expression.
+        '''
+        if inplace:
+            self._compact(self._subset_mask(self._mask_expr(expr)))
+        else:
+            return PlDataset(self._data.filter(self._mask_expr(expr)))
+
+    def eval(self, expr: str, **kwargs) -> 'pl.Series':
+        '''
+            Evaluate a string expression (pandas eval syntax) in the dataset.
+        '''
+        return self._data.select(_to_polars_expr(expr).alias('result'))['result']
+
+    def concat(self, other, **kwargs) -> 'PlDataset':
+        if isinstance(other, list):
+            all_df = [self._data] + [ds.data for ds in other]
+        elif isinstance(other, PlDataset):
+            all_df = [self._data, other.data]
+        else:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+'Other must be a PlDataset or a list of PlDatasets.')
+        return PlDataset(pl.concat(all_df, **kwargs))
+
+    def describe(self, **kwargs) -> 'pl.DataFrame':
+        return self._data.describe(**kwargs)
+
+    def apply(self, func, **kwargs):
+        return func(self._data, **kwargs)
+
+    def drop(self, labels=None, *, columns=None, inplace=True, **kwargs) -> 'None | pl.DataFrame':
+        '''
+            Drop columns from the dataset.
+        '''
+        dropped = self._data.drop(columns if columns is not None else labels)
+        if inplace:
+            self._data = dropped
+            self._subsets.invalidate()
+        else:
+            return dropped
+
+    def head(self, n: int = 5) -> 'pl.DataFrame':
+        return self._data.head(n)
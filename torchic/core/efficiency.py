@@ -0,0 +1,74 @@
+'''
+    Binomial efficiency intervals, computed in bulk on arrays of passed and total counts.
+'''
+
+import numpy as np
+from scipy.special import betaincinv, ndtri
+
+# 1 sigma coverage, the default confidence level of TEfficiency
+ONE_SIGMA = 0.682689492137086
+
+EFFICIENCY_METHODS = ('binomial', 'wilson', 'clopper_pearson', 'bayesian')
+
+def _per_count_pair(func, k: np.ndarray, n: np.ndarray) -> tuple:
+    '''
+        Evaluate func(k, n) once per distinct pair of integer counts. The inverse incomplete beta function is
+        the expensive part of the exact intervals, and large efficiency maps repeat the same few counts many times.
+    '''
+    if len(k) == 0 or not (np.array_equal(k, np.floor(k)) and np.array_equal(n, np.floor(n))):
+        return func(k, n)
+    key = k.astype(np.int64) * (int(n.max()) + 1) + n.astype(np.int64)
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    return tuple(result[inverse] for result in func(k[first], n[first]))
+
+def _clopper_pearson(k: np.ndarray, n: np.ndarray, tail: float) -> tuple:
+
+    with np.errstate(invalid='ignore'):
+        low = np.where(k > 0, betaincinv(k, n - k + 1., tail), 0.)
+        up = np.where(k < n, betaincinv(k + 1., n - k, 1. - tail), 1.)
+    return low, up
+
+def _beta_central(a: np.ndarray, b: np.ndarray, tail: float) -> tuple:
+
+    return betaincinv(a, b, tail), betaincinv(a, b, 1. - tail)
+
+def efficiency_interval(passed, total, method: str = 'binomial', cl: float = ONE_SIGMA, alpha: float = 1., beta: float = 1.) -> tuple:
+    '''
+        Efficiency and confidence interval of each bin, with the same definitions as TEfficiency.
+
+        Args:
+            passed, total (np.ndarray): The selected and total counts of each bin
+            method (str): 'binomial' (eff -+ sqrt(eff(1-eff)/total)), 'wilson', 'clopper_pearson' or
+                'bayesian' (central interval of the Beta(passed+alpha, total-passed+beta) posterior, whose mean is the efficiency)
+            cl (float): The confidence level of the interval
+            alpha, beta (float): The parameters of the Beta prior of the bayesian method (uniform prior by default)
+
+        Returns:
+            eff, low, up (np.ndarray): The efficiency and the bounds of the interval. Bins with no entries
+                have an efficiency of 0 and an empty interval, bins with passed > total an empty interval around passed/total.
+    '''
+    if method not in EFFICIENCY_METHODS:
+        raise ValueError(f'method must be one of {EFFICIENCY_METHODS}')
+    passed = np.asarray(passed, dtype=np.float64)
+    total = np.asarray(total, dtype=np.float64)
+    filled = total > 0
+    valid = filled & (passed <= total) & (passed >= 0)
+    eff = np.divide(passed, total, out=np.zeros(np.broadcast(passed, total).shape), where=filled)
+    low, up = eff.copy(), eff.copy()
+    k, n = passed[valid], total[valid]
+    tail = 0.5 * (1. - cl)
+
+    if method == 'binomial':
+        err = np.sqrt(eff[valid] * (1. - eff[valid]) / n)
+        low[valid], up[valid] = eff[valid] - err, eff[valid] + err
+    elif method == 'wilson':
+        kappa = ndtri(1. - tail)
+        mode = (k + 0.5 * kappa**2) / (n + kappa**2)
+        delta = kappa / (n + kappa**2) * np.sqrt(n * eff[valid] * (1. - eff[valid]) + 0.25 * kappa**2)
+        low[valid], up[valid] = np.maximum(mode - delta, 0.), np.minimum(mode + delta, 1.)
+    elif method == 'clopper_pearson':
+        low[valid], up[valid] = _per_count_pair(lambda k, n: _clopper_pearson(k, n, tail), k, n)
+    else:
+        eff[valid] = (k + alpha) / (n + alpha + beta)
+        low[valid], up[valid] = _per_count_pair(lambda k, n: _beta_central(k + alpha, n - k + beta, tail), k, n)
+    return eff, low, up
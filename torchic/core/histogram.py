@@ -4,30 +4,634 @@
 
 from functools import singledispatch
 from dataclasses import dataclass
-from ROOT import TH1F, TH2F, TFile, TGraphErrors
+from ROOT import TH1F, TH1D, TH2F, THnSparseD, TFile, TGraphErrors
 import boost_histogram as bh
+from torchic.core.efficiency import ONE_SIGMA, efficiency_interval
 from torchic.utils.overload import overload, signature
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 import numpy as np
+import pandas as pd
 
-@dataclass
+@dataclass(frozen=True)
 class AxisSpec:
+    '''
+        Specification of a histogram axis. Bins are of fixed width between xmin and xmax, unless explicit
+        bin edges are given: nbins, xmin and xmax are then taken from the edges.
+
+        Example:
+            AxisSpec(100, 0., 10., 'pt', ';#it{p}_{T} (GeV/#it{c});')
+            AxisSpec.from_edges([0., 0.5, 1., 2., 5., 10.], 'pt', ';#it{p}_{T} (GeV/#it{c});')
+            AxisSpec.log(50, 0.1, 100., 'pt', ';#it{p}_{T} (GeV/#it{c});')
+    '''
 
     nbins: int
     xmin: float
     xmax: float
     name: str = ''
     title: str = ''
+    edges: tuple = None
+
+    def __post_init__(self):
+        if self.edges is None:
+            return
+        edges = np.asarray(self.edges, dtype=np.float64)
+        if edges.ndim != 1 or len(edges) < 2 or not np.all(np.diff(edges) > 0):
+            raise ValueError('edges must be a strictly increasing sequence of at least two values')
+        # stored as a tuple so that the (frozen) spec stays comparable and hashable
+        object.__setattr__(self, 'edges', tuple(edges.tolist()))
+        object.__setattr__(self, 'nbins', len(edges) - 1)
+        object.__setattr__(self, 'xmin', self.edges[0])
+        object.__setattr__(self, 'xmax', self.edges[-1])
+
+    @classmethod
+    def from_edges(cls, edges, name: str = '', title: str = ''):
+        return cls(0, 0., 0., name, title, edges=edges)
+
+    @classmethod
+    def log(cls, nbins: int, xmin: float, xmax: float, name: str = '', title: str = ''):
+        '''
+            Axis with nbins logarithmically spaced between xmin and xmax (both positive).
+        '''
+        if not 0 < xmin < xmax:
+            raise ValueError('a logarithmic axis needs 0 < xmin < xmax')
+        return cls.from_edges(np.geomspace(xmin, xmax, nbins + 1), name, title)
+
+    @property
+    def is_variable(self) -> bool:
+        return self.edges is not None
+
+    @property
+    def bin_edges(self) -> np.ndarray:
+        if self.is_variable:
+            return np.array(self.edges)
+        return np.linspace(self.xmin, self.xmax, self.nbins + 1)
 
     @classmethod
     def from_dict(cls, d: dict):
+        if 'edges' in d:
+            return cls.from_edges(d['edges'], d['name'], d['title'])
+        if d.get('log', False):
+            return cls.log(d['nbins'], d['xmin'], d['xmax'], d['name'], d['title'])
         return cls(d['nbins'], d['xmin'], d['xmax'], d['name'], d['title'])
+
+def _root_axis_args(axis_spec: AxisSpec) -> tuple:
+    '''
+        Axis arguments of the ROOT histogram constructors: (nbins, xmin, xmax), or (nbins, edges) for variable bins.
+    '''
+    if axis_spec.is_variable:
+        return axis_spec.nbins, axis_spec.bin_edges
+    return axis_spec.nbins, axis_spec.xmin, axis_spec.xmax
+
+def _boost_axis(axis_spec: AxisSpec):
+
+    if axis_spec.is_variable:
+        return bh.axis.Variable(axis_spec.edges, metadata=axis_spec.title)
+    return bh.axis.Regular(axis_spec.nbins, axis_spec.xmin, axis_spec.xmax, metadata=axis_spec.title)
     
+@dataclass
+class HistSpec:
+    '''
+        Specification of a histogram to be filled from dataset columns.
+        If column_y and axis_spec_y are provided, a 2D histogram is built.
+    '''
+
+    column_x: str
+    axis_spec_x: AxisSpec
+    column_y: str = None
+    axis_spec_y: AxisSpec = None
+    subset: str = None
+    cut: str = None
+    name: str = None
+    title: str = None
+    backend: str = 'root'
+    weights: str = None
+
+    def __post_init__(self):
+        if (self.column_y is None) != (self.axis_spec_y is None):
+            raise ValueError('column_y and axis_spec_y must be provided together')
+        if self.backend not in ('root', 'boost'):
+            raise ValueError('backend must be either root or boost')
+        if self.name is None:
+            self.name = self.axis_spec_x.name if self.is_1d else self.axis_spec_x.name + '_' + self.axis_spec_y.name
+        if self.title is None:
+            self.title = self.axis_spec_x.title if self.is_1d else self.axis_spec_x.title + ';' + self.axis_spec_y.title
+
+    @property
+    def is_1d(self) -> bool:
+        return self.column_y is None
+
+    @property
+    def columns(self) -> list:
+        return [self.column_x] if self.is_1d else [self.column_x, self.column_y]
+
+    @property
+    def input_columns(self) -> list:
+        '''
+            All the columns read to fill the histogram, weights included.
+        '''
+        return self.columns + ([self.weights] if self.weights else [])
+
+    def build(self, *data):
+        '''
+            Build the histogram described by the spec, from one array per column (empty if no data is given).
+        '''
+        if not data:
+            data = [[]] * len(self.columns)
+        if self.backend == 'boost':
+            storage = bh.storage.Weight() if self.weights else None
+            if self.is_1d:
+                return build_boost1(*data, self.axis_spec_x, storage=storage)
+            return build_boost2(*data, self.axis_spec_x, self.axis_spec_y, storage=storage)
+        if self.is_1d:
+            return build_TH1(*data, self.axis_spec_x, name=self.name, title=self.title)
+        return build_TH2(*data, self.axis_spec_x, self.axis_spec_y, name=self.name, title=self.title)
+
+    def fill(self, hist, *data, weights=None) -> None:
+        '''
+            Fill a histogram built from this spec with one array per column, and optionally the weights.
+        '''
+        if self.backend == 'boost':
+            hist.fill(*[as_array(arr) for arr in data], weight=None if weights is None else as_array(weights))
+        elif self.is_1d:
+            fill_TH1(*data, hist, weights=weights)
+        else:
+            fill_TH2(*data, hist, weights=weights)
+
 @dataclass
 class HistLoadInfo:
     hist_file_path: str
     hist_name: str
 
+# Maximum number of entries converted to double precision at once when filling ROOT histograms
+FILL_BLOCK_SIZE = 1 << 20
+# N-dimensional histograms with up to this many cells (flow bins included) are accumulated in a dense array,
+# larger ones as sorted (cell, sum) pairs whose size scales with the number of filled cells
+THN_DENSE_MAX_CELLS = 1 << 22
+
+def as_array(data) -> np.ndarray:
+    '''
+        Return the data as a numpy array in its native dtype, without copying when possible.
+        numpy-backed and pyarrow-backed (single chunk, no nulls) columns are returned as views.
+
+        Args:
+            data (pd.Series, np.ndarray, list): The input data
+    '''
+    if isinstance(data, np.ndarray):
+        return data
+    # masked extension arrays (Int64, Float32, boolean) also implement __arrow_array__, as a single pa.Array
+    if isinstance(getattr(data, 'dtype', None), pd.ArrowDtype):
+        chunked = data.array.__arrow_array__()
+        if chunked.num_chunks == 1:
+            return chunked.chunk(0).to_numpy(zero_copy_only=False)
+        return chunked.to_numpy()
+    return np.asarray(data)
+
+def _fill_blocks(hist, *data, weights=None) -> None:
+    '''
+        Fill a ROOT histogram with FillN. FillN needs double precision arrays, so the input is
+        widened to float64 one block of FILL_BLOCK_SIZE entries at a time instead of as a whole.
+    '''
+    arrays = [as_array(arr) for arr in data]
+    nentries = len(arrays[0])
+    if weights is None:
+        arr_w = np.ones(min(nentries, FILL_BLOCK_SIZE), dtype=np.float64)
+    else:
+        weights = as_array(weights)
+    for start in range(0, nentries, FILL_BLOCK_SIZE):
+        blocks = [np.ascontiguousarray(arr[start:start+FILL_BLOCK_SIZE], dtype=np.float64) for arr in arrays]
+        if weights is not None:
+            arr_w = np.ascontiguousarray(weights[start:start+FILL_BLOCK_SIZE], dtype=np.float64)
+        hist.FillN(len(blocks[0]), *blocks, arr_w)
+
+_ROOT_ARRAY_DTYPES = {
+    'TArrayD': np.float64,
+    'TArrayF': np.float32,
+    'TArrayL64': np.int64,
+    'TArrayI': np.int32,
+    'TArrayS': np.int16,
+    'TArrayC': np.int8,
+}
+
+def _root_cells(hist) -> np.ndarray:
+    '''
+        Writable numpy view of the bin contents of a ROOT histogram, under/overflow included.
+    '''
+    for array_class, dtype in _ROOT_ARRAY_DTYPES.items():
+        if hist.InheritsFrom(array_class):
+            return np.frombuffer(hist.GetArray(), dtype=dtype, count=hist.GetNcells())
+    raise ValueError(f'Unsupported histogram storage for {hist.GetName()}')
+
+def _root_sumw2(hist) -> np.ndarray | None:
+    '''
+        Writable numpy view of the sums of squared weights of a ROOT histogram, None if Sumw2 is not active.
+    '''
+    if hist.GetSumw2N() == 0:
+        return None
+    return np.frombuffer(hist.GetSumw2().GetArray(), dtype=np.float64, count=hist.GetNcells())
+
+def _root_axes(hist) -> list:
+
+    return [hist.GetXaxis(), hist.GetYaxis(), hist.GetZaxis()][:hist.GetDimension()]
+
+def _as_bins(hist, cells: np.ndarray, flow: bool) -> np.ndarray:
+    '''
+        Reshape the flat cells of a ROOT histogram (x running fastest) to one dimension per axis, indexed as [ix, iy, ...].
+    '''
+    axes = _root_axes(hist)
+    cells = cells.reshape([axis.GetNbins() + 2 for axis in reversed(axes)]).T
+    if flow:
+        return cells
+    return cells[(slice(1, -1),) * len(axes)]
+
+def axis_edges(axis) -> np.ndarray:
+    '''
+        Bin edges of a ROOT axis (nbins + 1 values).
+    '''
+    binning = _axis_binning(axis)
+    if binning is not None and binning[3] is not None:
+        return binning[3]
+    return np.linspace(axis.GetXmin(), axis.GetXmax(), axis.GetNbins() + 1)
+
+def axis_centers(axis, flow: bool = False) -> np.ndarray:
+    '''
+        Bin centers of a ROOT axis, computed as in TAxis::GetBinCenter (flow bins included with flow=True).
+    '''
+    nbins, xmin, xmax = axis.GetNbins(), axis.GetXmin(), axis.GetXmax()
+    ibins = np.arange(nbins + 2)
+    bin_width = (xmax - xmin) / nbins
+    centers = xmin + (ibins - 1) * bin_width + 0.5 * bin_width
+    if axis.GetXbins().GetSize() > 0:
+        edges = axis_edges(axis)
+        centers[1:-1] = edges[:-1] + 0.5 * np.diff(edges)
+    return centers if flow else centers[1:-1]
+
+def hist_values(hist, flow: bool = False) -> np.ndarray:
+    '''
+        Bin contents of a ROOT histogram as a writable numpy view of its internal array, indexed as [ix, iy, ...].
+        Writing to the view modifies the histogram (the statistics are not updated).
+
+        Args:
+            hist (TH1, TH2, TH3): The histogram
+            flow (bool): Whether to include the under/overflow bins
+    '''
+    return _as_bins(hist, _root_cells(hist), flow)
+
+def hist_variances(hist, flow: bool = False) -> np.ndarray:
+    '''
+        Bin variances (squared errors) of a ROOT histogram. With Sumw2 active, this is a writable view of the
+        sums of squared weights, otherwise a copy of the absolute bin contents (as in TH1::GetBinError).
+    '''
+    sumw2 = _root_sumw2(hist)
+    if sumw2 is None:
+        return np.abs(hist_values(hist, flow).astype(np.float64))
+    return _as_bins(hist, sumw2, flow)
+
+def hist_to_numpy(hist, flow: bool = False) -> tuple:
+    '''
+        Contents, variances and edges of a ROOT histogram.
+
+        Returns:
+            values (np.ndarray): The bin contents (a view, see hist_values)
+            variances (np.ndarray): The bin variances (see hist_variances)
+            edges (list): The bin edges of each axis
+    '''
+    return hist_values(hist, flow), hist_variances(hist, flow), [axis_edges(axis) for axis in _root_axes(hist)]
+
+def numpy_to_hist(hist, values, variances=None, flow: bool = False, entries: float = None) -> None:
+    '''
+        Write bin contents (and optionally variances, activating Sumw2) to a ROOT histogram.
+
+        Args:
+            hist (TH1, TH2, TH3): The histogram
+            values (np.ndarray): The bin contents, with the shape of hist_values(hist, flow)
+            variances (np.ndarray, optional): The bin variances (squared errors)
+            flow (bool): Whether the arrays include the under/overflow bins
+            entries (float, optional): The number of entries to set
+    '''
+    hist_values(hist, flow)[...] = values
+    if variances is not None:
+        if hist.GetSumw2N() == 0:
+            hist.Sumw2()
+        _as_bins(hist, _root_sumw2(hist), flow)[...] = variances
+    if entries is not None:
+        hist.SetEntries(entries)
+
+def _axis_binning(axis) -> tuple | None:
+    '''
+        Binning of a ROOT axis as (nbins, xmin, xmax, edges), edges being None for fixed-width bins.
+        Returns None for automatic limits (xmin >= xmax makes ROOT buffer the entries and compute the limits).
+    '''
+    nbins, xmin, xmax = axis.GetNbins(), axis.GetXmin(), axis.GetXmax()
+    if not xmin < xmax:
+        return None
+    xbins = axis.GetXbins()
+    if xbins.GetSize() == 0:
+        return nbins, xmin, xmax, None
+    # copy of the TArrayD of the edges, which ROOT reallocates if the axis is rebinned
+    return nbins, xmin, xmax, np.frombuffer(xbins.GetArray(), dtype=np.float64, count=nbins + 1).copy()
+
+def _regular_bin_index(values: np.ndarray, nbins: int, xmin: float, xmax: float, out: np.ndarray, scratch: np.ndarray,
+                       flags: np.ndarray) -> np.ndarray:
+    '''
+        Bin index of each value on a regular axis, with the same arithmetic as TAxis::FindBin:
+        0 is the underflow, nbins+1 the overflow (NaN included), otherwise 1 + int(nbins*(x-xmin)/(xmax-xmin)).
+        The result is written to out, using scratch (float64) and flags (bool) as work buffers of the same length.
+    '''
+    np.subtract(values, xmin, out=scratch)
+    np.multiply(scratch, nbins, out=scratch)
+    np.divide(scratch, xmax - xmin, out=scratch)
+    np.less(values, xmax, out=flags)
+    np.logical_not(flags, out=flags)
+    np.putmask(scratch, flags, nbins)
+    # values below xmin give a negative scratch, which is clipped to -1 to land in the underflow
+    np.clip(scratch, -1, nbins, out=scratch)
+    np.floor(scratch, out=scratch)
+    out[:] = scratch
+    out += 1
+    return out
+
+def _variable_bin_index(values: np.ndarray, edges: np.ndarray, out: np.ndarray) -> np.ndarray:
+    '''
+        Bin index of each value on an axis with variable bins, as in TAxis::FindBin: the binary search for the
+        last edge not greater than x is a right-sided searchsorted, which gives 0 below the first edge and
+        nbins+1 from the last edge on (NaN sorts last, so it lands in the overflow as well).
+    '''
+    out[:] = np.searchsorted(edges, values, side='right')
+    return out
+
+def _bin_index(values: np.ndarray, binning: tuple, out: np.ndarray, scratch: np.ndarray, flags: np.ndarray) -> np.ndarray:
+
+    nbins, xmin, xmax, edges = binning
+    if edges is None:
+        return _regular_bin_index(values, nbins, xmin, xmax, out, scratch, flags)
+    return _variable_bin_index(values, edges, out)
+
+class _BinningBuffers:
+    '''
+        Work buffers of the binning kernel, allocated once per fill for a block of entries and reused for all blocks.
+        Without inputs, the widened values and bin indices are provided by the caller (see _MultiFill).
+    '''
+
+    def __init__(self, ndim: int, size: int, weighted: bool = False, inputs: bool = True):
+        self.values = [np.empty(size, dtype=np.float64) for _ in range(ndim)] if inputs else None
+        self.index = [np.empty(size, dtype=np.intp) for _ in range(ndim)] if inputs else None
+        self.weights = np.empty(size, dtype=np.float64) if weighted else None
+        self.masked = [np.empty(size, dtype=np.float64) for _ in range(ndim + weighted)]
+        self.global_bin = np.empty(size, dtype=np.intp)
+        self.scratch = np.empty(size, dtype=np.float64)
+        self.flags = np.empty(size, dtype=bool)
+        self.in_range = np.empty(size, dtype=bool)
+
+class _FillSums:
+    '''
+        Sums of a ROOT histogram fill, accumulated over any number of blocks of entries and added to the
+        histogram once (see write). Contents are summed in double precision (as int64 counts without weights).
+        The statistics include the under/overflow entries if stat_overflows is set, as TH1::Fill does
+        with TH1::StatOverflows(true).
+    '''
+
+    def __init__(self, axes: list, weighted: bool, stat_overflows: bool = False):
+        self.axes = axes
+        self.stat_overflows = stat_overflows
+        ncells = int(np.prod([binning[0] + 2 for binning in axes]))
+        self.sumw = np.zeros(ncells, dtype=np.float64 if weighted else np.int64)
+        self.sumw2 = np.zeros(ncells, dtype=np.float64) if weighted else None
+        self.stats = np.zeros(4 if len(axes) == 1 else 7)
+        self.non_unit = False
+        self.nentries = 0
+
+    def add_block(self, values: list, index: list, weights: np.ndarray, buffers: _BinningBuffers) -> None:
+        '''
+            Add a block of entries, given the values widened to double precision and the bin index on each axis.
+            The inputs are not modified, so that they can be shared by several histograms.
+        '''
+        size = len(index[0])
+        flags, in_range, scratch = buffers.flags[:size], buffers.in_range[:size], buffers.scratch[:size]
+        in_range[:] = True
+        for axis_index, binning in zip(index, self.axes):
+            np.greater_equal(axis_index, 1, out=flags)
+            in_range &= flags
+            np.less_equal(axis_index, binning[0], out=flags)
+            in_range &= flags
+
+        global_bin = index[0]
+        if len(self.axes) == 2:
+            global_bin = np.multiply(index[1], self.axes[0][0] + 2, out=buffers.global_bin[:size])
+            global_bin += index[0]
+
+        ncells = len(self.sumw)
+        if weights is None:
+            self.sumw += np.bincount(global_bin, minlength=ncells)
+        else:
+            np.not_equal(weights, 1., out=flags)
+            self.non_unit = self.non_unit or bool(flags.any())
+            self.sumw += np.bincount(global_bin, weights=weights, minlength=ncells)
+            np.multiply(weights, weights, out=scratch)
+            self.sumw2 += np.bincount(global_bin, weights=scratch, minlength=ncells)
+        self.nentries += size
+
+        if not self.stat_overflows:
+            # out-of-range entries are zeroed (in copies) so that the sums run over the in-range ones only
+            inputs = values if weights is None else values + [weights]
+            masked = []
+            for block, out in zip(inputs, buffers.masked):
+                out = out[:size]
+                out.fill(0.)
+                np.copyto(out, block, where=in_range)
+                masked.append(out)
+            values = masked[:len(values)]
+            weights = None if weights is None else masked[-1]
+        x = values[0]
+        if weights is None:
+            n_selected = size if self.stat_overflows else np.count_nonzero(in_range)
+            self.stats[:4] += [n_selected, n_selected, x.sum(), np.dot(x, x)]
+            if len(self.axes) == 2:
+                y = values[1]
+                self.stats[4:] += [y.sum(), np.dot(y, y), np.dot(x, y)]
+            return
+
+        np.multiply(weights, x, out=scratch)
+        self.stats[:4] += [weights.sum(), np.dot(weights, weights), scratch.sum(), np.dot(scratch, x)]
+        if len(self.axes) == 2:
+            y = values[1]
+            sumwxy = np.dot(scratch, y)
+            np.multiply(weights, y, out=scratch)
+            self.stats[4:] += [scratch.sum(), np.dot(scratch, y), sumwxy]
+
+    def merge(self, other: '_FillSums') -> None:
+
+        self.sumw += other.sumw
+        if self.sumw2 is not None:
+            self.sumw2 += other.sumw2
+        self.stats += other.stats
+        self.non_unit = self.non_unit or other.non_unit
+        self.nentries += other.nentries
+
+    def write(self, hist) -> None:
+        '''
+            Add the sums to the buffers of the histogram. The contents are added in double precision and rounded
+            once to the storage type, so a TH1F bin keeps the float32 rounding of its exact count beyond 2^24 entries.
+        '''
+        if self.nentries == 0:
+            return
+        if self.non_unit and hist.GetSumw2N() == 0:
+            hist.Sumw2()
+        cells = _root_cells(hist)
+        np.add(cells, self.sumw, out=cells, casting='unsafe')
+        cells_sumw2 = _root_sumw2(hist)
+        if cells_sumw2 is not None:
+            cells_sumw2 += self.sumw if self.sumw2 is None else self.sumw2
+
+        stats = np.zeros(13)
+        hist.GetStats(stats)
+        stats[:len(self.stats)] += self.stats
+        entries = hist.GetEntries()
+        hist.PutStats(stats)
+        hist.SetEntries(entries + self.nentries)
+
+def _partial_fill(arrays: list, weights: np.ndarray, axes: list, start: int, stop: int, stat_overflows: bool = False) -> _FillSums:
+    '''
+        Bin the entries [start, stop) into partial sums over all the cells of the histogram.
+        The inputs are read in their native dtype, one block of FILL_BLOCK_SIZE entries at a time, and
+        widened into preallocated double precision buffers (TAxis::FindBin works in double precision).
+    '''
+    weighted = weights is not None
+    sums = _FillSums(axes, weighted, stat_overflows)
+    buffers = _BinningBuffers(len(axes), min(FILL_BLOCK_SIZE, stop - start), weighted)
+    for block_start in range(start, stop, FILL_BLOCK_SIZE):
+        block_stop = min(block_start + FILL_BLOCK_SIZE, stop)
+        size = block_stop - block_start
+        values, index = [], []
+        for iaxis, (arr, binning) in enumerate(zip(arrays, axes)):
+            block = buffers.values[iaxis][:size]
+            np.copyto(block, arr[block_start:block_stop], casting='unsafe')
+            values.append(block)
+            index.append(_bin_index(block, binning, buffers.index[iaxis][:size], buffers.scratch[:size], buffers.flags[:size]))
+        w = None
+        if weighted:
+            w = buffers.weights[:size]
+            np.copyto(w, weights[block_start:block_stop], casting='unsafe')
+        sums.add_block(values, index, w, buffers)
+    return sums
+
+def _fill_numpy(hist, *data, weights=None, n_workers: int = 1) -> None:
+    '''
+        Fill a ROOT histogram with a numpy binning kernel: bin indices are computed with the TAxis::FindBin
+        arithmetic, summed with np.bincount and added to the histogram buffers, so that contents,
+        under/overflow, Sumw2, statistics and entries match FillN without building a weight array.
+        With weights, the sums of weights and of squared weights are computed in the same pass and Sumw2
+        is activated as FillN does when a weight differs from 1. The statistics follow TH1::StatOverflows.
+        With n_workers > 1, the entries are split in row partitions binned on separate threads and merged.
+        Variable bins are looked up with a binary search (np.searchsorted), fixed-width bins arithmetically.
+        Histograms with automatic limits are filled with FillN.
+    '''
+    axes = [_axis_binning(axis) for axis in [hist.GetXaxis(), hist.GetYaxis()][:len(data)]]
+    if any(binning is None for binning in axes):
+        _fill_blocks(hist, *data, weights=weights)
+        return
+
+    arrays = [as_array(arr) for arr in data]
+    weights = None if weights is None else as_array(weights)
+    nentries = len(arrays[0])
+    if nentries == 0:
+        return
+    n_workers = max(1, min(n_workers or os.cpu_count() or 1, nentries))
+    edges = np.linspace(0, nentries, n_workers + 1).astype(int)
+    stat_overflows = bool(hist.GetStatOverflowsBehaviour())
+
+    if n_workers == 1:
+        partials = [_partial_fill(arrays, weights, axes, 0, nentries, stat_overflows)]
+    else:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            partials = list(executor.map(_partial_fill, repeat(arrays), repeat(weights), repeat(axes), edges[:-1], edges[1:],
+                                         repeat(stat_overflows)))
+    sums = partials[0]
+    for partial in partials[1:]:
+        sums.merge(partial)
+    sums.write(hist)
+
+def _binning_key(binning: tuple) -> tuple:
+
+    nbins, xmin, xmax, edges = binning
+    return nbins, xmin, xmax, None if edges is None else edges.tobytes()
+
+class _MultiFill:
+    '''
+        Fill of many histograms (HistSpec) from the same blocks of entries. In each block, every column is widened
+        to double precision once and binned once per distinct axis, in buffers shared by all the histograms.
+        ROOT histograms are accumulated in double precision over all the blocks and written once by write().
+    '''
+
+    def __init__(self, specs: list, histograms: dict, size: int):
+        self._histograms = histograms
+        self._size = size
+        self._buffers = _BinningBuffers(2, size, weighted=True, inputs=False)
+        self._values = {}
+        self._index = {}
+        self._axes = {}
+        self._sums = {}
+        for spec in specs:
+            hist = histograms[spec.name]
+            if spec.backend != 'root':
+                continue
+            axes = [_axis_binning(axis) for axis in [hist.GetXaxis(), hist.GetYaxis()][:len(spec.columns)]]
+            if all(binning is not None for binning in axes):
+                self._axes[spec.name] = axes
+                self._sums[spec.name] = _FillSums(axes, spec.weights is not None, bool(hist.GetStatOverflowsBehaviour()))
+
+    def fill(self, specs: list, blocks: dict) -> None:
+        '''
+            Fill the histograms of specs with a block of entries.
+
+            Args:
+                specs (list): The histogram specifications
+                blocks (dict): The block of each input column, in its native dtype
+        '''
+        size = len(next(iter(blocks.values())))
+        if size == 0:
+            return
+        values, index = {}, {}
+        def _values(column):
+            if column not in values:
+                if column not in self._values:
+                    self._values[column] = np.empty(self._size, dtype=np.float64)
+                values[column] = self._values[column][:size]
+                np.copyto(values[column], blocks[column], casting='unsafe')
+            return values[column]
+        def _index(column, binning):
+            key = (column, _binning_key(binning))
+            if key not in index:
+                if key not in self._index:
+                    self._index[key] = np.empty(self._size, dtype=np.intp)
+                index[key] = _bin_index(_values(column), binning, self._index[key][:size],
+                                        self._buffers.scratch[:size], self._buffers.flags[:size])
+            return index[key]
+
+        for spec in specs:
+            hist = self._histograms[spec.name]
+            weights = _values(spec.weights) if spec.weights else None
+            if spec.name in self._sums:
+                axes = self._axes[spec.name]
+                self._sums[spec.name].add_block([_values(column) for column in spec.columns],
+                                                [_index(column, binning) for column, binning in zip(spec.columns, axes)],
+                                                weights, self._buffers)
+            elif spec.backend == 'boost':
+                hist.fill(*[_values(column) for column in spec.columns], weight=weights)
+            else:
+                spec.fill(hist, *[blocks[column] for column in spec.columns], weights=blocks[spec.weights] if spec.weights else None)
+
+    def write(self) -> None:
+
+        for name, sums in self._sums.items():
+            sums.write(self._histograms[name])
+
+def _fill(hist, *data, n_workers: int = None, weights=None) -> None:
+
+    _fill_numpy(hist, *data, weights=weights, n_workers=1 if n_workers is None else n_workers)
+
 def build_TH1(data, axis_spec_x: AxisSpec, **kwargs) -> TH1F:
     '''
         Build a histogram with one axis
@@ -35,6 +639,8 @@ def build_TH1(data, axis_spec_x: AxisSpec, **kwargs) -> TH1F:
         Args:
             data (pd.Series): The data to be histogrammed
             axis_spec_x (AxisSpec): The specification for the x-axis
+            weights (pd.Series or np.ndarray, optional): The weight of each entry. Sumw2 is activated as in TH1::Fill
+            n_workers (int, optional): Number of threads of a partitioned fill. 0 uses all the cores, None (default) fills on the calling thread
 
         Returns:
             TH1F: The histogram
@@ -42,12 +648,8 @@ def build_TH1(data, axis_spec_x: AxisSpec, **kwargs) -> TH1F:
 
     name = kwargs.get('name', axis_spec_x.name)
     title = kwargs.get('title', axis_spec_x.title)
-    hist = TH1F(name, title, axis_spec_x.nbins, axis_spec_x.xmin, axis_spec_x.xmax)
-    
-    arr_x = np.ascontiguousarray(data, dtype=np.float64)
-    arr_w = np.ones(len(data), dtype=np.float64)
-    
-    hist.FillN(len(arr_x), arr_x, arr_w)
+    hist = TH1F(name, title, *_root_axis_args(axis_spec_x))
+    _fill(hist, data, n_workers=kwargs.get('n_workers', None), weights=kwargs.get('weights', None))
     return hist
 
 def build_TH2(data_x, data_y, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec, **kwargs) -> TH2F:
@@ -59,6 +661,8 @@ def build_TH2(data_x, data_y, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec, **kw
             data_y (pd.Series): The data to be histogrammed on the y-axis
             axis_spec_x (AxisSpec): The specification for the x-axis
             axis_spec_y (AxisSpec): The specification for the y-axis
+            weights (pd.Series or np.ndarray, optional): The weight of each entry. Sumw2 is activated as in TH1::Fill
+            n_workers (int, optional): Number of threads of a partitioned fill. 0 uses all the cores, None (default) fills on the calling thread
 
         Returns:
             TH1F: The histogram
@@ -66,29 +670,23 @@ def build_TH2(data_x, data_y, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec, **kw
 
     name = kwargs.get('name', axis_spec_x.name + '_' + axis_spec_y.name)
     title = kwargs.get('title', axis_spec_x.title + ';' + axis_spec_y.title)
-    hist = TH2F(name, title, axis_spec_x.nbins, axis_spec_x.xmin, axis_spec_x.xmax, axis_spec_y.nbins, axis_spec_y.xmin, axis_spec_y.xmax)
-    
-    arr_x = np.ascontiguousarray(data_x, dtype=np.float64)
-    arr_y = np.ascontiguousarray(data_y, dtype=np.float64)
-    arr_w = np.ones(len(data_x), dtype=np.float64)
-    
-    hist.FillN(len(arr_x), arr_x, arr_y, arr_w)
+    hist = TH2F(name, title, *_root_axis_args(axis_spec_x), *_root_axis_args(axis_spec_y))
+    _fill(hist, data_x, data_y, n_workers=kwargs.get('n_workers', None), weights=kwargs.get('weights', None))
     return hist
 
-def fill_TH1(data, hist: TH1F):
+def fill_TH1(data, hist: TH1F, n_workers: int = None, weights=None):
     '''
         Fill a histogram with data
 
         Args:
             data (pd.Series): The data to fill the histogram with
             hist (TH1F): The histogram to fill
+            n_workers (int, optional): Number of threads of a partitioned fill (see build_TH1)
+            weights (pd.Series or np.ndarray, optional): The weight of each entry
     '''
+    _fill(hist, data, n_workers=n_workers, weights=weights)
     
-    arr_x = np.ascontiguousarray(data, dtype=np.float64)
-    arr_w = np.ones(len(data), dtype=np.float64)
-    hist.FillN(len(arr_x), arr_x, arr_w)
-    
-def fill_TH2(data_x, data_y, hist: TH2F):
+def fill_TH2(data_x, data_y, hist: TH2F, n_workers: int = None, weights=None):
     '''
         Fill a 2D histogram with data
 
@@ -96,41 +694,165 @@ def fill_TH2(data_x, data_y, hist: TH2F):
             data_x (pd.Series): The data to fill the x-axis of the histogram with
             data_y (pd.Series): The data to fill the y-axis of the histogram with
             hist (TH2F): The histogram to fill
+            n_workers (int, optional): Number of threads of a partitioned fill (see build_TH1)
+            weights (pd.Series or np.ndarray, optional): The weight of each entry
     '''
-    arr_x = np.ascontiguousarray(data_x, dtype=np.float64)
-    arr_y = np.ascontiguousarray(data_y, dtype=np.float64)
-    arr_w = np.ones(len(data_x), dtype=np.float64)
-    
-    hist.FillN(len(arr_x), arr_x, arr_y, arr_w)
+    _fill(hist, data_x, data_y, n_workers=n_workers, weights=weights)
 
-def build_boost1(data, axis_spec_x: AxisSpec) -> bh.Histogram:
+def _boost_storage(weights, storage):
+
+    if storage is not None:
+        return storage
+    return bh.storage.Double() if weights is None else bh.storage.Weight()
+
+def build_boost1(data, axis_spec_x: AxisSpec, weights=None, storage=None) -> bh.Histogram:
     '''
         Build a histogram with one axis
 
         Args:
             data (pd.Series): The data to be histogrammed
             axis_spec_x (AxisSpec): The specification for the x-axis
+            weights (pd.Series or np.ndarray, optional): The weight of each entry
+            storage (bh.storage.Storage, optional): The storage of the histogram. Defaults to Weight() (sum of weights
+                and of squared weights) if weights are given, Double() otherwise
 
         Returns:
             TH1F: The histogram
     '''
 
-    hist = bh.Histogram(
-        bh.axis.Regular(axis_spec_x.nbins, axis_spec_x.xmin, axis_spec_x.xmax,
-                        metadata=axis_spec_x.title)
-    )
-    hist.fill(data)
+    hist = bh.Histogram(_boost_axis(axis_spec_x), storage=_boost_storage(weights, storage))
+    hist.fill(as_array(data), weight=None if weights is None else as_array(weights))
     return hist
 
-def build_boost2(data_x, data_y, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec) -> bh.Histogram:
+def build_boost2(data_x, data_y, axis_spec_x: AxisSpec, axis_spec_y: AxisSpec, weights=None, storage=None) -> bh.Histogram:
 
-    hist = bh.Histogram(
-        bh.axis.Regular(axis_spec_x.nbins, axis_spec_x.xmin, axis_spec_x.xmax,
-                        metadata=axis_spec_x.title),
-        bh.axis.Regular(axis_spec_y.nbins, axis_spec_y.xmin, axis_spec_y.xmax,
-                        metadata=axis_spec_y.title)
-    )
-    hist.fill(data_x, data_y)
+    hist = bh.Histogram(_boost_axis(axis_spec_x), _boost_axis(axis_spec_y), storage=_boost_storage(weights, storage))
+    hist.fill(as_array(data_x), as_array(data_y), weight=None if weights is None else as_array(weights))
+    return hist
+
+def _spec_binning(axis_spec: AxisSpec) -> tuple:
+
+    return axis_spec.nbins, axis_spec.xmin, axis_spec.xmax, axis_spec.bin_edges if axis_spec.is_variable else None
+
+def _fill_cells(arrays: list, weights, axis_specs: list) -> tuple:
+    '''
+        Bin N columns into the cells of an N-dimensional histogram. The per-axis bin indices (ROOT convention,
+        0 and nbins+1 being the under/overflow) are flattened in C order into a single cell index, so that the
+        cells follow the layout of a boost view(flow=True). Small histograms are summed with np.bincount on a dense
+        array, large ones block by block with np.unique, so that memory scales with the number of filled cells.
+
+        Returns:
+            shape (tuple): Number of cells per axis, flow bins included
+            cells (np.ndarray): Sorted flat indices of the filled cells
+            sumw (np.ndarray): Sum of weights (entries without weights) per filled cell
+            sumw2 (np.ndarray): Sum of squared weights per filled cell (equal to sumw without weights)
+    '''
+    binnings = [_spec_binning(axis_spec) for axis_spec in axis_specs]
+    shape = tuple(binning[0] + 2 for binning in binnings)
+    ncells = int(np.prod(shape, dtype=object))
+    if ncells > np.iinfo(np.int64).max:
+        raise ValueError(f'Too many cells ({ncells}) to index the histogram')
+    weighted = weights is not None
+    dense = ncells <= THN_DENSE_MAX_CELLS
+    nentries = len(arrays[0])
+    if dense:
+        sumw = np.zeros(ncells, dtype=np.float64)
+        sumw2 = np.zeros(ncells, dtype=np.float64) if weighted else sumw
+    else:
+        partial_cells, partial_sumw, partial_sumw2 = [], [], []
+
+    buffers = _BinningBuffers(len(arrays), max(1, min(FILL_BLOCK_SIZE, nentries)), weighted)
+    for block_start in range(0, nentries, FILL_BLOCK_SIZE):
+        block_stop = min(block_start + FILL_BLOCK_SIZE, nentries)
+        size = block_stop - block_start
+        scratch, flags = buffers.scratch[:size], buffers.flags[:size]
+        cell = buffers.index[0][:size]
+        for iaxis, (arr, binning) in enumerate(zip(arrays, binnings)):
+            block = buffers.values[iaxis][:size]
+            np.copyto(block, arr[block_start:block_stop], casting='unsafe')
+            index = _bin_index(block, binning, buffers.index[iaxis][:size], scratch, flags)
+            if iaxis > 0:
+                cell *= shape[iaxis]
+                cell += index
+        if weighted:
+            w = buffers.weights[:size]
+            np.copyto(w, weights[block_start:block_stop], casting='unsafe')
+            np.multiply(w, w, out=scratch)
+
+        if dense:
+            sumw += np.bincount(cell, weights=w if weighted else None, minlength=ncells)
+            if weighted:
+                sumw2 += np.bincount(cell, weights=scratch, minlength=ncells)
+            continue
+        block_cells, inverse = np.unique(cell, return_inverse=True)
+        partial_cells.append(block_cells)
+        partial_sumw.append(np.bincount(inverse, weights=w if weighted else None).astype(np.float64))
+        if weighted:
+            partial_sumw2.append(np.bincount(inverse, weights=scratch))
+
+    if dense:
+        cells = np.flatnonzero((sumw != 0) | (sumw2 != 0))
+        return shape, cells, sumw[cells], sumw2[cells]
+    if not partial_cells:
+        return shape, np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    cells, inverse = np.unique(np.concatenate(partial_cells), return_inverse=True)
+    sumw = np.bincount(inverse, weights=np.concatenate(partial_sumw))
+    sumw2 = np.bincount(inverse, weights=np.concatenate(partial_sumw2)) if weighted else sumw
+    return shape, cells, sumw, sumw2
+
+def build_THn(data: list, axis_specs: list, weights=None, backend: str = 'boost', **kwargs):
+    '''
+        Build a histogram with N axes
+
+        Args:
+            data (list): The data to be histogrammed, one pd.Series or np.ndarray per axis
+            axis_specs (list): The specification of each axis (AxisSpec)
+            weights (pd.Series or np.ndarray, optional): The weight of each entry
+            backend (str): 'boost' for a dense boost histogram (Weight() storage with weights, Double() otherwise),
+                'root' for a THnSparseD, which only stores the filled bins
+
+        Returns:
+            bh.Histogram or THnSparseD: The histogram
+    '''
+    if len(data) != len(axis_specs):
+        raise ValueError(f'{len(data)} columns were given for {len(axis_specs)} axes')
+    if backend not in ('root', 'boost'):
+        raise ValueError('backend must be either root or boost')
+    arrays = [as_array(arr) for arr in data]
+    weights = None if weights is None else as_array(weights)
+    shape, cells, sumw, sumw2 = _fill_cells(arrays, weights, axis_specs)
+
+    if backend == 'boost':
+        hist = bh.Histogram(*[_boost_axis(axis_spec) for axis_spec in axis_specs], storage=_boost_storage(weights, None))
+        view = hist.view(flow=True)
+        values = np.zeros(shape)
+        values.flat[cells] = sumw
+        if weights is None:
+            view[...] = values
+            return hist
+        variances = np.zeros(shape)
+        variances.flat[cells] = sumw2
+        view['value'] = values
+        view['variance'] = variances
+        return hist
+
+    name = kwargs.get('name', '_'.join(axis_spec.name for axis_spec in axis_specs))
+    title = kwargs.get('title', ';'.join(axis_spec.title for axis_spec in axis_specs))
+    hist = THnSparseD(name, title, len(axis_specs), np.array([axis_spec.nbins for axis_spec in axis_specs], dtype=np.int32),
+                      np.array([axis_spec.xmin for axis_spec in axis_specs], dtype=np.float64),
+                      np.array([axis_spec.xmax for axis_spec in axis_specs], dtype=np.float64))
+    for iaxis, axis_spec in enumerate(axis_specs):
+        if axis_spec.is_variable:
+            hist.GetAxis(iaxis).Set(axis_spec.nbins, axis_spec.bin_edges)
+    if weights is not None:
+        hist.Sumw2()
+    coordinates = np.stack(np.unravel_index(cells, shape), axis=1).astype(np.int32)
+    for coordinate, content, error2 in zip(coordinates, sumw, sumw2):
+        ibin = hist.GetBin(coordinate)
+        hist.SetBinContent(ibin, content)
+        if weights is not None:
+            hist.SetBinError2(ibin, error2)
+    hist.SetEntries(len(arrays[0]))
     return hist
 
 @singledispatch
@@ -173,33 +895,87 @@ def _(hist_file_path: str, hist_name: str) -> TH1F:
     hist_file.Close()
     return hist
 
-def build_efficiency(hist_tot: TH1F, hist_sel: TH1F, name: str = None, xtitle: str = None, ytitle: str = 'Efficiency') -> TH1F:
+def _boost_values(hist: bh.Histogram) -> np.ndarray:
+
+    view = hist.view()
+    return view['value'] if view.dtype.names else view
+
+def _sparse_bins(hist) -> tuple:
+    '''
+        Coordinates and contents of the filled bins of a THnSparse, read one bin at a time.
     '''
-        Compute the efficiency of a selection
+    nbins = hist.GetNbins()
+    coordinate = np.zeros(hist.GetNdimensions(), dtype=np.int32)
+    coordinates = np.empty((nbins, len(coordinate)), dtype=np.int32)
+    contents = np.empty(nbins)
+    for ibin in range(nbins):
+        contents[ibin] = hist.GetBinContent(ibin, coordinate)
+        coordinates[ibin] = coordinate
+    return coordinates, contents
+
+def build_efficiency(hist_tot, hist_sel, name: str = None, xtitle: str = None, ytitle: str = 'Efficiency',
+                     method: str = 'binomial', cl: float = ONE_SIGMA):
+    '''
+        Compute the efficiency of a selection in each bin, on whole arrays of bin contents.
+        The efficiency histogram is a copy of the total one, so that the dimension and the (variable) binning are kept.
+        The error of each bin is the half width of the interval. The asymmetric bounds can be computed with
+        efficiency_interval(hist_values(hist_sel), hist_values(hist_tot), method).
+        TH1/TH2/TH3 and boost histograms are read and written as whole arrays. THnSparse histograms are read and
+        written one filled bin at a time, so they are only suited to sparse data; dense N-dimensional histograms
+        should be boost histograms (see build_THn).
 
         Args:
-            hist_tot, hist_sel (TH1F): The total and selected histograms (denominator, numerator)
+            hist_tot, hist_sel (TH1, TH2, TH3, THnSparse or bh.Histogram): The total and selected histograms (denominator, numerator)
             name (str): The name of the efficiency plot
-            xtitle (str): The x-axis title
-            ytitle (str): The y-axis title
+            xtitle (str): The x-axis title (1D histograms)
+            ytitle (str): The title of the efficiency axis
+            method (str): The interval, 'binomial' (default), 'wilson', 'clopper_pearson' or 'bayesian' (see efficiency_interval)
+            cl (float): The confidence level of the interval (1 sigma by default)
 
         Returns:
-            TH1F: The efficiency histogram
+            The efficiency histogram, of the same type as hist_tot
     '''
+    if isinstance(hist_tot, bh.Histogram):
+        eff, low, up = efficiency_interval(_boost_values(hist_sel), _boost_values(hist_tot), method, cl)
+        hist_eff = bh.Histogram(*hist_tot.axes, storage=bh.storage.Weight())
+        view = hist_eff.view()
+        view['value'] = eff
+        view['variance'] = (0.5 * (up - low))**2
+        return hist_eff
+
+    if hist_tot.InheritsFrom('THnBase') and not hist_tot.InheritsFrom('THnSparse'):
+        raise ValueError(f'Dense THn {hist_tot.GetName()} is not supported, use a THnSparse or a boost histogram')
     if name is None:
         name = hist_sel.GetName() + "_eff"
-    if xtitle is None:
-        xtitle = hist_sel.GetXaxis().GetTitle()
-    hist_eff = TH1F(name, f'{name}; f{xtitle} ; f{ytitle}', hist_tot.GetNbinsX(), hist_tot.GetXaxis().GetXmin(), hist_tot.GetXaxis().GetXmax())
-    for xbin in range(1, hist_tot.GetNbinsX()+1):
-            if hist_tot.GetBinContent(xbin) > 0:
-                eff = hist_sel.GetBinContent(xbin)/hist_tot.GetBinContent(xbin)
-                if eff <= 1:
-                    eff_err = np.sqrt(eff * (1 - eff) / hist_tot.GetBinContent(xbin))
-                    hist_eff.SetBinError(xbin, eff_err)
-                else:
-                    hist_eff.SetBinError(xbin, 0)
-                hist_eff.SetBinContent(xbin, eff)
+    hist_eff = hist_tot.Clone(name)
+    hist_eff.Reset()
+
+    if hist_tot.InheritsFrom('THnSparse'):
+        hist_eff.SetTitle(name)
+        coordinates, total = _sparse_bins(hist_tot)
+        selected = np.array([hist_sel.GetBinContent(coordinate) for coordinate in coordinates])
+        eff, low, up = efficiency_interval(selected, total, method, cl)
+        hist_eff.Sumw2()
+        for coordinate, content, error in zip(coordinates[total > 0], eff[total > 0], 0.5 * (up - low)[total > 0]):
+            ibin = hist_eff.GetBin(coordinate)
+            hist_eff.SetBinContent(ibin, content)
+            hist_eff.SetBinError2(ibin, error * error)
+        hist_eff.SetEntries(np.count_nonzero(total > 0))
+        return hist_eff
+
+    if hist_tot.GetDimension() == 1:
+        if xtitle is None:
+            xtitle = hist_sel.GetXaxis().GetTitle()
+        hist_eff.SetTitle(f'{name};{xtitle};{ytitle}')
+    else:
+        hist_eff.SetTitle(name)
+        if hist_tot.GetDimension() == 2:
+            hist_eff.GetZaxis().SetTitle(ytitle)
+    total = hist_values(hist_tot)
+    eff, low, up = efficiency_interval(hist_values(hist_sel), total, method, cl)
+    error = 0.5 * (up - low)
+    # as with SetBinContent/SetBinError, each filled bin counts as one entry and Sumw2 is activated
+    numpy_to_hist(hist_eff, eff, error * error, entries=np.count_nonzero(total > 0))
     return hist_eff
 
 def normalize_hist(hist: TH1F, low_edge: float = None, high_edge: float = None, option: str = '') -> None:
@@ -243,15 +1019,214 @@ def project_hist(hist2D: TH2F, min_int: float, max_int: float, name: str = None,
         raise ValueError('var_to_project must be either X or Y')
     return hist
     
+@dataclass
+class SliceProjections:
+    '''
+        Projections of a 2D histogram in slices of the other axis, stored as arrays with one row per slice.
+        TH1 objects are only created on demand, with to_th1.
+    '''
+
+    values: np.ndarray
+    variances: np.ndarray
+    edges: np.ndarray
+    slice_bins: np.ndarray
+    slice_edges: np.ndarray
+    entries: np.ndarray
+    name: str = ''
+    title: str = ''
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def errors(self) -> np.ndarray:
+        return np.sqrt(self.variances)
+
+    @property
+    def centers(self) -> np.ndarray:
+        return self.edges[:-1] + 0.5 * np.diff(self.edges)
+
+    def integral(self) -> np.ndarray:
+        '''
+            Sum of the contents of each projection, flow bins excluded.
+        '''
+        return self.values[:, 1:-1].sum(axis=1)
+
+    def mean(self) -> np.ndarray:
+        '''
+            Mean of each projection from the bin centers, 0 for empty projections (as get_mean).
+        '''
+        integral = self.integral()
+        return np.divide(self.values[:, 1:-1] @ self.centers, integral, out=np.zeros(len(self)), where=integral > 0)
+
+    def rms(self) -> np.ndarray:
+        '''
+            RMS of each projection from the bin centers, 0 for empty projections (as get_rms).
+        '''
+        integral = self.integral()
+        mean2 = np.divide(self.values[:, 1:-1] @ self.centers**2, integral, out=np.zeros(len(self)), where=integral > 0)
+        return np.sqrt(np.maximum(mean2 - self.mean()**2, 0.))
+
+    def to_th1(self, islice: int, name: str = None):
+        '''
+            Build the TH1D of a projection. The histogram is not attached to the current directory.
+        '''
+        if name is None:
+            name = f'{self.name}_{islice}'
+        hist = TH1D(name, self.title, len(self.edges) - 1, self.edges)
+        hist.SetDirectory(0)
+        numpy_to_hist(hist, self.values[islice], self.variances[islice], flow=True, entries=self.entries[islice])
+        return hist
+
+def project_slices(hist2D: TH2F, slices: list = None, var_to_project: str = 'Y', name: str = None) -> SliceProjections:
+    '''
+        Project a 2D histogram in slices of the other axis, all at once from the histogram buffer.
+        Each slice sums a range of bins, as ProjectionX/ProjectionY with the 'e' option do (errors from Sumw2 if active).
+
+        Args:
+            hist2D (TH2F): The 2D histogram to project
+            slices (list, optional): The (min, max) ranges of the slices, with the bins selected as in project_hist.
+                Ranges can span several bins to merge them. Defaults to one slice per bin
+            var_to_project (str): The variable to project
+            name (str): The prefix of the name of the projections built with to_th1
+
+        Returns:
+            SliceProjections: The contents and variances of the projections (flow bins included), with shape (n_slices, n_bins + 2)
+
+        Example:
+            projections = project_slices(h2_nsigma_pt, [(0.5, 1.), (1., 2.), (2., 4.)])
+            means, rms = projections.mean(), projections.rms()
+            h_slice = projections.to_th1(0)
+    '''
+    if var_to_project not in ('X', 'Y'):
+        raise ValueError('var_to_project must be either X or Y')
+    if name is None:
+        name = hist2D.GetName() + f'_proj_{var_to_project}'
+    values = hist_values(hist2D, flow=True).astype(np.float64)
+    variances = hist_variances(hist2D, flow=True)
+    slice_axis, projected_axis = hist2D.GetXaxis(), hist2D.GetYaxis()
+    if var_to_project == 'X':
+        values, variances = values.T, variances.T
+        slice_axis, projected_axis = projected_axis, slice_axis
+
+    if slices is None:
+        first = np.arange(1, slice_axis.GetNbins() + 1)
+        last = first
+    else:
+        first = np.array([slice_axis.FindBin(low) for low, _ in slices], dtype=np.intp)
+        last = np.array([slice_axis.FindBin(high) for _, high in slices], dtype=np.intp)
+    # selection matrix of the bins summed in each slice
+    bins = np.arange(slice_axis.GetNbins() + 2)
+    selection = ((bins >= first[:, None]) & (bins <= last[:, None])).astype(np.float64)
+
+    projected_values = selection @ values
+    slice_edges = np.concatenate([[-np.inf], axis_edges(slice_axis), [np.inf]])
+    return SliceProjections(
+        values=projected_values,
+        variances=selection @ variances,
+        edges=axis_edges(projected_axis),
+        slice_bins=np.stack([first, last], axis=1),
+        slice_edges=np.stack([slice_edges[first], slice_edges[last + 1]], axis=1),
+        entries=projected_values.sum(axis=1),
+        name=name,
+        title=hist2D.GetTitle(),
+    )
+
+def _transfer_matrix(source_edges, target_edges, func=None) -> np.ndarray:
+    '''
+        Fraction of the content of each source bin falling in each target bin, once the source edges are mapped
+        with func, assuming a uniform density within each source bin. Rows (source) and columns (target) include
+        the under/overflow bins: the content mapped outside of the target range goes to the target under/overflow.
+    '''
+    edges = np.asarray(source_edges, dtype=np.float64)
+    if func is not None:
+        edges = np.asarray(func(edges), dtype=np.float64)
+    decreasing = edges[-1] < edges[0]
+    if decreasing:
+        edges = edges[::-1]
+    if not np.all(np.isfinite(edges)) or np.any(np.diff(edges) < 0):
+        raise ValueError('The axis transform must be monotonic and finite on the source bin edges')
+    target_edges = np.asarray(target_edges, dtype=np.float64)
+    nsource, ntarget = len(edges) - 1, len(target_edges) - 1
+
+    bounds = np.concatenate([[-np.inf], target_edges, [np.inf]])
+    overlap = np.minimum(edges[1:, None], bounds[None, 1:]) - np.maximum(edges[:-1, None], bounds[None, :-1])
+    np.clip(overlap, 0., None, out=overlap)
+    widths = np.diff(edges)
+    fractions = np.zeros((nsource, ntarget + 2))
+    np.divide(overlap, widths[:, None], out=fractions, where=widths[:, None] > 0)
+    # bins collapsed to a point by the transform move as a whole to the target bin of that point
+    collapsed = np.flatnonzero(widths == 0)
+    fractions[collapsed, np.searchsorted(target_edges, edges[collapsed], side='right')] = 1.
+
+    matrix = np.zeros((nsource + 2, ntarget + 2))
+    matrix[1:-1] = fractions[::-1] if decreasing else fractions
+    matrix[0, -1 if decreasing else 0] = 1.
+    matrix[-1, 0 if decreasing else -1] = 1.
+    return matrix
+
+def transform_arrays(values, variances, source_edges, target_edges, func=None) -> tuple:
+    '''
+        Map bin contents to a new axis: the source edges are transformed with func (a monotonic function, e.g.
+        p -> beta*gamma, or None to rebin only) and the content of each source bin is shared among the target bins
+        it overlaps, proportionally to the overlap. Contents sum up and variances are propagated linearly
+        (the fraction f of a bin contributes f^2 of its variance).
+
+        Args:
+            values, variances (np.ndarray): The bin contents and variances, under/overflow included, with shape
+                (..., nbins + 2): a batch of histograms is transformed at once
+            source_edges, target_edges (np.ndarray): The bin edges of the source and target axes
+
+        Returns:
+            tuple: The contents and variances on the target axis, with shape (..., ntarget + 2)
+    '''
+    matrix = _transfer_matrix(source_edges, target_edges, func)
+    return np.asarray(values, dtype=np.float64) @ matrix, np.asarray(variances, dtype=np.float64) @ (matrix * matrix)
+
+def transform_hist(hists, axis_spec: AxisSpec, func=None, name=None):
+    '''
+        Transform the x-axis of one or more 1D histograms and rebin them to a new axis (see transform_arrays).
+        All the histograms of a batch must share the same binning, and are transformed with a single product of matrices.
+
+        Args:
+            hists (TH1 or list): The histogram, or a list of histograms
+            axis_spec (AxisSpec): The target axis (fixed or variable bins)
+            func (callable, optional): The monotonic transform of the axis, applied to numpy arrays. None to rebin only
+            name (str or list): The name of the new histogram (a list for a batch). Defaults to <name>_transformed
+
+        Returns:
+            TH1F or list: The transformed histogram(s)
+    '''
+    single = not isinstance(hists, (list, tuple))
+    hists = [hists] if single else list(hists)
+    names = [name] if single else name
+    if names is None or names == [None]:
+        names = [f'{hist.GetName()}_transformed' for hist in hists]
+    source_edges = axis_edges(hists[0].GetXaxis())
+    for hist in hists[1:]:
+        if not np.array_equal(axis_edges(hist.GetXaxis()), source_edges):
+            raise ValueError(f'{hist.GetName()} does not have the same binning as {hists[0].GetName()}')
+
+    values = np.stack([hist_values(hist, flow=True) for hist in hists])
+    variances = np.stack([hist_variances(hist, flow=True) for hist in hists])
+    values, variances = transform_arrays(values, variances, source_edges, axis_spec.bin_edges, func)
+    new_hists = []
+    for hist, new_name, new_values, new_variances in zip(hists, names, values, variances):
+        new_hist = TH1F(new_name, hist.GetTitle(), *_root_axis_args(axis_spec))
+        numpy_to_hist(new_hist, new_values, new_variances, flow=True, entries=hist.GetEntries())
+        new_hists.append(new_hist)
+    return new_hists[0] if single else new_hists
+
 def scale_hist_axis(old_hist: TH1F, scale_factor: float, **kwargs) -> TH1F | None:
     '''
-        Return a histogram with scaled axis
+        Return a histogram with scaled axis. The content of each bin is shared among the bins of the new axis
+        that it overlaps (see transform_hist), so bins falling in the same new bin are summed.
         
         Args:
             old_hist (TH1F): The histogram to scale
             scale_factor (float): The factor by which the axis is divided
         Kwargs:
-            xmin, xmax (float): The low and high edges in which the histogram is scaled
+            xmin, xmax (float): The low and high edges of the new axis
             inplace (bool): If True, the scaling is done in place
             name (str): The name of the new histogram
             title (str): The title of the new histogram
@@ -266,23 +1241,23 @@ def scale_hist_axis(old_hist: TH1F, scale_factor: float, **kwargs) -> TH1F | Non
     nbins = kwargs.get('nbins', old_hist.GetNbinsX())
     xmin = kwargs.get('xmin', old_hist.GetXaxis().GetXmin())
     xmax = kwargs.get('xmax', old_hist.GetXaxis().GetXmax())
-    new_hist = TH1F(kwargs.get('name', f'{old_hist.GetName()}_scaled'), kwargs.get('title', old_hist.GetTitle()), nbins, xmin, xmax)
+    name = kwargs.get('name', f'{old_hist.GetName()}_scaled')
+    new_hist = transform_hist(old_hist, AxisSpec(nbins, xmin, xmax), lambda x: x / scale_factor, name=name)
+
+    inplace = kwargs.get('inplace', False)
+    if inplace:
+        old_hist.SetBins(nbins, xmin, xmax)
+        numpy_to_hist(old_hist, hist_values(new_hist, flow=True), hist_variances(new_hist, flow=True), flow=True)
+        # SetBins keeps the statistics of the old axis: recompute them from the new bin contents
+        old_hist.ResetStats()
+        old_hist.SetEntries(new_hist.GetEntries())
+        old_hist.SetName(name)
+        new_hist = old_hist
+    new_hist.SetTitle(kwargs.get('title', old_hist.GetTitle()))
     if 'xtitle' in kwargs:
         new_hist.GetXaxis().SetTitle(kwargs.get('xtitle'))
     new_hist.GetYaxis().SetTitle(kwargs.get('ytitle', 'Counts (a.u.)'))
-
-    for ibin in range(old_hist.FindBin(xmin),old_hist.FindBin(xmax)):
-        bin_center = (old_hist.GetXaxis().GetBinCenter(ibin)) / scale_factor
-        bin_content = old_hist.GetBinContent(ibin)
-        bin_index=new_hist.FindBin(bin_center)
-        new_hist.SetBinContent(bin_index, bin_content)
-        new_hist.SetBinError(bin_index, old_hist.GetBinError(ibin))
-    
-    if kwargs.get('inplace', False):
-        old_hist.Clone(new_hist)
-        del new_hist
-        old_hist.SetName(kwargs.get('name', f'{old_hist.GetName()}_scaled'))
-    else:
+    if not inplace:
         return new_hist
     
 def get_mean(hist: TH1F, low_edge: float = None, high_edge: float = None) -> float:
@@ -301,11 +1276,10 @@ def get_mean(hist: TH1F, low_edge: float = None, high_edge: float = None) -> flo
         low_edge = hist.GetXaxis().GetXmin()
     if high_edge is None:
         high_edge = hist.GetXaxis().GetXmax()
-    total_content = 0
-    total_value = 0
-    for ibin in range(hist.FindBin(low_edge), hist.FindBin(high_edge)):
-        total_content += hist.GetBinContent(ibin)
-        total_value += hist.GetBinContent(ibin) * hist.GetBinCenter(ibin)
+    bins = slice(hist.FindBin(low_edge), hist.FindBin(high_edge))
+    contents = hist_values(hist, flow=True)[bins].astype(np.float64)
+    total_content = contents.sum()
+    total_value = np.dot(contents, axis_centers(hist.GetXaxis(), flow=True)[bins])
     if total_content > 0:
         return total_value / total_content
     else:
@@ -327,13 +1301,12 @@ def get_rms(hist: TH1F, low_edge: float = None, high_edge: float = None) -> floa
         low_edge = hist.GetXaxis().GetXmin()
     if high_edge is None:
         high_edge = hist.GetXaxis().GetXmax()
-    total_content = 0
-    total_value = 0
-    total_value2 = 0
-    for ibin in range(hist.FindBin(low_edge), hist.FindBin(high_edge)):
-        total_content += hist.GetBinContent(ibin)
-        total_value += hist.GetBinContent(ibin) * hist.GetBinCenter(ibin)
-        total_value2 += hist.GetBinContent(ibin) * hist.GetBinCenter(ibin) * hist.GetBinCenter(ibin)
+    bins = slice(hist.FindBin(low_edge), hist.FindBin(high_edge))
+    contents = hist_values(hist, flow=True)[bins].astype(np.float64)
+    centers = axis_centers(hist.GetXaxis(), flow=True)[bins]
+    total_content = contents.sum()
+    total_value = np.dot(contents, centers)
+    total_value2 = np.dot(contents * centers, centers)
     if total_content > 0:
         return np.sqrt(total_value2 / total_content - (total_value / total_content) ** 2)
     else:
@@ -353,10 +1326,10 @@ def hist_to_graph(hist: TH1F, name: str = None, xtitle: str = None, ytitle: str
             TGraphErrors: The graph with errors
     '''
     
-    graph = TGraphErrors(hist.GetNbinsX())
-    for ibin in range(1, hist.GetNbinsX() + 1):
-        graph.SetPoint(ibin - 1, hist.GetXaxis().GetBinCenter(ibin), hist.GetBinContent(ibin))
-        graph.SetPointError(ibin - 1, 0, hist.GetBinError(ibin))
+    npoints = hist.GetNbinsX()
+    values = np.ascontiguousarray(hist_values(hist), dtype=np.float64)
+    errors = np.sqrt(hist_variances(hist))
+    graph = TGraphErrors(npoints, axis_centers(hist.GetXaxis()), values, np.zeros(npoints), errors)
     if name is not None:
         graph.SetName(name)
     if xtitle is not None:
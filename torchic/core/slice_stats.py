@@ -0,0 +1,156 @@
+'''
+    Moments and quantiles of y in slices of x, computed for all the slices at once,
+    either from a 2D histogram or from the raw columns.
+'''
+
+import numpy as np
+import pandas as pd
+
+from torchic.core.histogram import AxisSpec, as_array, project_slices
+
+def _segment_stats(y: np.ndarray, w: np.ndarray, counts: np.ndarray, quantiles: tuple, truncation: tuple,
+                   w2: np.ndarray = None, low_edges: np.ndarray = None, widths: np.ndarray = None) -> dict:
+    '''
+        Weighted statistics of consecutive segments of entries, each sorted by y.
+        Quantiles invert the cumulative weight of the segment. For binned data (low_edges and widths given),
+        they are interpolated linearly within the bin, as TH1::GetQuantiles does: a quantile reached exactly at the
+        upper edge of a bin followed by empty bins is interpolated in the next non-empty bin, i.e. at its low edge.
+
+        Args:
+            y, w (np.ndarray): The values and (non-negative) weights of the entries, grouped by segment
+            counts (np.ndarray): The number of entries of each segment
+            quantiles (tuple): The quantiles to compute
+            truncation (tuple): The (low, high) fractions of the weight of the segment kept in the truncated mean
+            w2 (np.ndarray, optional): The variance of each weight, w*w by default
+
+        Returns:
+            dict: Arrays with one value per segment (NaN for empty segments)
+    '''
+    nsegments = len(counts)
+    segment = np.repeat(np.arange(nsegments), counts)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.intp)
+    sumw = np.bincount(segment, weights=w, minlength=nsegments)
+    sumwy = np.bincount(segment, weights=w * y, minlength=nsegments)
+    sumwy2 = np.bincount(segment, weights=w * y * y, minlength=nsegments)
+    sumw2 = np.bincount(segment, weights=w * w if w2 is None else w2, minlength=nsegments)
+    filled = sumw > 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(filled, sumwy / sumw, np.nan)
+        rms = np.sqrt(np.maximum(sumwy2 / sumw - mean**2, 0.))
+        n_effective = sumw**2 / sumw2
+        stats = {
+            'entries': sumw,
+            'mean': mean,
+            'mean_error': rms / np.sqrt(n_effective),
+            'rms': rms,
+            'rms_error': rms / np.sqrt(2. * n_effective),
+        }
+
+    cumulative = np.cumsum(w)
+    # cumulative weight before each entry, and before each segment
+    before = np.concatenate([[0.], cumulative])
+    segment_start = before[starts]
+    last = np.maximum(starts + counts - 1, 0)
+    for quantile in quantiles:
+        target = segment_start + quantile * sumw
+        index = np.clip(np.searchsorted(cumulative, target, side='left'), starts, last)
+        if low_edges is None:
+            values = y[index] if len(y) else np.zeros(nsegments)
+        else:
+            # on a tie with the cumulative weight, skip the empty bins that follow, unless the quantile
+            # is the whole weight of the segment (last non-empty bin)
+            after = np.searchsorted(cumulative, target, side='right')
+            index = np.where(after <= last, after, index)
+            fraction = np.divide(target - before[index], w[index], out=np.full(nsegments, 0.5), where=w[index] > 0)
+            values = low_edges[index] + fraction * widths[index]
+        stats[f'quantile_{quantile:g}'] = np.where(filled, values, np.nan)
+
+    # fraction of the weight of the segment below each entry
+    with np.errstate(divide='ignore', invalid='ignore'):
+        below = (before[:-1] - segment_start[segment]) / sumw[segment]
+    kept = w * ((below >= truncation[0]) & (below < truncation[1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats['truncated_mean'] = np.bincount(segment, weights=kept * y, minlength=nsegments) / np.bincount(segment, weights=kept, minlength=nsegments)
+    return stats
+
+def _stats_frame(x: np.ndarray, x_error: np.ndarray, stats: dict, drop_empty: bool) -> pd.DataFrame:
+
+    df = pd.DataFrame({'x': x, 'x_error': x_error, **stats})
+    if 'quantile_0.5' in df:
+        df['median'] = df['quantile_0.5']
+        # large sample approximation, exact for a normal distribution
+        df['median_error'] = np.sqrt(np.pi / 2.) * df['mean_error']
+    if drop_empty:
+        df = df[df['entries'] > 0].reset_index(drop=True)
+    return df
+
+def slice_stats_from_hist(hist2D, slices: list = None, var_to_project: str = 'Y', quantiles: tuple = (0.5,),
+                          truncation: tuple = (0.1, 0.9), drop_empty: bool = True) -> pd.DataFrame:
+    '''
+        Mean, RMS, quantiles and truncated mean of y in each slice of x of a 2D histogram (or of x in slices of y
+        with var_to_project='X'), from the bin contents of all the slices at once. Under/overflow bins of the
+        projected axis are not included.
+
+        Args:
+            hist2D (TH2): The 2D histogram
+            slices (list, optional): The (min, max) ranges of the slices (see project_slices). Defaults to one slice per bin
+            var_to_project (str): The variable whose distribution is described in each slice
+            quantiles (tuple): The quantiles to compute, as quantile_<q> columns (0.5 also gives median and median_error)
+            truncation (tuple): The (low, high) fractions of the slice content kept in the truncated mean
+            drop_empty (bool): Whether to drop the empty slices
+
+        Returns:
+            pd.DataFrame: One row per slice, with columns x, x_error, entries, mean, mean_error, rms, rms_error,
+                the quantiles and truncated_mean. It can be passed to create_graph, e.g. create_graph(df, 'x', 'mean', 'x_error', 'mean_error')
+
+        Example:
+            df = slice_stats_from_hist(h2_cluster_size_betagamma, quantiles=(0.5,), truncation=(0., 0.7))
+            graph = create_graph(df, 'x', 'truncated_mean', 'x_error', 'mean_error', name='g_cluster_size')
+    '''
+    projections = project_slices(hist2D, slices, var_to_project)
+    nslices, nbins = len(projections), len(projections.edges) - 1
+    widths = np.diff(projections.edges)
+    stats = _segment_stats(
+        np.tile(projections.centers, nslices),
+        projections.values[:, 1:-1].ravel(),
+        np.full(nslices, nbins),
+        quantiles,
+        truncation,
+        w2=projections.variances[:, 1:-1].ravel(),
+        low_edges=np.tile(projections.edges[:-1], nslices),
+        widths=np.tile(widths, nslices),
+    )
+    low, high = projections.slice_edges[:, 0], projections.slice_edges[:, 1]
+    return _stats_frame(0.5 * (low + high), 0.5 * (high - low), stats, drop_empty)
+
+def slice_stats_from_columns(data_x, data_y, axis_spec_x: AxisSpec, weights=None, quantiles: tuple = (0.5,),
+                             truncation: tuple = (0.1, 0.9), drop_empty: bool = True) -> pd.DataFrame:
+    '''
+        Mean, RMS, quantiles and truncated mean of y in each bin of x, from unbinned columns. The entries are
+        sorted once by (x bin, y) and each statistic is a segmented reduction over the sorted arrays.
+        Entries outside of the x axis range or with y = NaN are ignored.
+
+        Args:
+            data_x, data_y (pd.Series or np.ndarray): The columns
+            axis_spec_x (AxisSpec): The slices in x (fixed or variable bins)
+            weights (pd.Series or np.ndarray, optional): The (non-negative) weight of each entry
+            quantiles, truncation, drop_empty: see slice_stats_from_hist
+
+        Returns:
+            pd.DataFrame: One row per slice (see slice_stats_from_hist). Quantiles are values of y (inverse of the
+                weighted empirical distribution function, as numpy's 'inverted_cdf' method)
+    '''
+    x = np.asarray(as_array(data_x), dtype=np.float64)
+    y = np.asarray(as_array(data_y), dtype=np.float64)
+    w = np.ones(len(x)) if weights is None else np.asarray(as_array(weights), dtype=np.float64)
+    edges = axis_spec_x.bin_edges
+    # bin of each entry as in TAxis::FindBin, 1 to nbins in range
+    xbin = np.searchsorted(edges, x, side='right')
+    selected = (xbin >= 1) & (xbin <= axis_spec_x.nbins) & ~np.isnan(y)
+    xbin, y, w = xbin[selected] - 1, y[selected], w[selected]
+    order = np.lexsort((y, xbin))
+    xbin, y, w = xbin[order], y[order], w[order]
+
+    stats = _segment_stats(y, w, np.bincount(xbin, minlength=axis_spec_x.nbins), quantiles, truncation)
+    return _stats_frame(0.5 * (edges[:-1] + edges[1:]), 0.5 * np.diff(edges), stats, drop_empty)
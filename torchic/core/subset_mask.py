@@ -0,0 +1,113 @@
+'''
+    Row masks packed in bits, used to store and compose dataset subsets.
+'''
+
+import numpy as np
+
+from torchic.utils.terminal_colors import TerminalColors as tc
+
+_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+class SubsetMask:
+    '''
+        Boolean row mask packed with np.packbits: 1 bit per row, N/8 bytes per mask.
+        Masks are combined with &, |, ^ and ~ directly on the packed bytes.
+
+        Example:
+            positive = SubsetMask.from_bool(df['fSign'].to_numpy() > 0)
+            central = SubsetMask.from_bool(np.abs(df['fEta'].to_numpy()) < 0.5)
+            selected = positive & ~central
+            print(selected.count())
+    '''
+
+    __slots__ = ('_bits', '_size')
+
+    def __init__(self, bits: np.ndarray, size: int):
+        '''
+            Args:
+                bits (np.ndarray): The packed mask (uint8, big-endian bit order, zero padded)
+                size (int): The number of rows
+        '''
+        if len(bits) != (size + 7) // 8:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'{len(bits)} bytes cannot hold a mask of {size} rows.')
+        self._bits = bits
+        self._size = size
+
+    @classmethod
+    def from_bool(cls, mask) -> 'SubsetMask':
+        mask = np.asarray(mask, dtype=bool)
+        return cls(np.packbits(mask), len(mask))
+
+    @classmethod
+    def full(cls, size: int, value: bool = True) -> 'SubsetMask':
+        bits = np.full((size + 7) // 8, 0xFF if value else 0, dtype=np.uint8)
+        return cls(bits, size)._clear_padding()
+
+    @property
+    def bits(self) -> np.ndarray:
+        return self._bits
+
+    @property
+    def nbytes(self) -> int:
+        return self._bits.nbytes
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _clear_padding(self) -> 'SubsetMask':
+
+        tail = self._size % 8
+        if tail:
+            self._bits[-1] &= np.uint8((0xFF << (8 - tail)) & 0xFF)
+        return self
+
+    def _check(self, other: 'SubsetMask'):
+
+        if not isinstance(other, SubsetMask):
+            return NotImplemented
+        if other._size != self._size:
+            raise ValueError(tc.RED+'[ERROR]: '+tc.RESET+f'Masks of different sizes ({self._size}, {other._size}) cannot be combined.')
+
+    def __and__(self, other: 'SubsetMask') -> 'SubsetMask':
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return SubsetMask(np.bitwise_and(self._bits, other._bits), self._size)
+
+    def __or__(self, other: 'SubsetMask') -> 'SubsetMask':
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return SubsetMask(np.bitwise_or(self._bits, other._bits), self._size)
+
+    def __xor__(self, other: 'SubsetMask') -> 'SubsetMask':
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return SubsetMask(np.bitwise_xor(self._bits, other._bits), self._size)
+
+    def __invert__(self) -> 'SubsetMask':
+        return SubsetMask(np.invert(self._bits), self._size)._clear_padding()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SubsetMask):
+            return NotImplemented
+        return self._size == other._size and np.array_equal(self._bits, other._bits)
+
+    def count(self) -> int:
+        '''
+            Number of selected rows, from a byte-wise population count of the packed mask.
+        '''
+        return int(_POPCOUNT[self._bits].sum(dtype=np.int64))
+
+    def to_bool(self) -> np.ndarray:
+        '''
+            Unpacked boolean mask, one byte per row.
+        '''
+        return np.unpackbits(self._bits, count=self._size).view(bool)
+
+    def indices(self) -> np.ndarray:
+        '''
+            Positions of the selected rows.
+        '''
+        return np.flatnonzero(self.to_bool())
+
+    def __repr__(self) -> str:
+        return f'SubsetMask({self.count()}/{self._size} rows)'
@@ -1,11 +1,12 @@
 from torchic.utils.terminal_colors import TerminalColors
-from torchic.utils.timeit import timeit
+from torchic.utils.timeit import timeit, print_timing_summary
 from torchic.utils.root import set_root_object
 from torchic.utils import colors
 
 __all__ = [
     'TerminalColors',
     'timeit',
+    'print_timing_summary',
     'set_root_object',
     'colors'
 ]
\ No newline at end of file
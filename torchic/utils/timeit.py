@@ -12,4 +12,24 @@ def timeit(func):
         end = time.time()
         print(tc.GREEN+'[INFO]: '+tc.RESET+f'{func.__name__} took {(end - start):.2f} seconds')
         return result
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+def print_timing_summary(timings: dict, wall_time: float = None, n_slowest: int = 10):
+    '''
+        Print a summary of the time spent in a set of tasks
+
+        Args:
+            timings (dict): Elapsed time in seconds for each task
+            wall_time (float): Total wall-clock time, if known
+            n_slowest (int): Number of slowest tasks to list
+    '''
+    if not timings:
+        return
+    total = sum(timings.values())
+    message = f'{len(timings)} tasks, {total:.2f} seconds in total'
+    if wall_time is not None:
+        message += f' ({wall_time:.2f} seconds wall time)'
+    print(tc.GREEN+'[INFO]: '+tc.RESET+message)
+    slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:n_slowest]
+    for task, elapsed in slowest:
+        print(f'    {elapsed:8.2f} s  {task}')